@@ -1,2 +1,6 @@
-from hopeland_bot import create_app
-app = create_app()
+from hopeland_bot.config import RUNTIME
+if RUNTIME == "async":
+    from hopeland_bot.asgi import app  # ASGI; serve with uvicorn workers (see gunicorn.conf.py)
+else:
+    from hopeland_bot import create_app
+    app = create_app()
@@ -0,0 +1,79 @@
+# bench/cold_start.py
+# Cold-start cost of a worker, measured in fresh interpreters:
+#   standard  import + create_app() + first webhook, all in the worker (no preload)
+#   preload   the master imports and builds shared state, then forks; only the
+#             child's start_background() + first webhook count as worker boot
+#   python bench/cold_start.py --runs 5
+import os, sys, json, time, shutil, argparse, tempfile, statistics, subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, "..")
+
+def _first_webhook(app) -> float:
+    with open(os.path.join(HERE, "payloads", "01_text_hi.json"), encoding="utf-8") as f:
+        body = json.load(f)
+    t0 = time.perf_counter()
+    r = app.test_client().post("/whatsapp/webhook", json=body)
+    assert r.status_code == 200, r.status_code
+    return time.perf_counter() - t0
+
+def child(mode: str):
+    sys.path.insert(0, ROOT)
+    t0 = time.perf_counter()
+    import hopeland_bot
+    t_import = time.perf_counter() - t0
+    t1 = time.perf_counter()
+    app = hopeland_bot.create_app()
+    t_create = time.perf_counter() - t1
+    out = {"import_ms": t_import * 1000, "create_app_ms": t_create * 1000}
+    if mode == "standard":
+        out["first_webhook_ms"] = _first_webhook(app) * 1000
+        out["worker_boot_ms"] = (time.perf_counter() - t0) * 1000
+    else:
+        r, w = os.pipe()
+        t_fork = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(r)
+            hopeland_bot.start_background()
+            first = _first_webhook(app)
+            os.write(w, json.dumps({"first_webhook_ms": first * 1000,
+                                    "worker_boot_ms": (time.perf_counter() - t_fork) * 1000}).encode())
+            os._exit(0)
+        os.close(w)
+        data = b""
+        while chunk := os.read(r, 65536): data += chunk
+        os.waitpid(pid, 0)
+        out.update(json.loads(data))
+    out["gspread_loaded"] = "gspread" in sys.modules
+    print(json.dumps(out))
+
+def run(mode: str) -> dict:
+    data_dir = tempfile.mkdtemp(prefix="hopeland-cold-")
+    env = {**os.environ, "DATA_DIR": data_dir, "APP_PRELOAD": "1" if mode == "preload" else "0",
+           "OUTBOX_WORKERS": "0", "GRAPH_API_ROOT": "http://127.0.0.1:9", "LOG_LEVEL": "ERROR"}
+    try:
+        res = subprocess.run([sys.executable, __file__, "--child", mode], env=env, cwd=ROOT,
+                             capture_output=True, text=True, timeout=120)
+        lines = [l for l in res.stdout.splitlines() if l.startswith("{\"import_ms\"")]
+        if not lines: raise SystemExit(f"{mode} run failed:\n{res.stderr[-2000:]}")
+        return json.loads(lines[-1])
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--child", choices=("standard", "preload"))
+    args = ap.parse_args()
+    if args.child: return child(args.child)
+    report = {}
+    for mode in ("standard", "preload"):
+        samples = [run(mode) for _ in range(args.runs)]
+        report[mode] = {k: round(statistics.median(s[k] for s in samples), 1)
+                        for k in samples[0] if k != "gspread_loaded"}
+        report[mode]["gspread_loaded"] = any(s["gspread_loaded"] for s in samples)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
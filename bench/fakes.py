@@ -0,0 +1,208 @@
+# bench/fakes.py
+# Local stand-ins for the Graph API, Google Sheets (gspread) and SMTP used by the benchmarks.
+import json
+import socketserver
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class FakeGraphAPI:
+    # POST /<phone>/messages and /<phone>/media, answering like graph.facebook.com.
+    # `status` != 200 fails every request, `fail_types` only messages of those types and
+    # `fail_if(message)` the messages it returns True for.
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.status = 200
+        self.fail_types = set()
+        self.fail_if = None
+        self.calls = Counter()
+        self.sent = []  # message payloads, in arrival order
+        self._lock = threading.Lock()
+        self._seq = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if fake.latency:
+                    threading.Event().wait(fake.latency)
+                kind = self.path.rstrip("/").rsplit("/", 1)[-1]
+                message = {}
+                if kind == "messages":
+                    try: message = json.loads(raw)
+                    except ValueError: pass
+                refused = message.get("type") in fake.fail_types or bool(message and fake.fail_if and fake.fail_if(message))
+                status = fake.status if fake.status != 200 else 400 if refused else 200
+                with fake._lock:
+                    fake.calls[kind] += 1; fake._seq += 1; seq = fake._seq
+                    if message: fake.sent.append(message)
+                if status != 200:
+                    body = {"error": {"message": "fake failure", "code": status}}
+                elif kind == "media":
+                    body = {"id": f"media.{seq}"}
+                else:
+                    body = {"messaging_product": "whatsapp", "messages": [{"id": f"wamid.fake{seq}"}]}
+                raw = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(raw)))
+                self.end_headers(); self.wfile.write(raw)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def root(self) -> str:
+        return f"http://127.0.0.1:{self.port}/v19.0"
+
+    def total(self) -> int:
+        with self._lock:
+            return sum(self.calls.values())
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear(); self.sent.clear()
+        self.status, self.fail_types, self.fail_if, self.latency = 200, set(), None, 0.0
+
+    def close(self):
+        self.server.shutdown()
+
+class FakeWorksheet:
+    def __init__(self, title: str = "Sheet1", book=None):
+        self.title = title
+        self.book = book
+        self.rows = []
+        self.calls = Counter()
+
+    def row_values(self, n):
+        self.calls["row_values"] += 1
+        return list(self.rows[n - 1]) if len(self.rows) >= n else []
+
+    def clear(self):
+        self.calls["clear"] += 1; self.rows = []
+
+    def insert_row(self, values, index=1):
+        self.calls["insert_row"] += 1; self.rows.insert(index - 1, list(values))
+
+    def insert_rows(self, values, row=1, **kwargs):
+        self.calls["insert_rows"] += 1; self.rows[row - 1:row - 1] = [list(v) for v in values]
+
+    def append_rows(self, values, **kwargs):
+        self.calls["append_rows"] += 1; self.rows.extend(list(v) for v in values)
+
+    def append_row(self, values, **kwargs):
+        self.calls["append_row"] += 1; self.rows.append(list(values))
+
+    def get_all_values(self):
+        self.calls["get_all_values"] += 1
+        return [list(r) for r in self.rows]
+
+    def col_values(self, n):
+        self.calls["col_values"] += 1
+        return [r[n - 1] if len(r) >= n else "" for r in self.rows]
+
+    def update_title(self, title):
+        self.calls["update_title"] += 1; self.title = title
+
+    def update_index(self, index):
+        self.calls["update_index"] += 1
+        self.book._sheets.remove(self); self.book._sheets.insert(index, self)
+
+class FakeSpreadsheet:
+    def __init__(self, sid: str = "fake-sheet"):
+        self.id = sid
+        self._sheets = [FakeWorksheet(book=self)]
+
+    @property
+    def sheet1(self):
+        return self._sheets[0]
+
+    def worksheets(self):
+        return list(self._sheets)
+
+    def worksheet(self, title):
+        for ws in self._sheets:
+            if ws.title == title: return ws
+        import gspread
+        raise gspread.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows=1000, cols=26, index=None):
+        ws = FakeWorksheet(title, self)
+        self._sheets.insert(len(self._sheets) if index is None else index, ws)
+        return ws
+
+    def del_worksheet(self, worksheet):
+        self._sheets.remove(worksheet)
+
+    def list_permissions(self):
+        return []
+
+    def share(self, *args, **kwargs):
+        pass
+
+class FakeGspreadClient:
+    # In-memory replacement for the object returned by gspread.authorize().
+    def __init__(self):
+        self.spreadsheet = FakeSpreadsheet()
+
+    def open_by_key(self, key):
+        return self.spreadsheet
+
+    def create(self, title):
+        return self.spreadsheet
+
+class SmtpSink:
+    # Accepts EHLO/AUTH/MAIL/RCPT/DATA and keeps the raw messages (no TLS). The next
+    # `drop_sessions` DATA commands are answered by hanging up.
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self.drop_sessions = 0
+        sink = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                sink.connections += 1
+                w = lambda line: self.wfile.write(line.encode() + b"\r\n")
+                w("220 sink ESMTP")
+                while True:
+                    line = self.rfile.readline()
+                    if not line: return
+                    cmd = line.decode(errors="replace").strip().upper()
+                    if cmd.startswith(("EHLO", "HELO")):
+                        w("250-sink"); w("250 AUTH PLAIN LOGIN")
+                    elif cmd.startswith("AUTH"):
+                        w("235 ok")
+                    elif cmd == "DATA":
+                        if sink.drop_sessions > 0:
+                            sink.drop_sessions -= 1; return
+                        w("354 go ahead")
+                        data = []
+                        while True:
+                            chunk = self.rfile.readline()
+                            if not chunk or chunk in (b".\r\n", b".\n"): break
+                            data.append(chunk)
+                        sink.messages.append(b"".join(data))
+                        w("250 queued")
+                    elif cmd == "QUIT":
+                        w("221 bye"); return
+                    else:
+                        w("250 ok")
+
+        class Server(socketserver.ThreadingTCPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self.server = Server(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
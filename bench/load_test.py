@@ -0,0 +1,161 @@
+# bench/load_test.py
+# Replays recorded webhook payloads against create_app() with every external
+# dependency replaced by a local stand-in (see fakes.py), then reports webhook
+# latency percentiles, outbound Graph calls per inbound message and memory growth.
+#   python bench/load_test.py --conversations 200 --concurrency 16 [--runtime async]
+import os, sys, json, glob, time, copy, shutil, logging, argparse, tempfile, threading
+from concurrent.futures import ThreadPoolExecutor
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+sys.path.insert(0, HERE)
+
+def _rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"): return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _pct(values, p):
+    if not values: return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+def _load_payloads(pattern):
+    paths = sorted(glob.glob(pattern))
+    if not paths: raise SystemExit(f"no payloads match {pattern}")
+    return [json.load(open(p, encoding="utf-8")) for p in paths]
+
+def _personalise(payload, wa_id, seq):
+    doc = copy.deepcopy(payload)
+    for entry in doc.get("entry", []):
+        for change in entry.get("changes", []):
+            value = change.get("value", {})
+            for c in value.get("contacts", []): c["wa_id"] = wa_id
+            for i, m in enumerate(value.get("messages", [])):
+                m["from"] = wa_id; m["id"] = f"wamid.bench.{wa_id}.{seq}.{i}"
+    return doc
+
+def _serve(runtime):
+    # -> (object with .shutdown(), port)
+    if runtime == "sync":
+        from hopeland_bot import create_app
+        from werkzeug.serving import make_server
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        server = make_server("127.0.0.1", 0, create_app(), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server, server.server_port
+    import socket, uvicorn
+    from hopeland_bot.asgi import app
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started: time.sleep(0.05)
+    class _Stop:
+        def shutdown(self): server.should_exit = True
+    return _Stop(), port
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--payloads", default=os.path.join(HERE, "payloads", "*.json"))
+    ap.add_argument("--conversations", type=int, default=100, help="synthetic customers; each replays every payload in order")
+    ap.add_argument("--concurrency", type=int, default=16)
+    ap.add_argument("--graph-latency", type=float, default=0.05, help="seconds added by the fake Graph API")
+    ap.add_argument("--drain-timeout", type=float, default=120.0)
+    ap.add_argument("--runtime", choices=("sync", "async"), default="sync",
+                    help="sync: Flask on a threaded WSGI server; async: hopeland_bot.asgi on uvicorn")
+    args = ap.parse_args()
+
+    from fakes import FakeGraphAPI, FakeGspreadClient, SmtpSink
+    graph, smtp = FakeGraphAPI(latency=args.graph_latency), SmtpSink()
+    workdir = tempfile.mkdtemp(prefix="hopeland-load-")
+    os.environ.update({
+        "DATA_DIR": os.path.join(workdir, "data"), "GRAPH_API_ROOT": graph.root,
+        "WHATSAPP_TOKEN": "bench", "WHATSAPP_PHONE_ID": "PHONE_ID",
+        "GOOGLE_SERVICE_ACCOUNT_JSON": "", "SHEET_ID": "fake-sheet",
+        "EMAIL_SMTP_HOST": "127.0.0.1", "EMAIL_SMTP_PORT": str(smtp.port), "EMAIL_SMTP_STARTTLS": "0",
+        "EMAIL_USERNAME": "bench", "EMAIL_PASSWORD": "bench", "OWNERS_EMAILS": "owner@example.com",
+        "RATE_LIMIT_GLOBAL_PER_SEC": "100000", "RATE_LIMIT_GLOBAL_BURST": "100000",
+        "RATE_LIMIT_RECIPIENT_PER_SEC": "100000", "RATE_LIMIT_RECIPIENT_BURST": "100000",
+        "RUNTIME": args.runtime,
+    })
+    os.chdir(workdir)  # catalog image paths are relative to the working directory
+
+    from hopeland_bot import sheets
+    fake_gc = FakeGspreadClient()
+    sheets._client = lambda: fake_gc
+    sheets.sheets_configured = lambda: True
+    from hopeland_bot.data import CATALOG
+    for items in CATALOG.listings().values():
+        for item in items:
+            for img in item.get("images") or []:
+                os.makedirs(os.path.dirname(img) or ".", exist_ok=True)
+                if not os.path.exists(img):
+                    with open(img, "wb") as f: f.write(os.urandom(64 * 1024))
+
+    from hopeland_bot import outbox, enquiries
+    import requests
+
+    server, port = _serve(args.runtime)
+    logging.getLogger().setLevel(logging.WARNING)
+    url = f"http://127.0.0.1:{port}/whatsapp/webhook"
+
+    payloads = _load_payloads(args.payloads)
+    time.sleep(1.0)  # let the startup media pre-warm finish
+    base_calls = graph.total()
+    rss_before = _rss_kb()
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    session = threading.local()
+
+    def conversation(n):
+        s = getattr(session, "s", None) or requests.Session(); session.s = s
+        wa_id = f"9745{n:07d}"
+        for seq, payload in enumerate(payloads):
+            body = _personalise(payload, wa_id, seq)
+            t0 = time.perf_counter()
+            r = s.post(url, json=body, timeout=30)
+            dt = time.perf_counter() - t0
+            with lock:
+                latencies.append(dt)
+                if r.status_code != 200: errors[0] += 1
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(conversation, range(args.conversations)))
+    webhook_s = time.perf_counter() - t_start
+
+    deadline = time.time() + args.drain_timeout
+    while outbox.depth() and time.time() < deadline: time.sleep(0.1)
+    drain_s = time.perf_counter() - t_start
+    sheets.flush_enquiries()
+
+    from hopeland_bot.digest import send_digest_once
+    send_digest_once()
+    deadline = time.time() + 10
+    while not smtp.messages and time.time() < deadline: time.sleep(0.1)
+    rss_after = _rss_kb()
+
+    inbound = len(latencies)
+    outbound = graph.total() - base_calls
+    report = {
+        "runtime": args.runtime, "inbound_messages": inbound, "errors": errors[0], "concurrency": args.concurrency,
+        "webhook_rps": round(inbound / webhook_s, 1),
+        "webhook_ms": {f"p{p}": round(_pct(latencies, p) * 1000, 2) for p in (50, 95, 99)},
+        "outbound_calls": dict(graph.calls), "outbound_per_inbound": round(outbound / max(1, inbound), 2),
+        "outbox_left": outbox.depth(), "drain_seconds": round(drain_s, 2),
+        "sheet_rows": len(fake_gc.spreadsheet.sheet1.rows) - 1, "sheet_calls": dict(fake_gc.spreadsheet.sheet1.calls),
+        "spool_pending": enquiries.pending(), "emails": len(smtp.messages),
+        "rss_kb": {"before": rss_before, "after": rss_after, "growth": rss_after - rss_before},
+    }
+    print(json.dumps(report, indent=2))
+    server.shutdown(); graph.close(); smtp.close()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
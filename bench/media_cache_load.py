@@ -0,0 +1,39 @@
+# bench/media_cache_load.py
+# Load-time benchmark for the shared media cache (DATA_DIR/media.db).
+#   python bench/media_cache_load.py --entries 5000
+import os, sys, time, argparse, tempfile
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--entries", type=int, default=5000)
+    ap.add_argument("--lookups", type=int, default=20000)
+    args = ap.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="hopeland-bench-")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from hopeland_bot import media
+    from hopeland_bot.db import transaction
+
+    now = time.time()
+    with transaction(media._conn()) as conn:
+        conn.executemany("INSERT INTO media (sha, media_id, uploaded_at, path) VALUES (?,?,?,?)",
+                         [(f"{i:064x}", f"media-{i}", now, f"media/img-{i}.jpg") for i in range(args.entries)])
+
+    t0 = time.perf_counter(); media.init_media_cache(); load_s = time.perf_counter() - t0
+    assert len(media.MEDIA_CACHE) == args.entries
+
+    t0 = time.perf_counter()
+    for i in range(args.lookups):
+        media._get_entry(f"{i % args.entries:064x}")
+    lookup_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    for i in range(1000):
+        media._save_entry(f"{(args.entries + i):064x}", {"id": f"new-{i}", "uploaded_at": now, "path": ""})
+    save_s = time.perf_counter() - t0
+
+    print(f"entries={args.entries} load={load_s*1000:.1f}ms "
+          f"shared_lookup={lookup_s/args.lookups*1e6:.1f}us/op save={save_s/1000*1e6:.1f}us/op")
+
+if __name__ == "__main__":
+    main()
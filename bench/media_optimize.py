@@ -0,0 +1,49 @@
+# bench/media_optimize.py
+# Size and time of the pre-upload image optimisation (media._prepare) on synthetic
+# phone-sized photos with EXIF, or on real files passed as arguments.
+#   python bench/media_optimize.py --count 5
+#   python bench/media_optimize.py media/*.jpg
+import os, sys, json, time, argparse, tempfile
+
+def _synthetic(folder: str, n: int, size=(4000, 3000)):
+    from PIL import Image
+    paths = []
+    for i in range(n):
+        # smooth gradient plus noise: compresses roughly like a photo, unlike a flat fill
+        grad = Image.linear_gradient("L").resize(size)
+        noise = Image.effect_noise(size, 40 + i)
+        im = Image.merge("RGB", (grad, noise, grad.transpose(Image.FLIP_LEFT_RIGHT)))
+        exif = Image.Exif(); exif[0x010F] = "BenchPhone"; exif[0x0112] = 6  # make, orientation
+        path = os.path.join(folder, f"IMG-BENCH-{i:03d}.jpg")
+        im.save(path, "JPEG", quality=95, exif=exif)
+        paths.append(path)
+    return paths
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("files", nargs="*")
+    ap.add_argument("--count", type=int, default=5)
+    args = ap.parse_args()
+    workdir = tempfile.mkdtemp(prefix="hopeland-media-")
+    os.environ["DATA_DIR"] = os.path.join(workdir, "data")
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from hopeland_bot import media
+    from PIL import Image
+
+    paths = args.files or _synthetic(workdir, args.count)
+    timings, outputs = [], []
+    for path in paths:
+        t0 = time.perf_counter()
+        out, mime = media._prepare(path, media._content_hash(path))
+        timings.append((time.perf_counter() - t0) * 1000)
+        with Image.open(out) as im:
+            outputs.append({"file": os.path.basename(path), "size": list(im.size), "mime": mime,
+                            "exif_left": bool(im.getexif())})
+    t0 = time.perf_counter()
+    for path in paths: media._prepare(path, media._content_hash(path))
+    cached_ms = (time.perf_counter() - t0) * 1000 / len(paths)
+    print(json.dumps({"report": media.optimization_report(), "optimize_ms": [round(t, 1) for t in timings],
+                      "cached_ms": round(cached_ms, 3), "outputs": outputs}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# bench/router_dispatch.py
+# Dispatch cost of the conversation router (hopeland_bot/router.py) as the command table
+# grows: classify + transition lookup per message, with actions that do nothing.
+#   python bench/router_dispatch.py --sizes 10 100 1000 10000
+import os, sys, json, time, argparse, tempfile
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    ap.add_argument("--messages", type=int, default=20000)
+    args = ap.parse_args()
+    os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="hopeland-bench-"))
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from hopeland_bot import router
+
+    for name in list(router.ACTIONS): router.ACTIONS[name] = lambda t: None
+    router._TABLE = router.compile_transitions()
+    msgs = [{"type": "text", "text": {"body": "Menu"}}, {"type": "text", "text": {"body": "1 bhk"}},
+            {"type": "interactive", "interactive": {"list_reply": {"id": "listing_R107"}}},
+            {"type": "interactive", "interactive": {"list_reply": {"id": "cat_studio"}}}]
+    base = dict(router.COMMANDS)
+    report = {}
+    for size in args.sizes:
+        router.COMMANDS.clear(); router.COMMANDS.update(base)
+        router.COMMANDS.update({f"command{i}": "greet" for i in range(size - len(base))})
+        router._KEYWORDS = (-1, {})
+        sess = {"state": "NEW", "last_cat": None, "human": False}
+        router.route("974", sess, msgs[0])  # build the keyword table outside the timing
+        t0 = time.perf_counter()
+        for i in range(args.messages):
+            router.route("974", sess, msgs[i % len(msgs)])
+        report[size] = round((time.perf_counter() - t0) / args.messages * 1e6, 2)
+    print(json.dumps({"us_per_message_by_commands": report}, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+# bench/search_lookup.py
+# Microbenchmark for the listing search index (hopeland_bot/search.py): build time and
+# per-lookup latency on the built-in catalog and on a synthetic catalog of --listings units.
+#   python bench/search_lookup.py --listings 2000
+import os, sys, json, time, random, argparse, statistics
+
+QUERIES = ["big studio with bathtub", "R107", "1 bhk with big kitchen", "studios", "bath",
+           "separate entrance", "dressing room", "I need a room", "hello there"]
+WORDS = ("big small premium modern spacious separate closed long outside window windows hall kitchen "
+         "bathroom bathtub dressing passage entrance balcony terrace garden parking furnished").split()
+
+def _synthetic(n: int):
+    rnd = random.Random(7)
+    for i in range(n):
+        cat = rnd.choice(("1BHK", "Studio"))
+        yield f"U{i:05d}", {"id": f"U{i:05d}", "title": f"U{i:05d} — {rnd.choice(WORDS).title()} {cat}",
+                            "desc": ", ".join(rnd.sample(WORDS, 5)) + ".", "category": cat}
+
+def _bench(index, lookups: int) -> dict:
+    per_query = {}
+    for q in QUERIES:
+        samples = []
+        for _ in range(5):
+            t0 = time.perf_counter()
+            for _ in range(lookups): index.search(q)
+            samples.append((time.perf_counter() - t0) / lookups * 1e6)
+        per_query[q] = round(min(samples), 2)
+    return {"us_per_lookup": per_query, "median_us": round(statistics.median(per_query.values()), 2)}
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--listings", type=int, default=2000, help="size of the synthetic catalog")
+    ap.add_argument("--lookups", type=int, default=2000)
+    args = ap.parse_args()
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from hopeland_bot.data import CATALOG
+    from hopeland_bot.search import SearchIndex
+
+    builtin = CATALOG.snapshot().search_index
+    t0 = time.perf_counter(); big = SearchIndex(_synthetic(args.listings)); build_s = time.perf_counter() - t0
+    report = {
+        "builtin": {"listings": len(builtin.order), "terms": len(builtin.terms), **_bench(builtin, args.lookups)},
+        "synthetic": {"listings": len(big.order), "terms": len(big.terms), "build_ms": round(build_s * 1000, 1),
+                      **_bench(big, max(1, args.lookups // 10))},
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
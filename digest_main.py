@@ -0,0 +1,11 @@
+# digest_main.py — entry point of the compose `digest` service: `python digest_main.py`
+# (hopeland_bot/__init__ already imports hopeland_bot.digest, so `python -m` would load
+# a second copy of the module)
+from hopeland_bot.logs import init_logging
+from hopeland_bot.emailer import resume_mail_sender
+from hopeland_bot.digest import run_digest_loop
+
+if __name__ == "__main__":
+    init_logging()
+    resume_mail_sender()
+    run_digest_loop()
@@ -0,0 +1,26 @@
+# gunicorn.conf.py — `gunicorn -c gunicorn.conf.py app:app`
+# With GUNICORN_PRELOAD=1 (default) the app is imported once in the master: the catalog,
+# media hashes and imported modules are shared copy-on-write, and each worker only
+# starts its own background threads after the fork.
+import os
+import importlib.util
+
+RUNTIME = os.environ.get("RUNTIME", "sync").strip().lower()
+if RUNTIME == "async" and not all(importlib.util.find_spec(m) for m in ("uvicorn", "httpx", "asgiref")):
+    raise SystemExit("RUNTIME=async needs uvicorn, httpx and asgiref: pip install -r requirements-async.txt")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:3000")
+workers = int(os.environ.get("GUNICORN_WORKERS", "2"))
+# RUNTIME=async serves the ASGI app (hopeland_bot/asgi.py) on uvicorn workers instead
+worker_class = "uvicorn.workers.UvicornWorker" if RUNTIME == "async" else "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+
+if preload_app:
+    os.environ["APP_PRELOAD"] = "1"
+
+def post_fork(server, worker):
+    if preload_app:
+        from hopeland_bot import start_background
+        start_background()
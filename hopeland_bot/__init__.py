@@ -1,12 +1,42 @@
 from flask import Flask
-from .config import init_logging, warn_if_missing_secrets
+from .config import warn_if_missing_secrets, APP_PRELOAD, RUNTIME
+from .logs import init_logging
 from .routes import bp as routes_bp
-from .media import init_media_cache
+from .data import CATALOG
+from .media import init_media_cache, start_media_refresher
+from .whatsapp import start_sender_pool
+from .sheets import init_sheet_async, start_sheet_flusher
+from .state import start_session_sweeper
+from .metrics import start_metrics_writer
+from .digest import start_digest
+from .emailer import resume_mail_sender
+from .alerts import start_lead_alerts
+from .db import close_connections
 
-def create_app() -> Flask:
-    init_logging()
+def _build_shared_state():
+    # Read-only state; under preload_app it is built once in the master and shared copy-on-write.
     warn_if_missing_secrets()
+    CATALOG.snapshot()
     init_media_cache()
+
+def start_background():
+    # Per-process threads and connections; never across a fork (see gunicorn.conf.py).
+    init_logging()
+    start_media_refresher()
+    if RUNTIME != "async": start_sender_pool()  # the asyncio senders start with the ASGI lifespan
+    init_sheet_async()
+    start_sheet_flusher()
+    start_session_sweeper()
+    start_metrics_writer()
+    start_digest()
+    resume_mail_sender()
+    start_lead_alerts()
+
+def create_app() -> Flask:
+    init_logging()
+    _build_shared_state()
+    if APP_PRELOAD: close_connections()  # workers open their own after the fork
+    else: start_background()
     app = Flask(__name__)
     app.register_blueprint(routes_bp)
 
@@ -0,0 +1,125 @@
+# hopeland_bot/aio.py
+# Asyncio counterparts of the outbound side for RUNTIME=async (see asgi.py). Same names
+# and the same plans/intents as whatsapp.py; Graph calls go over httpx on the event loop,
+# while local SQLite work (outbox, sessions, media cache) runs in the default executor.
+# Sheets and SMTP keep their single batching thread each: the async send_email() and
+# log_enquiry() only queue, exactly like the sync ones.
+import os, socket, asyncio, logging
+from typing import Dict, List
+from .config import AIO_OUTBOX_WORKERS, OUTBOX_LEASE_SECONDS
+from .graph import async_graph_client, close_async_graph_client
+from .metrics import timed
+from .utils import safe, clip
+from .whatsapp import (Plan, INTENTS, plan_text, plan_category_menu, plan_listings_menu,
+                       plan_search_results, plan_selection_echo, plan_listing_details, _log_fields, _json,
+                       _step, _END, SendFailed, _post_error)
+from . import outbox, whatsapp, emailer, delivery
+
+@timed("graph_request", dep="whatsapp", op="message")
+async def _wa_post(payload: dict) -> bool:
+    try:
+        r = await async_graph_client().post("/messages", json=payload, timeout=15, recipient=payload.get("to"))
+        if r.status_code >= 400:
+            logging.error("WA POST failed: %s", clip(r.text, 500), extra=_log_fields(payload, r.status_code)); return False
+        await asyncio.to_thread(delivery.record_send, delivery.wamid_of(_json(r)), payload.get("to"), payload.get("type"))
+        return True
+    except Exception as e:
+        return _post_error(payload, e)
+
+async def _run(plan: Plan, skip: int = 0):
+    # Plan steps may touch the media cache or upload an image, so they run off the loop.
+    # `skip` and SendFailed.sent work as in whatsapp._run.
+    failed, i, accepted = None, -1, skip
+    while True:
+        try: payload = await asyncio.to_thread(_step, plan, failed)
+        except SendFailed as e:
+            e.sent = accepted; raise
+        if payload is _END: return
+        i += 1
+        if i < skip: failed = None
+        elif await _wa_post(payload): failed, accepted = None, i + 1
+        else: failed = payload
+
+@safe
+async def send_text(to: str, body: str):
+    await _run(plan_text(to, body))
+
+@safe
+async def send_category_menu(to: str):
+    await _run(plan_category_menu(to))
+
+@safe
+async def send_listings_menu(to: str, category_key: str):
+    await _run(plan_listings_menu(to, category_key))
+
+@safe
+async def send_search_results(to: str, listing_ids: List[str]):
+    await _run(plan_search_results(to, listing_ids))
+
+@safe
+async def send_selection_echo(to: str, listing: Dict):
+    await _run(plan_selection_echo(to, listing))
+
+@safe
+async def send_listing_details(to: str, listing: Dict):
+    await _run(plan_listing_details(to, listing))
+
+async def send_email(subject: str, text: str, html: str = "") -> int:
+    return await asyncio.to_thread(emailer.send_email, subject, text, html)
+
+async def log_enquiry(wa_number, wa_name, category, unit_id, title, desc) -> bool:
+    from .sheets import log_enquiry as _log_enquiry
+    return await asyncio.to_thread(_log_enquiry, wa_number, wa_name, category, unit_id, title, desc)
+
+async def enqueue(to: str, kind: str, **args):
+    await asyncio.to_thread(whatsapp.enqueue, to, kind, **args)
+
+# ---- Outbox senders: asyncio tasks instead of whatsapp.py's thread pool ----
+
+async def _drain(wa_id: str, owner: str):
+    try:
+        while True:
+            item = await asyncio.to_thread(whatsapp._next, wa_id, owner)
+            if not item: return
+            error = None
+            try: await _run(INTENTS[item[1]](wa_id, **item[2]), skip=item[5])
+            except Exception as e: error = e
+            if not await asyncio.to_thread(whatsapp._settle, wa_id, owner, item, error): return
+    finally:
+        await asyncio.to_thread(outbox.release, wa_id, owner)
+
+async def _sender_loop(owner: str, wake: asyncio.Event):
+    while True:
+        try:
+            wake.clear()
+            wa_id = await asyncio.to_thread(outbox.claim, owner, OUTBOX_LEASE_SECONDS)
+            if not wa_id:
+                try: await asyncio.wait_for(wake.wait(), 1.0)
+                except asyncio.TimeoutError: pass
+                continue
+            await _drain(wa_id, owner)
+        except Exception as e:
+            logging.exception("Async sender loop error: %s", e)
+            await asyncio.sleep(1.0)
+
+_TASKS: Dict[int, List[asyncio.Task]] = {}  # pid -> sender tasks
+
+def start_async_senders(workers: int = AIO_OUTBOX_WORKERS) -> List[asyncio.Task]:
+    # Call from inside the running loop (the ASGI lifespan startup).
+    pid = os.getpid()
+    if pid in _TASKS: return _TASKS[pid]
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+    whatsapp._WAKERS.append(lambda: loop.call_soon_threadsafe(wake.set))
+    base = f"{socket.gethostname()}:{pid}:aio"
+    _TASKS[pid] = [loop.create_task(_sender_loop(f"{base}-{i}", wake), name=f"wa-sender-aio-{i}")
+                   for i in range(max(0, workers))]
+    logging.info("Async outbox senders started (%d tasks, %d queued).", len(_TASKS[pid]), outbox.depth())
+    return _TASKS[pid]
+
+async def stop_async_senders():
+    tasks = _TASKS.pop(os.getpid(), [])
+    for t in tasks: t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    whatsapp._WAKERS.clear()
+    await close_async_graph_client()
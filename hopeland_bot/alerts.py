@@ -0,0 +1,105 @@
+# hopeland_bot/alerts.py
+import os, time, logging, threading
+from typing import List, Tuple
+from .config import (ENQUIRIES_DB_PATH, LEAD_ALERTS, LEAD_ALERT_BATCH, LEAD_ALERT_SECONDS,
+                     LEAD_ALERT_DEDUPE_SECONDS, LEAD_ALERT_LOCK_PATH)
+from .db import connect, transaction
+from .emailer import send_email, _smtp_ok
+from .metrics import inc
+from .utils import leader_lock
+from . import enquiries
+
+# Near-real-time owner alerts. Same shape as the digest: one leader (flock) reads the
+# enquiry mirror past its own watermark and mails new leads as a micro-batch once
+# LEAD_ALERT_BATCH are waiting or the oldest has waited LEAD_ALERT_SECONDS.
+WATERMARK = "alerts_last_id"
+READ_LIMIT = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS alert_seen (
+    key TEXT PRIMARY KEY,
+    ts  REAL NOT NULL
+);
+"""
+
+def _conn():
+    return connect(ENQUIRIES_DB_PATH, _SCHEMA)
+
+def _key(row: list) -> str:
+    return f"{row[2]}|{row[5]}"  # WA Number | Unit ID
+
+def _watermark() -> int:
+    wm = enquiries.get_cursor(WATERMARK)
+    if wm is None:
+        wm = enquiries.last_id()  # alerts start from now, history is the digest's job
+        enquiries.set_cursor(WATERMARK, wm)
+    return int(wm)
+
+def _recently_alerted(keys: set, since: float) -> set:
+    if not keys: return set()
+    marks = ",".join("?" * len(keys))
+    cur = _conn().execute(f"SELECT key FROM alert_seen WHERE ts >= ? AND key IN ({marks})", (since, *keys))
+    return {r[0] for r in cur}
+
+def _send(fresh: List[Tuple[float, list]]) -> bool:
+    from .digest import render_html, render_text
+    from .sheets import HEADERS, spreadsheet_url
+    rows = [dict(zip(HEADERS, r)) for _, r in reversed(fresh)]  # newest first
+    url = spreadsheet_url() or "(sheet not available)"
+    subject = f"HOPELAND new WhatsApp enquiries ({len(rows)})"
+    html = f"<p>New enquiries just came in.</p><p>Sheet: <a href='{url}'>{url}</a></p>{render_html(rows)}"
+    text = f"Sheet: {url}\n\n{render_text(rows)}"
+    return bool(send_email(subject, text, html))
+
+def check_alerts() -> float:
+    # One pass; returns how long the caller may sleep before the next one is useful.
+    with leader_lock(LEAD_ALERT_LOCK_PATH) as leader:
+        if not leader: return LEAD_ALERT_SECONDS
+        now = time.time()
+        items = enquiries.rows_after(_watermark(), READ_LIMIT)
+        if not items: return LEAD_ALERT_SECONDS
+        window = now - LEAD_ALERT_DEDUPE_SECONDS
+        seen = _recently_alerted({_key(r) for _, _, r in items}, window)
+        fresh: List[Tuple[float, list]] = []; dup = stale = 0
+        for _, ts, row in items:
+            if ts < window: stale += 1  # old row backfilled from the sheet, not a new lead
+            elif _key(row) in seen: dup += 1
+            else: seen.add(_key(row)); fresh.append((ts, row))
+        if fresh:
+            wait = LEAD_ALERT_SECONDS - (now - fresh[0][0])
+            if len(fresh) < LEAD_ALERT_BATCH and wait > 0: return wait
+            if not _send(fresh): return min(LEAD_ALERT_SECONDS, 60.0)
+        # enquiries shares this connection, so the watermark moves in the same transaction
+        with transaction(_conn()) as conn:
+            conn.executemany("INSERT INTO alert_seen (key, ts) VALUES (?,?) "
+                             "ON CONFLICT(key) DO UPDATE SET ts=excluded.ts", [(_key(r), ts) for ts, r in fresh])
+            conn.execute("DELETE FROM alert_seen WHERE ts < ?", (window,))
+            enquiries.set_cursor(WATERMARK, items[-1][0])
+        if fresh:
+            inc("lead_alerts_sent_total"); inc("lead_alert_rows_total", len(fresh))
+            logging.info("Lead alert queued (%d leads).", len(fresh), extra={"count": len(fresh)})
+        if dup: inc("lead_alerts_suppressed_total", dup, reason="duplicate")
+        if stale: inc("lead_alerts_suppressed_total", stale, reason="stale")
+        return 0.0 if len(items) == READ_LIMIT else LEAD_ALERT_SECONDS
+
+_WAKE = threading.Event()
+_STARTED = set()  # pids
+
+def notify():
+    # Called after an enquiry is spooled; the batch rules above decide when mail goes out.
+    _WAKE.set()
+
+def _alert_loop():
+    while True:
+        _WAKE.clear()
+        delay = LEAD_ALERT_SECONDS
+        try: delay = check_alerts()
+        except Exception as e: logging.exception("Lead alert check failed: %s", e)
+        if delay > 0: _WAKE.wait(min(delay, LEAD_ALERT_SECONDS))
+
+def start_lead_alerts():
+    if not LEAD_ALERTS or os.getpid() in _STARTED: return
+    if not _smtp_ok():
+        logging.info("Lead alerts off: SMTP not configured."); return
+    _STARTED.add(os.getpid())
+    threading.Thread(target=_alert_loop, name="lead-alerts", daemon=True).start()
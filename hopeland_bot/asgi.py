@@ -0,0 +1,67 @@
+# hopeland_bot/asgi.py
+# RUNTIME=async entry point (app.py picks it): `uvicorn app:app` or gunicorn with
+# uvicorn workers. The webhook is served natively; everything else (admin, /metrics,
+# /health) is the regular Flask app behind asgiref's WSGI adapter.
+# Only the outbox senders are async (graph.AsyncGraphClient). The webhook handler
+# (sessions, dedupe, outbox: local SQLite) and plan steps that upload media with the
+# sync GraphClient run in the default thread pool, so this runtime is thread-offloaded
+# rather than async end to end.
+import json, asyncio
+from urllib.parse import parse_qsl
+try:
+    import httpx  # noqa: F401  used by graph.AsyncGraphClient once the senders start
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError as e:
+    raise RuntimeError("RUNTIME=async needs httpx and asgiref (and uvicorn to serve it): pip install -r requirements-async.txt") from e
+from . import create_app
+from .routes import handle_webhook, verify_challenge
+from .aio import start_async_senders, stop_async_senders
+
+WEBHOOK_PATH = "/whatsapp/webhook"
+
+async def _reply(send, status: int, body: bytes, content_type: bytes = b"application/json"):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"): return b"".join(chunks)
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_async_senders()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await stop_async_senders()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+class WebhookApp:
+    def __init__(self):
+        self.flask_app = create_app()
+        self.fallback = WsgiToAsgi(self.flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await _lifespan(receive, send)
+        if scope["type"] == "http" and scope["path"] == WEBHOOK_PATH:
+            if scope["method"] == "POST":
+                try: data = json.loads(await _read_body(receive) or b"{}")
+                except ValueError: data = {}
+                # Sessions, dedupe and the outbox are local SQLite: one executor hop per request.
+                status = await asyncio.to_thread(handle_webhook, data if isinstance(data, dict) else {})
+                return await _reply(send, 200, json.dumps({"status": status}).encode())
+            if scope["method"] == "GET":
+                args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+                challenge = verify_challenge(args)
+                if challenge is not None: return await _reply(send, 200, challenge.encode(), b"text/html; charset=utf-8")
+                return await _reply(send, 403, b"forbidden", b"text/html; charset=utf-8")
+        return await self.fallback(scope, receive, send)
+
+app = WebhookApp()
@@ -1,6 +1,5 @@
 import os
 import logging
-from logging.handlers import RotatingFileHandler
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -9,7 +8,21 @@ WHATSAPP_TOKEN    = os.environ.get("WHATSAPP_TOKEN", "")
 PHONE_NUMBER_ID   = os.environ.get("WHATSAPP_PHONE_ID", "")
 VERIFY_TOKEN      = os.environ.get("VERIFY_TOKEN", "hopeland-verify")
 HUMAN_CONTACT     = os.environ.get("HUMAN_CONTACT", "+974-55555555")
-GRAPH_API_BASE    = f"https://graph.facebook.com/v19.0/{PHONE_NUMBER_ID}"
+GRAPH_API_ROOT    = os.environ.get("GRAPH_API_ROOT", "https://graph.facebook.com/v19.0").rstrip("/")
+GRAPH_API_BASE    = f"{GRAPH_API_ROOT}/{PHONE_NUMBER_ID}"
+
+# Graph API HTTP client (connection pool + retry/backoff)
+GRAPH_POOL_SIZE        = int(os.environ.get("GRAPH_POOL_SIZE", "16"))
+GRAPH_MAX_RETRIES      = int(os.environ.get("GRAPH_MAX_RETRIES", "4"))
+GRAPH_BACKOFF_BASE     = float(os.environ.get("GRAPH_BACKOFF_BASE", "0.5"))
+GRAPH_BACKOFF_MAX      = float(os.environ.get("GRAPH_BACKOFF_MAX", "30"))
+
+# Set by gunicorn.conf.py under preload_app: create_app() then only builds shared state
+# and the post_fork hook starts each worker's background threads
+APP_PRELOAD       = os.environ.get("APP_PRELOAD", "0") == "1"
+# sync (default): Flask under gunicorn gthread, outbox drained by threads.
+# async: app.py serves hopeland_bot.asgi under uvicorn workers, outbox drained by asyncio tasks.
+RUNTIME           = os.environ.get("RUNTIME", "sync").strip().lower()
 
 # Admin protection
 ADMIN_API_KEY     = os.environ.get("ADMIN_API_KEY", "")
@@ -18,24 +31,91 @@ ALLOWED_ADMIN_IPS = [ip.strip() for ip in os.environ.get("ALLOWED_ADMIN_IPS", ""
 # Persistence
 DATA_DIR          = os.environ.get("DATA_DIR", "/data")
 LOG_DIR           = os.path.join(DATA_DIR, "logs")
-MEDIA_CACHE_PATH  = os.path.join(DATA_DIR, "media_cache.json")
+MEDIA_CACHE_PATH  = os.path.join(DATA_DIR, "media_cache.json")  # legacy; imported into MEDIA_DB_PATH
+MEDIA_DB_PATH     = os.path.join(DATA_DIR, "media.db")
 SHEET_STATE_PATH  = os.path.join(DATA_DIR, "sheet_state.json")
+SHEET_ROTATE_LOCK_PATH = os.path.join(DATA_DIR, "locks", "sheets-rotate.lock")
+MEDIA_LOCK_DIR    = os.path.join(DATA_DIR, "locks")
+CATALOG_PATH      = os.environ.get("CATALOG_PATH", os.path.join(DATA_DIR, "listings.json"))
+
+# Per-worker metric snapshots, merged by whichever worker serves /metrics
+METRICS_DIR           = os.path.join(DATA_DIR, "metrics")
+METRICS_FLUSH_SECONDS = float(os.environ.get("METRICS_FLUSH_SECONDS", "10"))
+
+# Outbound pacing for PHONE_NUMBER_ID (token buckets; RATE_LIMIT_SHARED=1 shares them across workers)
+RATE_LIMIT_DB_PATH           = os.path.join(DATA_DIR, "ratelimit.db")
+RATE_LIMIT_SHARED            = os.environ.get("RATE_LIMIT_SHARED", "0") == "1"
+RATE_LIMIT_GLOBAL_PER_SEC    = float(os.environ.get("RATE_LIMIT_GLOBAL_PER_SEC", "20"))
+RATE_LIMIT_GLOBAL_BURST      = float(os.environ.get("RATE_LIMIT_GLOBAL_BURST", "20"))
+RATE_LIMIT_RECIPIENT_PER_SEC = float(os.environ.get("RATE_LIMIT_RECIPIENT_PER_SEC", "2"))
+RATE_LIMIT_RECIPIENT_BURST   = float(os.environ.get("RATE_LIMIT_RECIPIENT_BURST", "6"))
+RATE_LIMIT_MIN_PER_SEC       = float(os.environ.get("RATE_LIMIT_MIN_PER_SEC", "1"))
+# A burst of throttling responses (in-flight sends, status callbacks) lowers the rate once per window
+RATE_LIMIT_THROTTLE_COOLDOWN = float(os.environ.get("RATE_LIMIT_THROTTLE_COOLDOWN", "5"))
+
+# Outbound message queue (drained by the sender pool in whatsapp.py)
+OUTBOX_PATH          = os.path.join(DATA_DIR, "outbox.db")
+OUTBOX_WORKERS       = int(os.environ.get("OUTBOX_WORKERS", "4"))
+AIO_OUTBOX_WORKERS   = int(os.environ.get("AIO_OUTBOX_WORKERS", str(OUTBOX_WORKERS * 4)))  # asyncio tasks, RUNTIME=async
+OUTBOX_LEASE_SECONDS = float(os.environ.get("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_MAX_ATTEMPTS  = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", "5"))
+# Identical menus for one wa_id within this many seconds collapse into one send (0 = off)
+OUTBOX_COALESCE_SECONDS = float(os.environ.get("OUTBOX_COALESCE_SECONDS", "10"))
+OUTBOX_COALESCE_KINDS   = {k.strip() for k in os.environ.get("OUTBOX_COALESCE_KINDS", "category_menu,listings_menu").split(",") if k.strip()}
+
+# Local enquiry spool; flushed to the leads sheet in batches
+ENQUIRIES_DB_PATH    = os.path.join(DATA_DIR, "enquiries.db")
+
+# Outgoing e-mail queue (see emailer.py)
+MAIL_OUTBOX_PATH     = os.path.join(DATA_DIR, "mail.db")
+
+# Uploaded WhatsApp media ids expire (30 days); refresh them ahead of time
+MEDIA_TTL_SECONDS              = float(os.environ.get("MEDIA_TTL_SECONDS", str(29*24*3600)))
+MEDIA_REFRESH_MARGIN_SECONDS   = float(os.environ.get("MEDIA_REFRESH_MARGIN_SECONDS", str(3*24*3600)))
+MEDIA_REFRESH_INTERVAL_SECONDS = float(os.environ.get("MEDIA_REFRESH_INTERVAL_SECONDS", "3600"))
+MEDIA_PREWARM_WORKERS          = int(os.environ.get("MEDIA_PREWARM_WORKERS", "4"))
+# Local images are resized/re-encoded (metadata stripped) before upload; needs Pillow
+MEDIA_OPTIMIZE                 = os.environ.get("MEDIA_OPTIMIZE", "1") == "1"
+MEDIA_MAX_DIMENSION            = int(os.environ.get("MEDIA_MAX_DIMENSION", "1600"))
+MEDIA_JPEG_QUALITY             = int(os.environ.get("MEDIA_JPEG_QUALITY", "80"))
+MEDIA_DERIVED_DIR              = os.path.join(DATA_DIR, "media_optimized")
+
+# Inbound webhook de-duplication by WhatsApp message id (Meta redelivers for days)
+DEDUPE_DB_PATH       = os.path.join(DATA_DIR, "dedupe.db")
+DEDUPE_TTL_SECONDS   = float(os.environ.get("DEDUPE_TTL_SECONDS", str(7*24*3600)))
+DEDUPE_LOCAL_MAX     = int(os.environ.get("DEDUPE_LOCAL_MAX", "10000"))
+
+# Outbound message ids and their delivery status callbacks (sent/delivered/read/failed)
+DELIVERY_DB_PATH      = os.path.join(DATA_DIR, "delivery.db")
+DELIVERY_TTL_SECONDS  = float(os.environ.get("DELIVERY_TTL_SECONDS", str(14*24*3600)))
+
+# Conversation sessions: "sqlite" is shared by all workers, "memory" is per process
+SESSION_BACKEND       = os.environ.get("SESSION_BACKEND", "sqlite").strip().lower()
+SESSIONS_DB_PATH      = os.path.join(DATA_DIR, "sessions.db")
+SESSION_TTL_SECONDS   = float(os.environ.get("SESSION_TTL_SECONDS", str(30*24*3600)))
+SESSION_MAX           = int(os.environ.get("SESSION_MAX", "50000"))
+SESSION_SWEEP_SECONDS = float(os.environ.get("SESSION_SWEEP_SECONDS", "600"))
+
+# Owner digest e-mail: one leader at a time (flock on the shared volume) sends every
+# mirror row past the persisted watermark, every DIGEST_INTERVAL_SECONDS
+ENABLE_DIGEST           = os.environ.get("ENABLE_DIGEST", "0") == "1"  # run the engine inside the web workers too
+DIGEST_INTERVAL_SECONDS = float(os.environ.get("DIGEST_INTERVAL_SECONDS", str(6*3600)))
+DIGEST_LOCK_PATH        = os.path.join(DATA_DIR, "locks", "digest.lock")
+
+# Lead alerts: new enquiries are mailed in micro-batches of LEAD_ALERT_BATCH rows or after
+# LEAD_ALERT_SECONDS, whichever comes first; repeat taps (same wa_id + unit) inside
+# LEAD_ALERT_DEDUPE_SECONDS are left to the digest (opt in with LEAD_ALERTS=1)
+LEAD_ALERTS               = os.environ.get("LEAD_ALERTS", "0") == "1"
+LEAD_ALERT_BATCH          = int(os.environ.get("LEAD_ALERT_BATCH", "5"))
+LEAD_ALERT_SECONDS        = float(os.environ.get("LEAD_ALERT_SECONDS", "120"))
+LEAD_ALERT_DEDUPE_SECONDS = float(os.environ.get("LEAD_ALERT_DEDUPE_SECONDS", "3600"))
+LEAD_ALERT_LOCK_PATH      = os.path.join(DATA_DIR, "locks", "alerts.lock")
 
-def init_logging():
-    os.makedirs(LOG_DIR, exist_ok=True)
-    fmt = logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
-    root = logging.getLogger()
-    root.setLevel(logging.INFO)
-
-    # stdout handler
-    sh = logging.StreamHandler()
-    sh.setFormatter(fmt)
-    root.addHandler(sh)
-
-    # rotating file
-    fh = RotatingFileHandler(os.path.join(LOG_DIR, "app.log"), maxBytes=10_000_000, backupCount=5)
-    fh.setFormatter(fmt)
-    root.addHandler(fh)
+# Logging: LOG_FORMAT json|text; LOG_PAYLOADS off|redact|full, kept for LOG_PAYLOAD_SAMPLE of requests
+LOG_LEVEL          = os.environ.get("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT         = os.environ.get("LOG_FORMAT", "json").strip().lower()
+LOG_PAYLOADS       = os.environ.get("LOG_PAYLOADS", "redact").strip().lower()
+LOG_PAYLOAD_SAMPLE = float(os.environ.get("LOG_PAYLOAD_SAMPLE", "0.01"))
 
 def warn_if_missing_secrets():
     if not WHATSAPP_TOKEN or not PHONE_NUMBER_ID:
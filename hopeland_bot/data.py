@@ -1,5 +1,13 @@
 # hopeland_bot/data.py
-from typing import Dict, List
+import os
+import json
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+from .config import CATALOG_PATH
+from .utils import clip
+from .search import SearchIndex
 
 # Your listings (same content you shared; mix of with/without photos is fine)
 LISTINGS: Dict[str, List[dict]] = {
@@ -90,9 +98,163 @@ LISTINGS: Dict[str, List[dict]] = {
     ]
 }
 
+# Category metadata used for menus; a catalog file may override or extend it.
+CATEGORIES: Dict[str, dict] = {
+    "1bhk":   {"title": "1BHK",   "description": "Spacious 1-bedroom units"},
+    "studio": {"title": "Studio", "description": "Affordable studio options"},
+}
+
+CATEGORY_INTRO = ("Welcome to *HOPELAND Real Estates*.\n"
+                  "Muither, Qatar — quality units in a well-kept villa.\n\n"
+                  "What are you looking for today?")
+
+class _Snapshot:
+    # Immutable view of one catalog version; payload dicts are shared, never mutate them.
+    def __init__(self, listings: Dict[str, List[dict]], categories: Dict[str, dict], mtime: Optional[float], version: int):
+        self.listings = listings
+        self.mtime = mtime
+        self.version = version
+        self.categories = {k: {"title": (categories.get(k) or {}).get("title") or k.upper(),
+                               "description": (categories.get(k) or {}).get("description") or ""}
+                           for k in listings}
+        self.by_id: Dict[str, dict] = {}
+        self.category_of: Dict[str, str] = {}
+        for key, items in listings.items():
+            for item in items:
+                self.by_id.setdefault(item.get("id"), item)
+                self.category_of.setdefault(item.get("id"), key)
+        self.category_payload = {
+            "messaging_product":"whatsapp","type":"interactive",
+            "interactive":{"type":"list","body":{"text":CATEGORY_INTRO},
+                "action":{"button":"Browse","sections":[{
+                    "title":"Select a category",
+                    "rows":[{"id":f"cat_{k}","title":clip(c["title"], 24),"description":clip(c["description"], 72)}
+                            for k, c in self.categories.items()]}]}}}
+        names = [c["title"] for c in self.categories.values()]
+        self.category_fallback = ("Categories:\n" + "\n".join(f"• {n}" for n in names) + "\n"
+                                  "Type " + " or ".join(f"*{n}*" for n in names) + " to continue.")
+        self.rows: Dict[str, dict] = {}  # listing id -> list row, shared by category menus and search results
+        for key, items in listings.items():
+            for it in items:
+                self.rows.setdefault(it["id"], {"id": f"listing_{it['id']}",
+                                                "title": clip(f"{it['id']} {self.categories[key]['title']}", 24),
+                                                "description": clip(f"{it['title']} — {it['desc']}", 72)})
+        self.search_index = SearchIndex(
+            (it["id"], {"id": it["id"], "title": it.get("title", ""), "desc": it.get("desc", ""),
+                        "category": f"{key} {self.categories[key]['title']}"})
+            for key, items in listings.items() for it in items)
+        self.list_payloads: Dict[str, dict] = {}
+        self.list_fallbacks: Dict[str, str] = {}
+        for key, items in listings.items():
+            cat_title = self.categories[key]["title"]
+            rows = [self.rows[it["id"]] for it in items]
+            self.list_payloads[key] = {
+                "messaging_product":"whatsapp","type":"interactive",
+                "interactive":{"type":"list","body":{"text":f"We have the following listings for *{cat_title}*. Select an option to see photos."},
+                    "action":{"button":"View options","sections":[{
+                        "title": clip(f"{cat_title} Muither Villa", 24), "rows": rows }]}}}
+            lines = [f"{cat_title} listings:"]
+            lines += [f"• {it['id']} — {clip(it['title'], 32)}" for it in items]
+            lines.append("Reply with the code (e.g., R101) to receive photos.")
+            self.list_fallbacks[key] = "\n".join(lines)
+
+def _read_catalog_file(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yml", ".yaml")):
+            import yaml  # optional; only needed for YAML catalogs
+            raw = yaml.safe_load(f)
+        else:
+            raw = json.load(f)
+    if not isinstance(raw, dict):
+        raise ValueError("catalog must be a mapping")
+    # Either {"categories": {...}, "listings": {...}} or the plain LISTINGS shape.
+    if isinstance(raw.get("listings"), dict):
+        return raw["listings"], {**CATEGORIES, **(raw.get("categories") or {})}
+    return raw, CATEGORIES
+
+class Catalog:
+    # Listing index and pre-built menu payloads, hot-reloaded when the catalog file changes.
+    def __init__(self, path: str = CATALOG_PATH, check_interval: float = 2.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._snap = _Snapshot(LISTINGS, CATEGORIES, None, 0)
+        self._maybe_reload(force=True)
+
+    def _maybe_reload(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._checked < self.check_interval: return
+        with self._lock:
+            self._checked = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                return  # no catalog file: keep what we have (built-in LISTINGS by default)
+            if mtime == self._snap.mtime: return
+            try:
+                listings, categories = _read_catalog_file(self.path)
+                snap = _Snapshot(listings, categories, mtime, self._snap.version + 1)
+            except Exception as e:
+                logging.exception("Catalog reload from %s failed; keeping version %d: %s", self.path, self._snap.version, e)
+                return
+            self._snap = snap
+            logging.info("Catalog v%d loaded from %s (%d listings).", snap.version, self.path, len(snap.by_id))
+
+    def snapshot(self) -> _Snapshot:
+        self._maybe_reload()
+        return self._snap
+
+    @property
+    def version(self) -> int:
+        return self.snapshot().version
+
+    def find(self, listing_id: str) -> Optional[dict]:
+        return self.snapshot().by_id.get(listing_id)
+
+    def category_of(self, listing_id: str) -> Optional[str]:
+        return self.snapshot().category_of.get(listing_id)
+
+    def has_category(self, key: str) -> bool:
+        return key in self.snapshot().listings
+
+    def listings(self) -> Dict[str, List[dict]]:
+        return self.snapshot().listings
+
+    def category_title(self, key: str) -> str:
+        return self.snapshot().categories[key]["title"]
+
+    def category_payload(self, to: str) -> dict:
+        return {**self.snapshot().category_payload, "to": to}
+
+    def category_fallback(self) -> str:
+        return self.snapshot().category_fallback
+
+    def listings_payload(self, to: str, key: str) -> dict:
+        return {**self.snapshot().list_payloads[key], "to": to}
+
+    def listings_fallback(self, key: str) -> str:
+        return self.snapshot().list_fallbacks[key]
+
+    def search(self, text: str, limit: int = 5) -> List[str]:
+        # Listing ids best-first; the index is rebuilt with each catalog version.
+        return [listing_id for listing_id, _ in self.snapshot().search_index.search(text, limit)]
+
+    def search_payload(self, to: str, listing_ids: List[str]) -> dict:
+        snap = self.snapshot()
+        rows = [snap.rows[i] for i in listing_ids if i in snap.rows]
+        return {"messaging_product":"whatsapp","to":to,"type":"interactive",
+                "interactive":{"type":"list","body":{"text":f"Found {len(rows)} matching unit{'s' if len(rows) != 1 else ''}. Select one to see photos."},
+                    "action":{"button":"View matches","sections":[{"title":"Matching units","rows":rows}]}}}
+
+    def search_fallback(self, listing_ids: List[str]) -> str:
+        snap = self.snapshot()
+        lines = ["Matching units:"]
+        lines += [f"• {i} — {clip(snap.by_id[i]['title'], 32)}" for i in listing_ids if i in snap.by_id]
+        lines.append("Reply with the code (e.g., R101) to receive photos, or type *menu* for all categories.")
+        return "\n".join(lines)
+
+CATALOG = Catalog()
+
 def find_listing(listing_id: str):
-    for cat in LISTINGS.values():
-        for item in cat:
-            if item.get("id") == listing_id:
-                return item
-    return None
+    return CATALOG.find(listing_id)
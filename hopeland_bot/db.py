@@ -0,0 +1,48 @@
+# hopeland_bot/db.py
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Tuple
+
+_local = threading.local()
+_READY = set()  # (pid, path, schema) already applied; modules may share one file
+_READY_LOCK = threading.Lock()
+
+def connect(path: str, schema: str = "") -> sqlite3.Connection:
+    # One connection per (process, thread, file): sqlite handles must not cross a fork.
+    conns: Dict[Tuple[int, str], sqlite3.Connection] = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    key = (os.getpid(), path)
+    conn = conns.get(key)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conns[key] = conn
+    ready = key + (schema,)
+    if ready not in _READY:
+        # journal_mode and the schema persist in the file; do them once, not per thread
+        with _READY_LOCK:
+            if ready not in _READY:
+                conn.execute("PRAGMA journal_mode=WAL")
+                if schema: conn.executescript(schema)
+                _READY.add(ready)
+    return conn
+
+def close_connections():
+    # Drop this thread's handles, e.g. in the gunicorn master before it forks workers.
+    for conn in (getattr(_local, "conns", None) or {}).values():
+        conn.close()
+    _local.conns = {}
+
+@contextmanager
+def transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,67 @@
+# hopeland_bot/dedupe.py
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict
+from .config import DEDUPE_DB_PATH, DEDUPE_TTL_SECONDS, DEDUPE_LOCAL_MAX
+from .db import connect
+from .metrics import register_collector
+
+# Inbound message ids already handled. SQLite is the source of truth shared by all
+# workers; the bounded LRU in front only saves a query for redeliveries we saw here.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS seen (
+    msg_id TEXT PRIMARY KEY,
+    ts     REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS seen_ts ON seen(ts);
+"""
+
+_LOCAL: "OrderedDict[str, float]" = OrderedDict()
+_LOCK = threading.Lock()
+_COUNTS: Dict[str, int] = {"hits": 0, "misses": 0}
+_LAST_PURGE = [0.0]
+
+def _conn():
+    return connect(DEDUPE_DB_PATH, _SCHEMA)
+
+def _remember(msg_id: str, ts: float):
+    with _LOCK:
+        _LOCAL[msg_id] = ts
+        _LOCAL.move_to_end(msg_id)
+        while len(_LOCAL) > DEDUPE_LOCAL_MAX:
+            _LOCAL.popitem(last=False)
+
+def _count(key: str):
+    with _LOCK:
+        _COUNTS[key] += 1
+
+def _purge(now: float):
+    if now - _LAST_PURGE[0] < 300: return
+    _LAST_PURGE[0] = now
+    _conn().execute("DELETE FROM seen WHERE ts < ?", (now - DEDUPE_TTL_SECONDS,))
+
+def first_seen(msg_id: str) -> bool:
+    # True exactly once per message id (within the TTL) across all workers.
+    now = time.time()
+    with _LOCK:
+        ts = _LOCAL.get(msg_id)
+    if ts is not None and now - ts < DEDUPE_TTL_SECONDS:
+        _count("hits"); return False
+    conn = _conn()
+    claimed = conn.execute("INSERT OR IGNORE INTO seen (msg_id, ts) VALUES (?,?)", (msg_id, now)).rowcount == 1
+    if not claimed:
+        # An expired entry that the purge has not removed yet counts as new.
+        claimed = conn.execute("UPDATE seen SET ts=? WHERE msg_id=? AND ts < ?",
+                               (now, msg_id, now - DEDUPE_TTL_SECONDS)).rowcount == 1
+    _remember(msg_id, now)
+    _purge(now)
+    _count("misses" if claimed else "hits")
+    return claimed
+
+def stats() -> Dict[str, int]:
+    with _LOCK:
+        return {**_COUNTS, "local_entries": len(_LOCAL)}
+
+register_collector(lambda: [("dedupe_hits_total", "counter", {}, _COUNTS["hits"]),
+                            ("dedupe_misses_total", "counter", {}, _COUNTS["misses"])])
@@ -0,0 +1,139 @@
+# hopeland_bot/delivery.py
+import time
+import logging
+from typing import Dict, List, Optional
+from .config import DELIVERY_DB_PATH, DELIVERY_TTL_SECONDS
+from .db import connect, transaction
+from .graph import THROTTLE_CODES
+from .metrics import inc, observe
+from .ratelimit import limiter
+
+# One row per outbound message id (wamid), written when the Graph API accepts the send
+# and folded forward by the `statuses` callbacks. Callbacks may arrive late, twice or out
+# of order, so each timestamp is only set once and the status never moves backwards.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sends (
+    wamid        TEXT PRIMARY KEY,
+    wa_id        TEXT,
+    kind         TEXT,
+    first_seen   REAL NOT NULL,
+    accepted_at  REAL,
+    sent_at      REAL,
+    delivered_at REAL,
+    read_at      REAL,
+    failed_at    REAL,
+    error_code   INTEGER,
+    status       TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS sends_seen ON sends(first_seen);
+"""
+
+RANK = {"accepted": 0, "sent": 1, "delivered": 2, "read": 3, "failed": 4}
+FIELD = {"sent": "sent_at", "delivered": "delivered_at", "read": "read_at", "failed": "failed_at"}
+COLUMNS = ("wamid", "wa_id", "kind", "first_seen", "accepted_at", "sent_at", "delivered_at", "read_at", "failed_at", "error_code", "status")
+# Failures worth sending again later; the throttle codes also slow the rate limiter down.
+RETRYABLE_CODES = set(THROTTLE_CODES) | {131000, 131016}
+
+def _conn():
+    return connect(DELIVERY_DB_PATH, _SCHEMA)
+
+def wamid_of(body: dict) -> Optional[str]:
+    try: return (body.get("messages") or [{}])[0].get("id")
+    except (AttributeError, IndexError): return None
+
+_last_gc = 0.0
+
+def record_send(wamid: Optional[str], wa_id: Optional[str], kind: Optional[str]):
+    # Called once per accepted /messages POST; never fails the send itself.
+    global _last_gc
+    if not wamid: return
+    now = time.time()
+    try:
+        # a fast callback may have created the row already; keep its status
+        _conn().execute("INSERT INTO sends (wamid, wa_id, kind, first_seen, accepted_at, status) VALUES (?,?,?,?,?,'accepted') "
+                        "ON CONFLICT(wamid) DO UPDATE SET wa_id=excluded.wa_id, kind=excluded.kind, "
+                        "accepted_at=excluded.accepted_at, first_seen=MIN(first_seen, excluded.first_seen)",
+                        (wamid, wa_id, kind, now, now))
+        if now - _last_gc > 600:
+            _last_gc = now
+            _conn().execute("DELETE FROM sends WHERE first_seen < ?", (now - DELIVERY_TTL_SECONDS,))
+    except Exception as e:
+        logging.exception("Recording send %s failed: %s", wamid, e)
+
+def _ts(st: dict) -> float:
+    try: return float(st.get("timestamp"))
+    except (TypeError, ValueError): return time.time()
+
+def ingest(statuses: List[dict]) -> int:
+    # One transaction per webhook; returns how many status events changed a row.
+    events = [s for s in statuses if isinstance(s, dict) and s.get("id") and s.get("status") in FIELD]
+    if not events: return 0
+    changed, throttled = [], False
+    with transaction(_conn()) as conn:
+        ids = list({s["id"] for s in events})
+        rows = {r[0]: dict(zip(COLUMNS, r)) for r in conn.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM sends WHERE wamid IN ({','.join('?' * len(ids))})", ids)}
+        for st in sorted(events, key=_ts):
+            status, ts = st["status"], _ts(st)
+            row = rows.get(st["id"])
+            if row is None:  # not sent by this deployment, or sent before this store existed
+                row = rows[st["id"]] = dict.fromkeys(COLUMNS)
+                row.update(wamid=st["id"], wa_id=st.get("recipient_id"), first_seen=ts, status="accepted")
+            field = FIELD[status]
+            if row[field] is not None: continue  # redelivered callback
+            row[field] = ts
+            if RANK[status] > RANK[row["status"]]: row["status"] = status
+            changed.append(row["wamid"])
+            inc("wa_statuses_total", status=status)
+            start = row["accepted_at"] or row["sent_at"]
+            if status == "delivered" and start is not None:
+                observe("wa_delivery_seconds", max(0.0, ts - start))
+            elif status == "failed":
+                code = ((st.get("errors") or [{}])[0] or {}).get("code")
+                row["error_code"] = code
+                inc("wa_delivery_failures_total", code=code, retryable=code in RETRYABLE_CODES)
+                throttled = throttled or code in THROTTLE_CODES
+                logging.warning("Message %s failed (code %s)", row["wamid"], code,
+                                extra={"wa_id": row["wa_id"], "msg_id": row["wamid"], "status": code})
+        if changed:
+            conn.executemany(f"INSERT OR REPLACE INTO sends ({', '.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))})",
+                             [tuple(rows[w][c] for c in COLUMNS) for w in set(changed)])
+    if throttled:
+        limiter().on_throttled()  # Meta throttled us after accepting the send
+    return len(changed)
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    if not values: return None
+    return round(values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))], 3)
+
+def _summary(values: List[float]) -> dict:
+    values.sort()
+    return {"count": len(values), **{f"p{p}": _pct(values, p) for p in (50, 90, 99)}, "max": _pct(values, 100)}
+
+def stats(ts_from: float, ts_to: Optional[float] = None) -> dict:
+    # Messages first seen in [ts_from, ts_to): status counts and latency percentiles (seconds).
+    rows = _conn().execute("SELECT status, COALESCE(accepted_at, sent_at), delivered_at, read_at FROM sends "
+                           "WHERE first_seen >= ? AND first_seen < ?", (ts_from, ts_to or float("inf"))).fetchall()
+    by_status: Dict[str, int] = {}
+    to_delivered, to_read = [], []
+    for status, sent, delivered, read in rows:
+        by_status[status] = by_status.get(status, 0) + 1
+        if sent is not None and delivered is not None: to_delivered.append(max(0.0, delivered - sent))
+        if delivered is not None and read is not None: to_read.append(max(0.0, read - delivered))
+    return {"messages": len(rows), "by_status": by_status,
+            "send_to_delivered_s": _summary(to_delivered), "delivered_to_read_s": _summary(to_read)}
+
+def failures(ts_from: float, ts_to: Optional[float] = None, retryable_only: bool = False, limit: int = 100) -> List[dict]:
+    rows = _conn().execute(f"SELECT {', '.join(COLUMNS)} FROM sends WHERE status='failed' AND first_seen >= ? "
+                           "AND first_seen < ? ORDER BY first_seen DESC", (ts_from, ts_to or float("inf")))
+    out = []
+    for r in rows:
+        row = dict(zip(COLUMNS, r)); row["retryable"] = row["error_code"] in RETRYABLE_CODES
+        if retryable_only and not row["retryable"]: continue
+        out.append(row)
+        if len(out) >= limit: break
+    return out
+
+def lookup(wamid: str) -> Optional[dict]:
+    r = _conn().execute(f"SELECT {', '.join(COLUMNS)} FROM sends WHERE wamid=?", (wamid,)).fetchone()
+    return dict(zip(COLUMNS, r)) if r else None
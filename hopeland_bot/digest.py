@@ -1,8 +1,22 @@
-import logging, time, os
-from .sheets import get_rows_since, spreadsheet_url
-from .emailer import send_email
+import os, time, logging, threading
+from datetime import datetime, timezone
+from .config import ENABLE_DIGEST, DIGEST_INTERVAL_SECONDS, DIGEST_LOCK_PATH
+from .sheets import HEADERS, spreadsheet_url
+from .emailer import send_email, outcome
+from .metrics import timed
+from .utils import leader_lock
+from . import enquiries
 
-def _render_html(rows):
+# Single digest engine for the compose `digest` service (digest_main.py) and
+# (ENABLE_DIGEST=1) the web workers. Whoever holds the flock on the shared volume sends
+# the mirror rows past the persisted watermark. The watermark only moves once the SMTP
+# outbox reports the mail as sent; a dropped digest's rows go into the next one.
+WATERMARK    = "digest_last_id"
+SENT_AT      = "digest_sent_at"
+PENDING_MAIL = "digest_pending_mail"  # mail outbox id of the last queued digest, 0 once settled
+PENDING_UPTO = "digest_pending_upto"  # watermark to apply when that mail is sent
+
+def render_html(rows):
     if not rows: return "<p>No enquiries in this window.</p>"
     head = ["Timestamp Local","WA Number","WA Name","Category","Unit ID","Title","Reviewed"]
     th = "".join(f"<th style='text-align:left;padding:6px;border-bottom:1px solid #ccc'>{h}</th>" for h in head)
@@ -12,22 +26,85 @@ def _render_html(rows):
         trs.append("<tr>"+tds+"</tr>")
     return f"<table cellspacing='0' cellpadding='0'><tr>{th}</tr>{''.join(trs)}</table>"
 
-def _render_text(rows):
+def render_text(rows):
     if not rows: return "No enquiries in this window."
     return "\n".join(f"{r.get('Timestamp Local','')} | {r.get('WA Number','')} | {r.get('Unit ID','')} | {r.get('Title','')}" for r in rows)
 
-def send_digest_once():
-    rows = get_rows_since(6) or []
+def _watermark() -> int:
+    wm = enquiries.get_cursor(WATERMARK)
+    if wm is None:
+        # First run on this volume: start one interval back, not at the beginning of history.
+        wm = enquiries.last_id_before(time.time() - DIGEST_INTERVAL_SECONDS)
+        enquiries.set_cursor(WATERMARK, wm)
+    return int(wm)
+
+def _window_label(sent_at) -> str:
+    if sent_at: return "since " + datetime.fromtimestamp(sent_at, timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+    return f"last {DIGEST_INTERVAL_SECONDS / 3600:g} hours"
+
+def _settle_previous() -> bool:
+    # False while the previous digest is still waiting in the mail outbox.
+    mail_id = int(enquiries.get_cursor(PENDING_MAIL) or 0)
+    if not mail_id: return True
+    sent = outcome(mail_id)
+    if sent is None: return False
+    if sent: enquiries.set_cursor(WATERMARK, enquiries.get_cursor(PENDING_UPTO))
+    else: logging.warning("Digest mail %d was dropped; its rows go into the next digest.", mail_id)
+    enquiries.set_cursor(PENDING_MAIL, 0)
+    return True
+
+@timed("digest")
+def _send_pending() -> bool:
+    if not _settle_previous():
+        logging.info("Previous digest is still in the mail outbox; not sending another yet.")
+        return False
+    wm = _watermark()
+    items = enquiries.rows_after(wm)
+    rows = [dict(zip(HEADERS, r)) for _, _, r in reversed(items)]  # newest first
+    window = _window_label(enquiries.get_cursor(SENT_AT))
     url  = spreadsheet_url() or "(sheet not available)"
-    subject = f"HOPELAND WhatsApp enquiries — last 6 hours ({len(rows)})"
-    html = f"<p>Here are the enquiries from the last 6 hours.</p><p>Sheet: <a href='{url}'>{url}</a></p>{_render_html(rows)}"
-    text = f"Sheet: {url}\n\n{_render_text(rows)}"
-    ok = send_email(subject, text, html)
-    if ok: logging.info("6h digest sent (%d rows).", len(rows))
-    else:  logging.warning("6h digest failed or SMTP not configured.")
-
-def loop_every_6h():
+    subject = f"HOPELAND WhatsApp enquiries — {window} ({len(rows)})"
+    html = f"<p>Here are the enquiries {window}.</p><p>Sheet: <a href='{url}'>{url}</a></p>{render_html(rows)}"
+    text = f"Sheet: {url}\n\n{render_text(rows)}"
+    mail_id = send_email(subject, text, html)
+    if not mail_id:
+        logging.warning("Digest failed or SMTP not configured; watermark stays at %d.", wm)
+        return False
+    enquiries.set_cursor(PENDING_UPTO, items[-1][0] if items else wm)
+    enquiries.set_cursor(PENDING_MAIL, mail_id)
+    enquiries.set_cursor(SENT_AT, time.time())
+    logging.info("Digest queued (%d rows).", len(rows), extra={"count": len(rows)})
+    return True
+
+def send_digest_once() -> bool:
+    # Manual trigger; skipped if another process is sending a digest right now.
+    with leader_lock(DIGEST_LOCK_PATH) as leader:
+        if not leader:
+            logging.info("Digest already running in another process; skipped.")
+            return False
+        return _send_pending()
+
+def run_digest_loop(poll_seconds: float = 60.0):
+    retry_at = 0.0
     while True:
-        try: send_digest_once()
-        except Exception as e: logging.exception("Digest loop error: %s", e)
-        time.sleep(6*60*60)
+        try:
+            with leader_lock(DIGEST_LOCK_PATH) as leader:
+                now = time.time()
+                # Cadence comes from the persisted send time, so restarts neither skip nor repeat a digest.
+                if leader and now >= retry_at and now >= (enquiries.get_cursor(SENT_AT) or 0) + DIGEST_INTERVAL_SECONDS:
+                    if not _send_pending(): retry_at = now + min(DIGEST_INTERVAL_SECONDS, 900)
+        except Exception as e:
+            logging.exception("Digest loop error: %s", e)
+        time.sleep(min(poll_seconds, DIGEST_INTERVAL_SECONDS))
+
+loop_every_6h = run_digest_loop  # old compose entry point
+
+_STARTED = set()  # pids
+
+def start_digest():
+    if not ENABLE_DIGEST or os.getpid() in _STARTED: return None
+    _STARTED.add(os.getpid())
+    t = threading.Thread(target=run_digest_loop, name="digest", daemon=True)
+    t.start()
+    logging.info("Digest engine started (every %gs, leader via %s).", DIGEST_INTERVAL_SECONDS, DIGEST_LOCK_PATH)
+    return t
@@ -1,38 +1,193 @@
 # hopeland_bot/emailer.py
 import os
+import time
+import random
+import socket
 import smtplib
 import logging
+import threading
 from email.message import EmailMessage
-from typing import List
+from typing import Optional
+from .config import MAIL_OUTBOX_PATH
+from .db import connect, transaction
+from .metrics import timed, inc, register_collector
 
 SMTP_HOST = os.environ.get("EMAIL_SMTP_HOST", "")
 SMTP_PORT = int(os.environ.get("EMAIL_SMTP_PORT", "587"))
 SMTP_USER = os.environ.get("EMAIL_USERNAME", "")
 SMTP_PASS = os.environ.get("EMAIL_PASSWORD", "")
+SMTP_STARTTLS = os.environ.get("EMAIL_SMTP_STARTTLS", "1") == "1"
 EMAIL_FROM = os.environ.get("EMAIL_FROM", SMTP_USER)
 OWNERS_EMAILS = [e.strip() for e in os.environ.get("OWNERS_EMAILS", "").split(",") if e.strip()]
 
+# Outgoing mail queue: send_email() only persists the message; one sender thread per
+# process delivers over a reused, authenticated SMTP connection with retries.
+MAIL_MAX_ATTEMPTS  = int(os.environ.get("MAIL_MAX_ATTEMPTS", "8"))
+MAIL_BACKOFF_BASE  = float(os.environ.get("MAIL_BACKOFF_BASE", "30"))
+MAIL_BACKOFF_MAX   = float(os.environ.get("MAIL_BACKOFF_MAX", "3600"))
+MAIL_LEASE_SECONDS = float(os.environ.get("MAIL_LEASE_SECONDS", "120"))
+SMTP_IDLE_SECONDS  = float(os.environ.get("SMTP_IDLE_SECONDS", "120"))  # close the connection after this
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS mail (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject     TEXT NOT NULL,
+    text        TEXT NOT NULL,
+    html        TEXT NOT NULL DEFAULT '',
+    created     REAL NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    not_before  REAL NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS mail_done (
+    id INTEGER PRIMARY KEY,  -- mail.id
+    ok INTEGER NOT NULL,     -- 1 sent, 0 dropped after MAIL_MAX_ATTEMPTS
+    at REAL NOT NULL
+);
+"""
+MAIL_DONE_KEEP_SECONDS = 30*24*3600
+
 def _smtp_ok() -> bool:
     return all([SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, EMAIL_FROM, OWNERS_EMAILS])
 
-def send_email(subject: str, text: str, html: str = "") -> bool:
+def _conn():
+    return connect(MAIL_OUTBOX_PATH, _SCHEMA)
+
+def send_email(subject: str, text: str, html: str = "") -> int:
+    # Id of the queued message (0 if not queued); delivery happens on the sender thread,
+    # outcome(id) tells how it ended.
     if not _smtp_ok():
         logging.warning("SMTP not configured; skip email.")
-        return False
+        return 0
+    mail_id = _conn().execute("INSERT INTO mail (subject, text, html, created) VALUES (?,?,?,?)",
+                              (subject, text, html or "", time.time())).lastrowid
+    start_mail_sender(); _WAKE.set()
+    return mail_id
+
+def outcome(mail_id: int) -> Optional[bool]:
+    # None while queued, True once sent; False if dropped (or unknown to this mail.db).
+    conn = _conn()
+    if conn.execute("SELECT 1 FROM mail WHERE id=?", (mail_id,)).fetchone(): return None
+    row = conn.execute("SELECT ok FROM mail_done WHERE id=?", (mail_id,)).fetchone()
+    return bool(row and row[0])
+
+def _finish(mail_id: int, ok: bool):
+    now = time.time()
+    with transaction(_conn()) as conn:
+        conn.execute("DELETE FROM mail WHERE id=?", (mail_id,))
+        conn.execute("INSERT OR REPLACE INTO mail_done (id, ok, at) VALUES (?,?,?)", (mail_id, int(ok), now))
+        conn.execute("DELETE FROM mail_done WHERE at < ?", (now - MAIL_DONE_KEEP_SECONDS,))
+
+def pending() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM mail").fetchone()[0]
+
+def _claim(owner: str) -> Optional[tuple]:
+    now = time.time()
+    with transaction(_conn()) as conn:
+        row = conn.execute("SELECT id, subject, text, html, attempts FROM mail "
+                           "WHERE not_before <= ? AND lease_until <= ? ORDER BY id LIMIT 1", (now, now)).fetchone()
+        if row:
+            conn.execute("UPDATE mail SET lease_owner=?, lease_until=? WHERE id=?",
+                         (owner, now + MAIL_LEASE_SECONDS, row[0]))
+    return row
+
+def _build(subject: str, text: str, html: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = EMAIL_FROM
+    msg["To"] = ", ".join(OWNERS_EMAILS)
+    msg.set_content(text)
+    if html:
+        msg.add_alternative(html, subtype="html")
+    return msg
+
+class _Connection:
+    # One logged-in SMTP session, reopened after errors or SMTP_IDLE_SECONDS of silence.
+    def __init__(self):
+        self.smtp: Optional[smtplib.SMTP] = None
+        self.last_used = 0.0
+
+    def get(self) -> smtplib.SMTP:
+        if self.smtp is not None and time.monotonic() - self.last_used > 30:
+            try: self.smtp.noop()
+            except (smtplib.SMTPException, OSError): self.close()
+        if self.smtp is None:
+            s = smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30)
+            try:
+                if SMTP_STARTTLS: s.starttls()
+                s.login(SMTP_USER, SMTP_PASS)
+            except Exception:
+                s.close(); raise
+            self.smtp = s
+            inc("smtp_connections_total")
+        return self.smtp
+
+    def close(self):
+        if self.smtp is None: return
+        try: self.smtp.quit()
+        except Exception: pass
+        self.smtp = None
+
+    def close_if_idle(self):
+        if self.smtp is not None and time.monotonic() - self.last_used > SMTP_IDLE_SECONDS:
+            self.close()
+
+@timed("smtp", dep="smtp")
+def _deliver(conn: _Connection, msg: EmailMessage) -> bool:
+    conn.get().send_message(msg)
+    conn.last_used = time.monotonic()
+    return True
+
+def _send_one(conn: _Connection, owner: str) -> bool:
+    row = _claim(owner)
+    if not row: return False
+    mail_id, subject, text, html, attempts = row
+    try:
+        _deliver(conn, _build(subject, text, html))
+        _finish(mail_id, True)
+        inc("mail_sent_total")
+    except Exception as e:
+        conn.close()
+        if attempts + 1 >= MAIL_MAX_ATTEMPTS:
+            logging.exception("Email dropped after %d attempts (%s): %s", attempts + 1, subject, e)
+            _finish(mail_id, False)
+            inc("mail_dropped_total")
+        else:
+            delay = random.uniform(0, min(MAIL_BACKOFF_MAX, MAIL_BACKOFF_BASE * (2 ** attempts)))
+            logging.warning("Email send failed (attempt %d, retry in %.0fs): %s", attempts + 1, delay, e)
+            _conn().execute("UPDATE mail SET attempts=attempts+1, not_before=?, lease_owner=NULL, lease_until=0 "
+                            "WHERE id=?", (time.time() + delay, mail_id))
+    return True
+
+_WAKE = threading.Event()
+_SENDERS = set()  # pids
+_SENDERS_LOCK = threading.Lock()
+
+def _sender_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    conn = _Connection()
+    while True:
+        try:
+            _WAKE.clear()
+            if _send_one(conn, owner): continue
+            conn.close_if_idle()
+        except Exception as e:
+            logging.exception("Mail sender error: %s", e)
+        _WAKE.wait(5.0)
+
+def start_mail_sender():
+    # Started by the first send_email() in a process, or at startup when mail is still queued.
+    if os.getpid() in _SENDERS: return
+    with _SENDERS_LOCK:
+        if os.getpid() in _SENDERS: return
+        _SENDERS.add(os.getpid())
+        threading.Thread(target=_sender_loop, name="mail-sender", daemon=True).start()
+
+def resume_mail_sender():
     try:
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = EMAIL_FROM
-        msg["To"] = ", ".join(OWNERS_EMAILS)
-        msg.set_content(text)
-        if html:
-            msg.add_alternative(html, subtype="html")
-
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as s:
-            s.starttls()
-            s.login(SMTP_USER, SMTP_PASS)
-            s.send_message(msg)
-        return True
+        if pending(): start_mail_sender()
     except Exception as e:
-        logging.exception("Email send failed: %s", e)
-        return False
+        logging.exception("Mail outbox check failed: %s", e)
+
+register_collector(lambda: [("mail_queue_depth", "gauge", {}, pending())])
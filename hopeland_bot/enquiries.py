@@ -0,0 +1,131 @@
+# hopeland_bot/enquiries.py
+import json
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from .config import ENQUIRIES_DB_PATH
+from .db import connect, transaction
+
+# Write-ahead spool for enquiry rows. A row stays here until a flusher has
+# pushed it to the sheet; a crash between push and ack re-sends it (at-least-once).
+# `enquiries` is the local mirror of the sheet, indexed on UTC time for digests.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spool (
+    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+    row         TEXT NOT NULL,
+    created     REAL NOT NULL,
+    lease_owner TEXT,
+    lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS enquiries (
+    id      INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_utc  REAL NOT NULL,
+    row_key TEXT NOT NULL UNIQUE,
+    row     TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS enquiries_ts ON enquiries(ts_utc);
+CREATE TABLE IF NOT EXISTS partitions (
+    title       TEXT PRIMARY KEY,
+    ts_from     REAL,
+    ts_to       REAL,
+    rows        INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    name  TEXT PRIMARY KEY,
+    value REAL NOT NULL
+);
+"""
+
+def _conn():
+    return connect(ENQUIRIES_DB_PATH, _SCHEMA)
+
+def parse_ts(value: str) -> Optional[float]:
+    try:
+        dt = datetime.fromisoformat((value or "").replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return (dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)).timestamp()
+
+def _row_key(row: list) -> str:
+    # Timestamp UTC | WA Number | Unit ID
+    return f"{row[0]}|{row[2]}|{row[5]}"
+
+def spool_row(row: list) -> int:
+    body = json.dumps(row, ensure_ascii=False)
+    with transaction(_conn()) as conn:
+        cur = conn.execute("INSERT INTO spool (row, created) VALUES (?,?)", (body, time.time()))
+        conn.execute("INSERT OR IGNORE INTO enquiries (ts_utc, row_key, row) VALUES (?,?,?)",
+                     (parse_ts(row[0]) or time.time(), _row_key(row), body))
+    return cur.lastrowid
+
+def claim_batch(owner: str, limit: int, lease_seconds: float) -> List[Tuple[int, list]]:
+    now = time.time()
+    with transaction(_conn()) as conn:
+        rows = conn.execute("SELECT id, row FROM spool WHERE lease_until <= ? ORDER BY id LIMIT ?",
+                            (now, limit)).fetchall()
+        if rows:
+            conn.executemany("UPDATE spool SET lease_owner=?, lease_until=? WHERE id=?",
+                             [(owner, now + lease_seconds, r[0]) for r in rows])
+    return [(r[0], json.loads(r[1])) for r in rows]
+
+def ack(ids: List[int]):
+    with transaction(_conn()) as conn:
+        conn.executemany("DELETE FROM spool WHERE id=?", [(i,) for i in ids])
+
+def release(ids: List[int]):
+    with transaction(_conn()) as conn:
+        conn.executemany("UPDATE spool SET lease_owner=NULL, lease_until=0 WHERE id=?", [(i,) for i in ids])
+
+def pending() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+
+def rows_since(cutoff_ts: float, until_ts: Optional[float] = None) -> List[list]:
+    cur = _conn().execute("SELECT row FROM enquiries WHERE ts_utc >= ? AND ts_utc < ? ORDER BY ts_utc DESC, id DESC",
+                          (cutoff_ts, until_ts if until_ts is not None else float("inf")))
+    return [json.loads(r[0]) for r in cur]
+
+def rows_after(last_id: int, limit: int = 100000) -> List[Tuple[int, float, list]]:
+    # Mirror ids only grow, so "id > watermark" is every row a consumer has not seen yet,
+    # including older rows backfilled by reconcile.
+    cur = _conn().execute("SELECT id, ts_utc, row FROM enquiries WHERE id > ? ORDER BY id LIMIT ?",
+                          (last_id, limit))
+    return [(r[0], r[1], json.loads(r[2])) for r in cur]
+
+def last_id() -> int:
+    return _conn().execute("SELECT COALESCE(MAX(id), 0) FROM enquiries").fetchone()[0]
+
+def last_id_before(cutoff_ts: float) -> int:
+    row = _conn().execute("SELECT MAX(id) FROM enquiries WHERE ts_utc < ?", (cutoff_ts,)).fetchone()
+    return row[0] or 0
+
+def get_cursor(name: str) -> Optional[float]:
+    row = _conn().execute("SELECT value FROM cursors WHERE name=?", (name,)).fetchone()
+    return row[0] if row else None
+
+def set_cursor(name: str, value: float):
+    _conn().execute("INSERT INTO cursors (name, value) VALUES (?,?) "
+                    "ON CONFLICT(name) DO UPDATE SET value=excluded.value", (name, value))
+
+def add_partition(title: str, ts_from: Optional[float], ts_to: Optional[float], rows: int):
+    _conn().execute("INSERT OR REPLACE INTO partitions (title, ts_from, ts_to, rows, archived_at) VALUES (?,?,?,?,?)",
+                    (title, ts_from, ts_to, rows, time.time()))
+
+def partitions(ts_from: float = 0.0, ts_to: Optional[float] = None) -> List[dict]:
+    # Archived worksheets whose rows overlap [ts_from, ts_to), oldest first.
+    cur = _conn().execute("SELECT title, ts_from, ts_to, rows, archived_at FROM partitions "
+                          "WHERE COALESCE(ts_to, 0) >= ? AND COALESCE(ts_from, 0) < ? ORDER BY ts_from",
+                          (ts_from, ts_to if ts_to is not None else float("inf")))
+    return [dict(zip(("title", "ts_from", "ts_to", "rows", "archived_at"), r)) for r in cur]
+
+def upsert_rows(rows: List[list]) -> int:
+    # Backfill from the sheet; sheet values (e.g. "Reviewed") win over the mirror.
+    items = []
+    for row in rows:
+        ts = parse_ts(row[0]) if row else None
+        if ts is None or len(row) < 6: continue
+        items.append((ts, _row_key(row), json.dumps(row, ensure_ascii=False)))
+    with transaction(_conn()) as conn:
+        conn.executemany("INSERT INTO enquiries (ts_utc, row_key, row) VALUES (?,?,?) "
+                         "ON CONFLICT(row_key) DO UPDATE SET row=excluded.row", items)
+    return len(items)
@@ -0,0 +1,249 @@
+# hopeland_bot/graph.py
+import os
+import sys
+import time
+import asyncio
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from .metrics import register_collector
+from .ratelimit import RateLimiter, limiter as default_limiter
+from .config import (GRAPH_API_BASE, WHATSAPP_TOKEN, GRAPH_POOL_SIZE, GRAPH_MAX_RETRIES,
+                     GRAPH_BACKOFF_BASE, GRAPH_BACKOFF_MAX)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Graph error codes that mean "slow down" even when the HTTP status is not 429
+THROTTLE_CODES = {4, 80007, 130429, 131048, 131056}
+
+def _ok(r) -> bool:
+    return r.status_code < 400  # requests' Response.ok; httpx responses have no .ok
+
+def _is_throttled(r) -> bool:
+    if r.status_code == 429: return True
+    if _ok(r): return False
+    try:
+        return (r.json().get("error") or {}).get("code") in THROTTLE_CODES
+    except ValueError:
+        return False
+
+def _never_sent(e: requests.RequestException) -> bool:
+    # Connect timeouts and refused/unresolvable connections fail before the request is
+    # written; after that (read timeout, reset) Graph may already have the message.
+    if isinstance(e, requests.ConnectTimeout): return True
+    return isinstance(getattr(e.args[0] if e.args else None, "reason", None), NewConnectionError)
+
+def _httpx_never_sent(httpx, e: Exception) -> bool:
+    return isinstance(e, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+def maybe_delivered(e: Exception) -> bool:
+    # True when a POST failed after the request was written (read timeout, reset): Graph
+    # may have accepted it, so it must not be sent again.
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)): return not _never_sent(e)
+    httpx = sys.modules.get("httpx")
+    return bool(httpx) and isinstance(e, httpx.TransportError) and not _httpx_never_sent(httpx, e)
+
+def _retry_after(r) -> Optional[float]:
+    value = (r.headers.get("Retry-After") or "").strip()
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+# Retry, backoff and throttling feedback shared by the thread and asyncio clients;
+# subclasses only do the HTTP call and the sleeping.
+class _RetryPolicy:
+    def __init__(self, max_retries: int, backoff_base: float, backoff_max: float, limiter: Optional[RateLimiter]):
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "requests": 0, "attempts": 0, "retries": 0, "failures": 0,
+            "rate_limited": 0, "server_errors": 0, "connection_errors": 0,
+        }
+
+    def _bump(self, key: str):
+        with self._lock:
+            self.counters[key] += 1
+
+    def _backoff(self, attempt: int, r) -> float:
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        hint = _retry_after(r) if r is not None else None
+        if hint is not None:
+            delay = min(self.backoff_max, max(delay, hint))
+        return delay
+
+    def _on_response(self, path: str, attempt: int, r) -> Optional[float]:
+        # None: hand r back to the caller; otherwise sleep this long and retry.
+        if self.limiter:
+            if _is_throttled(r): self.limiter.on_throttled()
+            elif _ok(r): self.limiter.on_success()
+        if r.status_code not in RETRY_STATUSES:
+            if not _ok(r): self._bump("failures")
+            return None
+        self._bump("rate_limited" if r.status_code == 429 else "server_errors")
+        if attempt >= self.max_retries:
+            self._bump("failures")
+            return None
+        delay = self._backoff(attempt, r)
+        logging.warning("Graph POST %s got %s (attempt %d); retrying in %.2fs", path, r.status_code, attempt + 1, delay)
+        self._bump("retries")
+        return delay
+
+    def _on_connection_error(self, path: str, attempt: int, e: Exception, sent: bool) -> Optional[float]:
+        # None: give up and re-raise; otherwise sleep this long and retry. A POST that may
+        # have reached Graph is not repeated: messages are not idempotent.
+        self._bump("connection_errors")
+        if sent:
+            logging.warning("Graph POST %s failed after the request was sent; not retrying: %s", path, e)
+        if sent or attempt >= self.max_retries:
+            self._bump("failures")
+            return None
+        logging.warning("Graph POST %s connection error (attempt %d): %s", path, attempt + 1, e)
+        self._bump("retries")
+        return self._backoff(attempt, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+# Shared keep-alive session for the Graph API; thread-safe, one per process.
+class GraphClient(_RetryPolicy):
+    def __init__(self, base_url: str = GRAPH_API_BASE, token: str = WHATSAPP_TOKEN,
+                 pool_size: int = GRAPH_POOL_SIZE, max_retries: int = GRAPH_MAX_RETRIES,
+                 backoff_base: float = GRAPH_BACKOFF_BASE, backoff_max: float = GRAPH_BACKOFF_MAX,
+                 limiter: Optional[RateLimiter] = None):
+        super().__init__(max_retries, backoff_base, backoff_max, limiter)
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {token}"
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+
+    def post(self, path: str, timeout: float = 15, recipient: Optional[str] = None, **kwargs) -> requests.Response:
+        # Bodies must be replayable (json/data/bytes in files) since a retry resends them.
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        self._bump("requests")
+        attempt = 0
+        while True:
+            self._bump("attempts")
+            if self.limiter: self.limiter.acquire(recipient)
+            try:
+                r = self.session.post(url, timeout=timeout, **kwargs)
+                delay = self._on_response(path, attempt, r)
+                if delay is None: return r
+            except (requests.ConnectionError, requests.Timeout) as e:
+                delay = self._on_connection_error(path, attempt, e, sent=not _never_sent(e))
+                if delay is None: raise
+            attempt += 1
+            time.sleep(delay)
+
+    def stats(self) -> dict:
+        out = super().stats()
+        pools = []
+        try:
+            pm = self._adapter.poolmanager
+            for key in list(pm.pools.keys()):
+                pool = pm.pools.get(key)
+                if pool is None: continue
+                pools.append({"host": pool.host, "connections_opened": pool.num_connections,
+                              "requests": pool.num_requests, "available": pool.pool.qsize() if pool.pool else 0})
+        except Exception as e:
+            logging.debug("Graph pool stats unavailable: %s", e)
+        out["pools"] = pools
+        return out
+
+# The same client for the asyncio runtime (aio.py), on httpx; one per event loop.
+class AsyncGraphClient(_RetryPolicy):
+    def __init__(self, base_url: str = GRAPH_API_BASE, token: str = WHATSAPP_TOKEN,
+                 pool_size: int = GRAPH_POOL_SIZE, max_retries: int = GRAPH_MAX_RETRIES,
+                 backoff_base: float = GRAPH_BACKOFF_BASE, backoff_max: float = GRAPH_BACKOFF_MAX,
+                 limiter: Optional[RateLimiter] = None):
+        import httpx  # optional, only needed for RUNTIME=async
+        super().__init__(max_retries, backoff_base, backoff_max, limiter)
+        self._httpx = httpx
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.AsyncClient(headers={"Authorization": f"Bearer {token}"},
+                                        limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size))
+
+    async def post(self, path: str, timeout: float = 15, recipient: Optional[str] = None, **kwargs):
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        self._bump("requests")
+        attempt = 0
+        while True:
+            self._bump("attempts")
+            if self.limiter: await self.limiter.acquire_async(recipient)
+            try:
+                r = await self.client.post(url, timeout=timeout, **kwargs)
+                delay = self._on_response(path, attempt, r)
+                if delay is None: return r
+            except self._httpx.TransportError as e:
+                delay = self._on_connection_error(path, attempt, e, sent=not _httpx_never_sent(self._httpx, e))
+                if delay is None: raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_CLIENT: Optional[GraphClient] = None
+_CLIENT_PID: Optional[int] = None
+_CLIENT_LOCK = threading.Lock()
+
+def graph_client() -> GraphClient:
+    global _CLIENT, _CLIENT_PID
+    pid = os.getpid()
+    if _CLIENT is None or _CLIENT_PID != pid:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT_PID != pid:
+                _CLIENT, _CLIENT_PID = GraphClient(limiter=default_limiter()), pid
+    return _CLIENT
+
+_ASYNC_CLIENTS: Dict[int, AsyncGraphClient] = {}  # id(event loop) -> client, this process only
+_ASYNC_PID: Optional[int] = None
+
+def async_graph_client() -> AsyncGraphClient:
+    global _ASYNC_PID
+    if _ASYNC_PID != os.getpid():
+        _ASYNC_CLIENTS.clear(); _ASYNC_PID = os.getpid()
+    loop = id(asyncio.get_running_loop())
+    client = _ASYNC_CLIENTS.get(loop)
+    if client is None:
+        client = _ASYNC_CLIENTS[loop] = AsyncGraphClient(limiter=default_limiter())
+    return client
+
+async def close_async_graph_client():
+    client = _ASYNC_CLIENTS.pop(id(asyncio.get_running_loop()), None) if _ASYNC_PID == os.getpid() else None
+    if client is not None: await client.aclose()
+
+def _collect_graph():
+    clients = list(_ASYNC_CLIENTS.values()) if _ASYNC_PID == os.getpid() else []
+    if _CLIENT is not None and _CLIENT_PID == os.getpid(): clients.append(_CLIENT)
+    if not clients: return []
+    totals: Dict[str, int] = {}
+    for c in clients:
+        for k, v in c.stats().items():
+            if k != "pools": totals[k] = totals.get(k, 0) + v
+    out = [(f"graph_{k}_total", "counter", {}, v) for k, v in totals.items()]
+    if clients[0].limiter:
+        lim = clients[0].limiter.stats()
+        out += [("ratelimit_delayed_total", "counter", {}, lim["delayed"]),
+                ("ratelimit_wait_seconds_total", "counter", {}, lim["wait_seconds"]),
+                ("ratelimit_throttled_total", "counter", {}, lim["throttled"]),
+                ("ratelimit_rate", "gauge", {}, lim["rate"])]
+    return out
+
+register_collector(_collect_graph)
@@ -0,0 +1,106 @@
+# hopeland_bot/logs.py
+import os
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+from .metrics import register_collector
+from .config import LOG_DIR, LOG_LEVEL, LOG_FORMAT, LOG_PAYLOADS, LOG_PAYLOAD_SAMPLE
+
+# Request threads only put records on a bounded queue; a listener thread formats
+# them and does the stdout/file I/O. One JSON object per line with fixed fields.
+FIELDS = ("wa_id", "msg_id", "kind", "status", "count", "payload")
+QUEUE_MAX = 10000
+
+_PID: Optional[int] = None
+_HANDLER: Optional[QueueHandler] = None
+_LISTENER: Optional[QueueListener] = None
+dropped = 0
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + ".%03dZ" % record.msecs,
+               "level": record.levelname, "logger": record.name, "msg": record.getMessage()}
+        for f in FIELDS:
+            v = getattr(record, f, None)
+            if v is not None: doc[f] = v
+        if "wa_id" in doc and LOG_PAYLOADS != "full": doc["wa_id"] = _mask(doc["wa_id"])
+        if record.exc_text: doc["exc"] = record.exc_text
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Render the message and traceback here (cheap) but leave JSON encoding to the listener.
+        record.msg = record.getMessage(); record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None; record.stack_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global dropped
+        try: self.queue.put_nowait(record)
+        except queue.Full: dropped += 1  # never block a request on logging
+
+def init_logging():
+    # Safe to call from every create_app(); after a fork the child gets its own listener.
+    global _PID, _HANDLER, _LISTENER
+    if _PID == os.getpid(): return
+    root = logging.getLogger()
+    if _HANDLER is not None: root.removeHandler(_HANDLER)
+    os.makedirs(LOG_DIR, exist_ok=True)
+    fmt = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s")
+    sh = logging.StreamHandler()
+    fh = RotatingFileHandler(os.path.join(LOG_DIR, "app.log"), maxBytes=10_000_000, backupCount=5)
+    for h in (sh, fh): h.setFormatter(fmt)
+
+    q: "queue.Queue[logging.LogRecord]" = queue.Queue(QUEUE_MAX)
+    _HANDLER = _QueueHandler(q)
+    _LISTENER = QueueListener(q, sh, fh, respect_handler_level=True)
+    _LISTENER.start()
+    root.addHandler(_HANDLER)
+    root.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
+    if _PID is None: atexit.register(_stop)
+    _PID = os.getpid()
+
+def _stop():
+    if _LISTENER is not None and _PID == os.getpid():
+        _LISTENER.stop()  # flushes what is still queued
+
+_MASK_KEYS = {"from", "to", "wa_id", "recipient_id", "phone", "email"}
+_TEXT_KEYS = {"body", "name", "caption"}
+
+def _mask(v: Any) -> str:
+    v = str(v)
+    return "***" + v[-4:] if len(v) > 4 else "***"
+
+def _walk(obj: Any, redact: bool, depth: int = 0) -> Any:
+    if depth > 12: return "…"
+    if isinstance(obj, dict):
+        out = {}
+        for k, v in obj.items():
+            if redact and k in _MASK_KEYS and isinstance(v, (str, int)):
+                out[k] = _mask(v)
+            elif redact and k in _TEXT_KEYS and isinstance(v, str):
+                out[k] = f"<{len(v)} chars>"
+            else:
+                out[k] = _walk(v, redact, depth + 1)
+        return out
+    if isinstance(obj, (list, tuple)):
+        return [_walk(v, redact, depth + 1) for v in obj]
+    if isinstance(obj, str) and len(obj) > 200:
+        return obj[:199] + "…"
+    return obj
+
+def sample_payload(payload: Any, force: bool = False) -> Any:
+    # Value for the `payload` log field: None unless this call is sampled (or forced),
+    # masked phone numbers and message text unless LOG_PAYLOADS=full.
+    if LOG_PAYLOADS == "off" or payload is None: return None
+    if not force and random.random() >= LOG_PAYLOAD_SAMPLE: return None
+    return _walk(payload, redact=LOG_PAYLOADS != "full")
+
+register_collector(lambda: [("log_records_dropped_total", "counter", {}, dropped)])
@@ -1,71 +1,304 @@
-import os, json, mimetypes, logging, requests
-from .config import GRAPH_API_BASE, WHATSAPP_TOKEN, MEDIA_CACHE_PATH
+import os, json, time, fcntl, hashlib, mimetypes, logging, threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from .config import (MEDIA_CACHE_PATH, MEDIA_DB_PATH, MEDIA_LOCK_DIR, MEDIA_TTL_SECONDS, MEDIA_REFRESH_MARGIN_SECONDS,
+                     MEDIA_PREWARM_WORKERS, MEDIA_REFRESH_INTERVAL_SECONDS, MEDIA_OPTIMIZE, MEDIA_MAX_DIMENSION,
+                     MEDIA_JPEG_QUALITY, MEDIA_DERIVED_DIR)
+from .graph import graph_client
+from .db import connect
+from .metrics import timed, inc, register_collector
+from .utils import clip
 
-MEDIA_CACHE = {}
+# In-process memo of the shared media table (DATA_DIR/media.db):
+# cache key -> {"id": media id, "uploaded_at": epoch seconds, "path": last source path}
+# The key is the sha256 of the source file, plus the optimisation settings when the
+# upload was an optimised copy (see _variant), so changing them re-uploads.
+MEDIA_CACHE: Dict[str, dict] = {}
+_HASHES: Dict[str, Tuple[float, int, str]] = {}  # path -> (mtime, size, sha256)
+_SHA_LOCKS: Dict[str, threading.Lock] = {}
+_LOCKS_GUARD = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    sha         TEXT PRIMARY KEY,
+    media_id    TEXT NOT NULL,
+    uploaded_at REAL NOT NULL,
+    path        TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS media_variants (
+    sha       TEXT NOT NULL,
+    variant   TEXT NOT NULL,
+    src_bytes INTEGER NOT NULL,
+    out_bytes INTEGER NOT NULL,
+    PRIMARY KEY (sha, variant)
+);
+"""
+
+def _conn():
+    return connect(MEDIA_DB_PATH, _SCHEMA)
+
+def _import_legacy_json(conn):
+    # One-time import of the old media_cache.json (either {path: id} or {sha: record}).
+    if not os.path.isfile(MEDIA_CACHE_PATH) or conn.execute("SELECT 1 FROM media LIMIT 1").fetchone():
+        return
+    try:
+        with open(MEDIA_CACHE_PATH, "r", encoding="utf-8") as f:
+            loaded = json.load(f) if os.path.getsize(MEDIA_CACHE_PATH) else {}
+    except (OSError, json.JSONDecodeError) as e:
+        logging.warning("Skipping unreadable legacy media cache %s: %s", MEDIA_CACHE_PATH, e)
+        return
+    for key, rec in loaded.items():
+        if isinstance(rec, str):
+            # legacy {path: media_id}; upload time unknown, so refresh it soon
+            try: rec, key = {"id": rec, "uploaded_at": 0, "path": key}, _content_hash(key)
+            except OSError: continue
+        _save_entry(key, rec)
+    logging.info("Imported %d entries from legacy %s", len(loaded), MEDIA_CACHE_PATH)
 
 def _load_cache():
-    import json, os, logging
     global MEDIA_CACHE
     try:
-        if os.path.isfile(MEDIA_CACHE_PATH):
-            if os.path.getsize(MEDIA_CACHE_PATH) == 0:
-                MEDIA_CACHE = {}
-                return
-            with open(MEDIA_CACHE_PATH, "r", encoding="utf-8") as f:
-                try:
-                    MEDIA_CACHE = json.load(f)
-                except json.JSONDecodeError:
-                    logging.warning("media cache was invalid JSON; resetting to {}")
-                    MEDIA_CACHE = {}
+        conn = _conn()
+        _import_legacy_json(conn)
+        MEDIA_CACHE = {sha: {"id": mid, "uploaded_at": ts, "path": path}
+                       for sha, mid, ts, path in conn.execute("SELECT sha, media_id, uploaded_at, path FROM media")}
     except Exception as e:
         logging.exception("Failed to load media cache: %s", e)
-        MEDIA_CACHE = {}
 
+def _get_entry(sha: str) -> Optional[dict]:
+    # Read-through to the shared table so uploads by other workers are seen immediately.
+    row = _conn().execute("SELECT media_id, uploaded_at, path FROM media WHERE sha=?", (sha,)).fetchone()
+    if not row: return None
+    rec = {"id": row[0], "uploaded_at": row[1], "path": row[2]}
+    MEDIA_CACHE[sha] = rec
+    return rec
 
-def _save_cache():
-    try:
-        os.makedirs(os.path.dirname(MEDIA_CACHE_PATH), exist_ok=True)
-        with open(MEDIA_CACHE_PATH, "w", encoding="utf-8") as f:
-            json.dump(MEDIA_CACHE, f)
-    except Exception as e:
-        logging.exception("Failed to save media cache: %s", e)
+def _save_entry(sha: str, rec: dict):
+    MEDIA_CACHE[sha] = rec
+    _conn().execute(
+        "INSERT INTO media (sha, media_id, uploaded_at, path) VALUES (?,?,?,?) "
+        "ON CONFLICT(sha) DO UPDATE SET media_id=excluded.media_id, uploaded_at=excluded.uploaded_at, "
+        "path=excluded.path WHERE excluded.uploaded_at >= media.uploaded_at",
+        (sha, rec["id"], rec.get("uploaded_at", 0), rec.get("path", "")))
 
 def init_media_cache():
+    # Also hashes the catalog images, so under preload_app every worker inherits the hashes.
     _load_cache()
+    for path in _catalog_images():
+        try: _content_hash(path)
+        except OSError: pass
+
+def _content_hash(path: str) -> str:
+    st = os.stat(path)
+    known = _HASHES.get(path)
+    if known and known[0] == st.st_mtime and known[1] == st.st_size:
+        return known[2]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    sha = h.hexdigest()
+    _HASHES[path] = (st.st_mtime, st.st_size, sha)
+    return sha
+
+def _age(rec: Optional[dict]) -> float:
+    return time.time() - rec.get("uploaded_at", 0) if rec else float("inf")
+
+# ---- Optimised copies: resized, re-encoded, no metadata; cached by source hash ----
+
+_PIL_MISSING = False
+
+def _pil():
+    global _PIL_MISSING
+    if not MEDIA_OPTIMIZE or _PIL_MISSING: return None
+    try:
+        from PIL import Image, ImageOps  # optional; raw files are uploaded without it
+        return Image, ImageOps
+    except ImportError:
+        _PIL_MISSING = True
+        logging.warning("Pillow not installed; uploading original images unoptimised.")
+        return None
+
+_VARIANT = f"max{MEDIA_MAX_DIMENSION}q{MEDIA_JPEG_QUALITY}"
+
+def _variant() -> str:
+    return _VARIANT if _pil() else ""
+
+def _cache_key(sha: str) -> str:
+    variant = _variant()
+    return f"{sha}-{variant}" if variant else sha
+
+def _optimize(path: str, sha: str, variant: str) -> Tuple[str, str]:
+    # -> (file to upload, mime). Derived files are keyed by content, so every worker and
+    # every catalog entry pointing at the same photo shares one copy.
+    for ext, mime in ((".jpg", "image/jpeg"), (".png", "image/png")):
+        out = os.path.join(MEDIA_DERIVED_DIR, f"{sha}-{variant}{ext}")
+        if os.path.isfile(out): return out, mime
+    row = _conn().execute("SELECT src_bytes, out_bytes FROM media_variants WHERE sha=? AND variant=?", (sha, variant)).fetchone()
+    if row and row[1] >= row[0]: return path, None  # already tried: the original is smaller
+    Image, ImageOps = _pil()
+    with Image.open(path) as im:
+        im = ImageOps.exif_transpose(im)  # bake in the rotation before the EXIF goes
+        im.thumbnail((MEDIA_MAX_DIMENSION, MEDIA_MAX_DIMENSION), Image.LANCZOS)
+        alpha = im.mode in ("RGBA", "LA") or (im.mode == "P" and "transparency" in im.info)
+        ext, mime = (".png", "image/png") if alpha else (".jpg", "image/jpeg")
+        out = os.path.join(MEDIA_DERIVED_DIR, f"{sha}-{variant}{ext}")
+        os.makedirs(MEDIA_DERIVED_DIR, exist_ok=True)
+        tmp = f"{out}.{os.getpid()}.tmp"
+        if alpha: im.save(tmp, "PNG", optimize=True)
+        else: im.convert("RGB").save(tmp, "JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True, progressive=True)
+    src, dst = os.path.getsize(path), os.path.getsize(tmp)
+    if dst >= src:
+        # already small (or compressed harder than our settings): upload it as it is
+        os.remove(tmp)
+        out, mime, dst = path, None, src
+        logging.info("Kept original %s: re-encoded copy was not smaller", path)
+    else:
+        os.replace(tmp, out)
+        _add_saved(src - dst)
+        inc("media_optimized_total")
+        logging.info("Optimised %s: %d -> %d bytes", path, src, dst, extra={"count": src - dst})
+    _conn().execute("INSERT OR REPLACE INTO media_variants (sha, variant, src_bytes, out_bytes) VALUES (?,?,?,?)",
+                    (sha, variant, src, dst))
+    return out, mime
 
-def _upload_media(filepath: str) -> str:
-    mime, _ = mimetypes.guess_type(filepath)
+def _prepare(path: str, sha: str) -> Tuple[str, Optional[str]]:
+    variant = _variant()
+    if not variant: return path, None
+    try:
+        return _optimize(path, sha, variant)
+    except Exception as e:
+        # not an image Pillow can read (or a broken file): send it as it is
+        logging.warning("Image optimisation failed for %s, uploading the original: %s", path, e)
+        return path, None
+
+def optimization_report() -> dict:
+    # Bytes saved by the current settings over every image optimised so far.
+    variant = _variant()
+    n, src, out = _conn().execute("SELECT COUNT(*), COALESCE(SUM(src_bytes), 0), COALESCE(SUM(out_bytes), 0) "
+                                  "FROM media_variants WHERE variant=?", (variant,)).fetchone()
+    return {"enabled": bool(variant), "variant": variant, "images": n, "original_bytes": src,
+            "optimized_bytes": out, "saved_bytes": src - out, "saved_pct": round(100.0 * (src - out) / src, 1) if src else 0.0}
+
+_SAVED: Tuple[float, int] = (float("-inf"), 0)  # (monotonic time read from the table, bytes saved)
+
+def _add_saved(n: int):
+    global _SAVED
+    _SAVED = (_SAVED[0], _SAVED[1] + n)
+
+def _saved_bytes() -> int:
+    # Gauge for every snapshot/scrape: the table (shared by workers) is re-read at most
+    # once a minute, and Pillow is never imported for it.
+    global _SAVED
+    if not MEDIA_OPTIMIZE: return 0
+    if time.monotonic() - _SAVED[0] > 60:
+        n = _conn().execute("SELECT COALESCE(SUM(src_bytes - out_bytes), 0) FROM media_variants WHERE variant=?",
+                            (_VARIANT,)).fetchone()[0]
+        _SAVED = (time.monotonic(), n)
+    return _SAVED[1]
+
+register_collector(lambda: [("media_optimized_bytes_saved", "gauge", {}, _saved_bytes())])
+
+@timed("graph_request", dep="whatsapp", op="media")
+def _upload_media(filepath: str, mime: Optional[str] = None) -> str:
+    mime = mime or mimetypes.guess_type(filepath)[0]
     if not mime:
         mime = "image/jpeg"
-    url = f"{GRAPH_API_BASE}/media"
-    headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
     data = {"messaging_product": "whatsapp"}
     if not os.path.isfile(filepath):
         raise FileNotFoundError(f"Media file not found: {filepath}")
+    # read into memory so a retried upload can resend the same body
     with open(filepath, "rb") as f:
-        files = {"file": (os.path.basename(filepath), f, mime)}
-        r = requests.post(url, headers=headers, data=data, files=files, timeout=60)
+        content = f.read()
+    files = {"file": (os.path.basename(filepath), content, mime)}
+    r = graph_client().post("/media", data=data, files=files, timeout=60)
     if not r.ok:
-        logging.error("Media upload failed (%s): %s", filepath, r.text)
+        logging.error("Media upload failed (%s): %s", filepath, clip(r.text, 500), extra={"status": r.status_code})
         r.raise_for_status()
     media_id = r.json().get("id")
     if not media_id:
         raise RuntimeError(f"No media id returned for {filepath}: {r.text}")
     return media_id
 
+def _sha_lock(sha: str) -> threading.Lock:
+    with _LOCKS_GUARD:
+        return _SHA_LOCKS.setdefault(sha, threading.Lock())
+
+def _ensure_uploaded(path: str, max_age: float = MEDIA_TTL_SECONDS) -> Tuple[str, bool]:
+    # Returns (media_id, uploaded_now). One uploader per file content across threads
+    # (in-process lock) and across workers/containers (flock on the shared volume).
+    sha = _content_hash(path)
+    key = _cache_key(sha)
+    rec = MEDIA_CACHE.get(key)
+    if _age(rec) < max_age: return rec["id"], False
+    rec = _get_entry(key)
+    if _age(rec) < max_age: return rec["id"], False
+    with _sha_lock(key):
+        os.makedirs(MEDIA_LOCK_DIR, exist_ok=True)
+        with open(os.path.join(MEDIA_LOCK_DIR, f"{key}.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                rec = _get_entry(key)  # another worker may have uploaded while we waited
+                if _age(rec) < max_age: return rec["id"], False
+                media_id = _upload_media(*_prepare(path, sha))
+                _save_entry(key, {"id": media_id, "uploaded_at": time.time(), "path": path})
+                return media_id, True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _catalog_images() -> List[str]:
+    from .data import CATALOG
+    seen = []
+    for items in CATALOG.listings().values():
+        for item in items:
+            for img in item.get("images") or []:
+                img = (img or "").strip()
+                if img and not img.lower().startswith("http") and img not in seen:
+                    seen.append(img)
+    return seen
+
+def prewarm_media(max_age: float = MEDIA_TTL_SECONDS, workers: int = MEDIA_PREWARM_WORKERS) -> dict:
+    paths = _catalog_images()
+    summary = {"images": len(paths), "uploaded": 0, "cached": 0, "failed": 0}
+    def _one(path):
+        try:
+            return _ensure_uploaded(path, max_age)[1]
+        except Exception as e:
+            logging.exception("Media pre-warm failed for %s: %s", path, e)
+            return None
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="media-prewarm") as pool:
+        for uploaded in pool.map(_one, paths):
+            key = "failed" if uploaded is None else ("uploaded" if uploaded else "cached")
+            summary[key] += 1
+    summary["saved_bytes"] = optimization_report()["saved_bytes"]
+    logging.info("Media pre-warm: %s", summary)
+    return summary
+
+_REFRESHERS = set()  # pids
+
+def _refresh_loop():
+    # Re-upload ids that are within the refresh margin of WhatsApp's media expiry.
+    max_age = MEDIA_TTL_SECONDS  # first pass at startup: upload anything missing or expired
+    while True:
+        try: prewarm_media(max_age=max_age)
+        except Exception as e: logging.exception("Media refresh failed: %s", e)
+        max_age = MEDIA_TTL_SECONDS - MEDIA_REFRESH_MARGIN_SECONDS
+        time.sleep(MEDIA_REFRESH_INTERVAL_SECONDS)
+
+def start_media_refresher():
+    if os.getpid() in _REFRESHERS: return
+    _REFRESHERS.add(os.getpid())
+    threading.Thread(target=_refresh_loop, name="media-refresher", daemon=True).start()
+
 def build_image_payload(img_entry: str) -> dict:
     if not img_entry:
         return {}
     entry = img_entry.strip()
     if entry.lower().startswith("http"):
         return {"link": entry}
-    # local file path → id
+    # local file path → id (normally already warm; uploads inline only on a miss)
     try:
-        if entry in MEDIA_CACHE:
-            return {"id": MEDIA_CACHE[entry]}
-        media_id = _upload_media(entry)
-        MEDIA_CACHE[entry] = media_id
-        _save_cache()
+        media_id, _ = _ensure_uploaded(entry)
         return {"id": media_id}
     except Exception as e:
         logging.exception("build_image_payload failed for %s: %s", entry, e)
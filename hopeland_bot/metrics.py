@@ -0,0 +1,180 @@
+# hopeland_bot/metrics.py
+import os
+import json
+import time
+import inspect
+import socket
+import logging
+import threading
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+from .config import METRICS_DIR, METRICS_FLUSH_SECONDS
+
+# Minimal in-process counters/histograms rendered in Prometheus text format.
+# Each worker writes its own snapshot under METRICS_DIR; whichever worker serves
+# /metrics sums all live snapshots, so every worker reports the same totals.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+PREFIX = "hopeland_"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_LOCK = threading.Lock()
+_COUNTERS: Dict[Tuple[str, Labels], float] = {}
+_HISTS: Dict[Tuple[str, Labels], List[float]] = {}  # bucket counts..., sum, count
+_DEPS: Dict[str, Dict[str, float]] = {}              # dependency -> last_ok / last_error epoch
+_COLLECTORS: List[Callable[[], List[Tuple[str, str, dict, float]]]] = []
+
+def _key(name: str, labels: dict) -> Tuple[str, Labels]:
+    return PREFIX + name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1.0, **labels):
+    k = _key(name, labels)
+    with _LOCK:
+        _COUNTERS[k] = _COUNTERS.get(k, 0.0) + value
+
+def observe(name: str, seconds: float, **labels):
+    k = _key(name, labels)
+    with _LOCK:
+        h = _HISTS.get(k)
+        if h is None:
+            h = _HISTS[k] = [0.0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound: h[i] += 1
+        h[-2] += seconds; h[-1] += 1
+
+def mark(dep: str, ok: bool):
+    with _LOCK:
+        _DEPS.setdefault(dep, {})["last_ok" if ok else "last_error"] = time.time()
+
+def dependency_status() -> Dict[str, Dict[str, float]]:
+    with _LOCK:
+        return {k: dict(v) for k, v in _DEPS.items()}
+
+def timed(name: str, dep: str = "", **labels):
+    # Histogram `<name>_seconds`; `<name>_errors_total` on exceptions or a False result.
+    def _record(t0: float, ok: bool):
+        observe(f"{name}_seconds", time.perf_counter() - t0, **labels)
+        if not ok: inc(f"{name}_errors_total", **labels)
+        if dep: mark(dep, ok)
+    def _decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @wraps(fn)
+            async def _await(*args, **kwargs):
+                t0 = time.perf_counter(); ok = False
+                try:
+                    result = await fn(*args, **kwargs)
+                    ok = result is not False
+                    return result
+                finally:
+                    _record(t0, ok)
+            return _await
+        @wraps(fn)
+        def _wrap(*args, **kwargs):
+            t0 = time.perf_counter(); ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = result is not False
+                return result
+            finally:
+                _record(t0, ok)
+        return _wrap
+    return _decorate
+
+def register_collector(fn: Callable[[], List[Tuple[str, str, dict, float]]]):
+    # fn() -> [(name, "counter" | "gauge", labels, value)], evaluated at snapshot/scrape time
+    _COLLECTORS.append(fn)
+
+def _collect() -> Tuple[dict, dict]:
+    counters, gauges = {}, {}
+    for fn in _COLLECTORS:
+        try:
+            for name, kind, labels, value in fn():
+                (counters if kind == "counter" else gauges)[_key(name, labels)] = float(value)
+        except Exception as e:
+            logging.debug("Metrics collector %s failed: %s", getattr(fn, "__name__", fn), e)
+    return counters, gauges
+
+def _snapshot() -> dict:
+    collected, gauges = _collect()
+    with _LOCK:
+        counters = {**_COUNTERS, **collected}
+        hists = {k: list(v) for k, v in _HISTS.items()}
+    enc = lambda d: [[n, list(l), v] for (n, l), v in d.items()]
+    return {"ts": time.time(), "counters": enc(counters), "hists": enc(hists), "gauges": enc(gauges)}
+
+def _snapshot_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}.json"
+
+def write_snapshot():
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, _snapshot_name())
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+def _merged() -> Tuple[dict, dict, dict]:
+    counters: Dict[Tuple[str, Labels], float] = {}
+    hists: Dict[Tuple[str, Labels], List[float]] = {}
+    own = _snapshot()
+    snaps = [own]
+    cutoff = time.time() - max(60.0, METRICS_FLUSH_SECONDS * 6)
+    try:
+        for fname in os.listdir(METRICS_DIR):
+            if not fname.endswith(".json") or fname == _snapshot_name(): continue
+            path = os.path.join(METRICS_DIR, fname)
+            try:
+                if os.path.getmtime(path) < cutoff: continue  # dead worker
+                with open(path, "r", encoding="utf-8") as f:
+                    snaps.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+    except FileNotFoundError:
+        pass
+    for snap in snaps:
+        for n, l, v in snap["counters"]:
+            k = (n, tuple(tuple(x) for x in l)); counters[k] = counters.get(k, 0.0) + v
+        for n, l, v in snap["hists"]:
+            k = (n, tuple(tuple(x) for x in l)); cur = hists.setdefault(k, [0.0] * len(v))
+            for i, x in enumerate(v): cur[i] += x
+    gauges = {(n, tuple(tuple(x) for x in l)): v for n, l, v in own["gauges"]}
+    return counters, hists, gauges
+
+def _fmt_labels(labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items: return ""
+    esc = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def render_prometheus() -> str:
+    counters, hists, gauges = _merged()
+    out: List[str] = []
+    def _family(kind, items, render):
+        seen = set()
+        for (name, labels), value in sorted(items.items()):
+            if name not in seen:
+                out.append(f"# TYPE {name} {kind}"); seen.add(name)
+            render(name, labels, value)
+    _family("counter", counters, lambda n, l, v: out.append(f"{n}{_fmt_labels(l)} {v:g}"))
+    _family("gauge", gauges, lambda n, l, v: out.append(f"{n}{_fmt_labels(l)} {v:g}"))
+    def _hist(name, labels, h):
+        for i, bound in enumerate(BUCKETS):
+            out.append(f"{name}_bucket{_fmt_labels(labels, (('le', f'{bound:g}'),))} {h[i]:g}")
+        out.append(f"{name}_bucket{_fmt_labels(labels, (('le', '+Inf'),))} {h[-1]:g}")
+        out.append(f"{name}_sum{_fmt_labels(labels)} {h[-2]:.6f}")
+        out.append(f"{name}_count{_fmt_labels(labels)} {h[-1]:g}")
+    _family("histogram", hists, _hist)
+    return "\n".join(out) + "\n"
+
+_WRITERS = set()  # pids
+
+def _writer_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try: write_snapshot()
+        except Exception as e: logging.debug("Metrics snapshot failed: %s", e)
+
+def start_metrics_writer():
+    if os.getpid() in _WRITERS: return
+    _WRITERS.add(os.getpid())
+    threading.Thread(target=_writer_loop, name="metrics-writer", daemon=True).start()
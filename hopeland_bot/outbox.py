@@ -0,0 +1,130 @@
+# hopeland_bot/outbox.py
+import json
+import time
+from typing import Optional, Tuple
+from .config import OUTBOX_PATH
+from .db import connect, transaction
+
+# Outbound intents persisted under DATA_DIR. Items for one wa_id are drained by a
+# single lease holder at a time so a customer always sees messages in order.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    wa_id      TEXT NOT NULL,
+    kind       TEXT NOT NULL,
+    args       TEXT NOT NULL,
+    created    REAL NOT NULL,
+    attempts   INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS outbox_wa ON outbox(wa_id, id);
+CREATE TABLE IF NOT EXISTS outbox_lease (
+    wa_id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    until REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox_last (
+    wa_id TEXT PRIMARY KEY,
+    key   TEXT NOT NULL,
+    ts    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS outbox_progress (
+    id   INTEGER PRIMARY KEY,  -- outbox.id
+    sent INTEGER NOT NULL      -- leading payloads of the item's plan Graph already accepted
+);
+"""
+
+def _conn():
+    return connect(OUTBOX_PATH, _SCHEMA)
+
+_last_gc = 0.0
+
+def _args(args: dict) -> str:
+    return json.dumps(args, ensure_ascii=False, sort_keys=True)
+
+def item_key(kind: str, args: dict) -> str:
+    return f"{kind}:{_args(args)}"
+
+def put(wa_id: str, kind: str, **args) -> int:
+    cur = _conn().execute(
+        "INSERT INTO outbox (wa_id, kind, args, created) VALUES (?,?,?,?)",
+        (wa_id, kind, _args(args), time.time()))
+    return cur.lastrowid
+
+def put_latest(wa_id: str, kind: str, window: float, **args) -> int:
+    # Queue the item, dropping identical ones queued for this wa_id in the last `window`
+    # seconds so only the latest copy is sent. The head item may already be in flight
+    # and is left alone. Returns how many were dropped.
+    body, now = _args(args), time.time()
+    with transaction(_conn()) as conn:
+        dropped = conn.execute(
+            "DELETE FROM outbox WHERE wa_id=? AND kind=? AND args=? AND created >= ? "
+            "AND id > (SELECT MIN(id) FROM outbox WHERE wa_id=?)",
+            (wa_id, kind, body, now - window, wa_id)).rowcount
+        conn.execute("INSERT INTO outbox (wa_id, kind, args, created) VALUES (?,?,?,?)",
+                     (wa_id, kind, body, now))
+    return dropped
+
+_CLAIMABLE = ("SELECT o.wa_id FROM outbox o "
+              "WHERE o.id = (SELECT MIN(id) FROM outbox WHERE wa_id = o.wa_id) "
+              "AND o.not_before <= ? AND o.wa_id NOT IN (SELECT wa_id FROM outbox_lease WHERE until > ?) "
+              "ORDER BY o.id LIMIT 1")
+
+def claim(owner: str, lease_seconds: float) -> Optional[str]:
+    now = time.time()
+    # Read-only probe first so idle senders never take the write lock.
+    if not _conn().execute(_CLAIMABLE, (now, now)).fetchone():
+        return None
+    with transaction(_conn()) as conn:
+        conn.execute("DELETE FROM outbox_lease WHERE until <= ?", (now,))
+        row = conn.execute(_CLAIMABLE, (now, now)).fetchone()
+        if not row:
+            return None
+        conn.execute("INSERT INTO outbox_lease (wa_id, owner, until) VALUES (?,?,?)",
+                     (row[0], owner, now + lease_seconds))
+        return row[0]
+
+def release(wa_id: str, owner: str):
+    _conn().execute("DELETE FROM outbox_lease WHERE wa_id=? AND owner=?", (wa_id, owner))
+
+def next_item(wa_id: str) -> Optional[Tuple[int, str, dict, int, int]]:
+    # -> (id, kind, args, attempts, payloads already sent by an earlier attempt)
+    row = _conn().execute(
+        "SELECT o.id, o.kind, o.args, o.attempts, o.not_before, COALESCE(p.sent, 0) FROM outbox o "
+        "LEFT JOIN outbox_progress p ON p.id = o.id WHERE o.wa_id=? ORDER BY o.id LIMIT 1", (wa_id,)).fetchone()
+    # A delayed head item blocks the rest of that customer's queue to keep order.
+    if not row or row[4] > time.time():
+        return None
+    return row[0], row[1], json.loads(row[2]), row[3], row[5]
+
+def done(item_id: int, wa_id: str = "", owner: str = "", lease_seconds: float = 0, sent_key: str = ""):
+    # Deleting the item, extending the lease and noting what the customer saw last
+    # share one write transaction.
+    global _last_gc
+    now = time.time()
+    with transaction(_conn()) as conn:
+        conn.execute("DELETE FROM outbox WHERE id=?", (item_id,))
+        conn.execute("DELETE FROM outbox_progress WHERE id=?", (item_id,))
+        if owner:
+            conn.execute("UPDATE outbox_lease SET until=? WHERE wa_id=? AND owner=?",
+                         (now + lease_seconds, wa_id, owner))
+        if sent_key:
+            conn.execute("INSERT OR REPLACE INTO outbox_last (wa_id, key, ts) VALUES (?,?,?)", (wa_id, sent_key, now))
+            if now - _last_gc > 600:
+                _last_gc = now
+                conn.execute("DELETE FROM outbox_last WHERE ts < ?", (now - 3600,))
+
+def last_sent(wa_id: str) -> Optional[Tuple[str, float]]:
+    row = _conn().execute("SELECT key, ts FROM outbox_last WHERE wa_id=?", (wa_id,)).fetchone()
+    return (row[0], row[1]) if row else None
+
+def retry(item_id: int, delay: float, sent: int = 0):
+    # sent: how many leading payloads went out, so the next attempt resumes after them.
+    with transaction(_conn()) as conn:
+        conn.execute("UPDATE outbox SET attempts=attempts+1, not_before=? WHERE id=?",
+                     (time.time() + delay, item_id))
+        if sent:
+            conn.execute("INSERT OR REPLACE INTO outbox_progress (id, sent) VALUES (?,?)", (item_id, sent))
+
+def depth() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
@@ -0,0 +1,196 @@
+# hopeland_bot/ratelimit.py
+import os
+import time
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .config import (PHONE_NUMBER_ID, RATE_LIMIT_DB_PATH, RATE_LIMIT_SHARED, RATE_LIMIT_GLOBAL_PER_SEC,
+                     RATE_LIMIT_GLOBAL_BURST, RATE_LIMIT_RECIPIENT_PER_SEC, RATE_LIMIT_RECIPIENT_BURST,
+                     RATE_LIMIT_MIN_PER_SEC, RATE_LIMIT_THROTTLE_COOLDOWN)
+from .db import connect, transaction
+
+# Token buckets are reservation based: a caller always takes a token (possibly going
+# into debt) and sleeps for the returned delay, so waiters are served in arrival order.
+def _reserve(tokens: float, ts: float, now: float, rate: float, burst: float) -> Tuple[float, float]:
+    tokens = min(burst, tokens + (now - ts) * rate) - 1.0
+    return tokens, (0.0 if tokens >= 0 else -tokens / rate)
+
+class _LocalStore:
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._rate: Optional[float] = None
+        self._lowered_until = 0.0
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            tokens, ts = self._buckets.get(key, (burst, now))
+            tokens, wait = _reserve(tokens, ts, now, rate, burst)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def get_rate(self) -> Optional[float]:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        self._rate = rate
+
+    def lower_rate(self, rate: float, min_rate: float, cooldown: float) -> Optional[float]:
+        # Halve rate unless it was already lowered within cooldown; returns the new rate.
+        now = time.monotonic()
+        with self._lock:
+            if now < self._lowered_until: return None
+            self._lowered_until = now + cooldown
+            self._rate = max(min_rate, rate / 2)
+            return self._rate
+
+class _SharedStore:
+    # Same buckets kept in SQLite so every worker on the /data volume draws from them.
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS buckets (
+        key    TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        ts     REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS adaptive (
+        id   INTEGER PRIMARY KEY CHECK (id = 1),
+        rate REAL NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS adaptive_cooldown (
+        id    INTEGER PRIMARY KEY CHECK (id = 1),
+        until REAL NOT NULL
+    );
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB_PATH):
+        self.path = path
+        self._last_gc = 0.0
+
+    def _conn(self):
+        return connect(self.path, self._SCHEMA)
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        now = time.time()
+        with transaction(self._conn()) as conn:
+            row = conn.execute("SELECT tokens, ts FROM buckets WHERE key=?", (key,)).fetchone()
+            tokens, wait = _reserve(row[0] if row else burst, row[1] if row else now, now, rate, burst)
+            conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, ts) VALUES (?,?,?)", (key, tokens, now))
+            if now - self._last_gc > 600:
+                self._last_gc = now
+                conn.execute("DELETE FROM buckets WHERE ts < ? AND key LIKE 'to:%'", (now - 3600,))
+        return wait
+
+    def get_rate(self) -> Optional[float]:
+        row = self._conn().execute("SELECT rate FROM adaptive WHERE id=1").fetchone()
+        return row[0] if row else None
+
+    def set_rate(self, rate: float):
+        self._conn().execute("INSERT OR REPLACE INTO adaptive (id, rate) VALUES (1, ?)", (rate,))
+
+    def lower_rate(self, rate: float, min_rate: float, cooldown: float) -> Optional[float]:
+        now = time.time()
+        with transaction(self._conn()) as conn:
+            row = conn.execute("SELECT until FROM adaptive_cooldown WHERE id=1").fetchone()
+            if row and now < row[0]: return None
+            new_rate = max(min_rate, rate / 2)
+            conn.execute("INSERT OR REPLACE INTO adaptive (id, rate) VALUES (1, ?)", (new_rate,))
+            conn.execute("INSERT OR REPLACE INTO adaptive_cooldown (id, until) VALUES (1, ?)", (now + cooldown,))
+        return new_rate
+
+PERSIST_STEP = 1.0  # /s; recovery is written to the store in steps this big, not per send
+
+class RateLimiter:
+    # Global bucket for the phone number id plus one bucket per recipient. The global
+    # rate halves on a throttling response (once per cooldown window) and creeps back up
+    # on successes (AIMD).
+    def __init__(self, rate: float = RATE_LIMIT_GLOBAL_PER_SEC, burst: float = RATE_LIMIT_GLOBAL_BURST,
+                 recipient_rate: float = RATE_LIMIT_RECIPIENT_PER_SEC, recipient_burst: float = RATE_LIMIT_RECIPIENT_BURST,
+                 min_rate: float = RATE_LIMIT_MIN_PER_SEC, shared: bool = RATE_LIMIT_SHARED,
+                 cooldown: float = RATE_LIMIT_THROTTLE_COOLDOWN):
+        self.max_rate = rate; self.burst = burst; self.min_rate = min_rate; self.cooldown = cooldown
+        self.recipient_rate = recipient_rate; self.recipient_burst = recipient_burst
+        self.store = _SharedStore() if shared else _LocalStore()
+        self.global_key = f"phone:{PHONE_NUMBER_ID}"
+        self._lock = threading.Lock()
+        self._rate = self._persisted = self.store.get_rate() or rate
+        self._rate_checked = 0.0
+        self.counters: Dict[str, float] = {"acquired": 0, "delayed": 0, "wait_seconds": 0.0, "throttled": 0}
+
+    @property
+    def rate(self) -> float:
+        if isinstance(self.store, _SharedStore) and time.monotonic() - self._rate_checked > 1.0:
+            self._rate_checked = time.monotonic()
+            stored = self.store.get_rate()
+            # Adopt another worker's change; otherwise keep our not yet persisted recovery.
+            if stored is not None and stored != self._persisted:
+                self._rate = self._persisted = stored
+        return self._rate
+
+    def _set_rate(self, rate: float):
+        self._rate = self._persisted = rate
+        self.store.set_rate(rate)
+
+    def reserve(self, recipient: Optional[str] = None) -> float:
+        # Take the tokens now; the caller waits the returned delay (thread or event loop).
+        wait = self.store.reserve(self.global_key, self.rate, self.burst)
+        if recipient:
+            wait = max(wait, self.store.reserve(f"to:{recipient}", self.recipient_rate, self.recipient_burst))
+        with self._lock:
+            self.counters["acquired"] += 1
+            if wait > 0:
+                self.counters["delayed"] += 1; self.counters["wait_seconds"] += wait
+        return wait
+
+    def acquire(self, recipient: Optional[str] = None) -> float:
+        wait = self.reserve(recipient)
+        if wait > 0: time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, recipient: Optional[str] = None) -> float:
+        # The shared store is a SQLite transaction, so it is taken off the event loop.
+        wait = await asyncio.to_thread(self.reserve, recipient) if isinstance(self.store, _SharedStore) \
+            else self.reserve(recipient)
+        if wait > 0: await asyncio.sleep(wait)
+        return wait
+
+    def on_throttled(self):
+        with self._lock:
+            self.counters["throttled"] += 1
+        new_rate = self.store.lower_rate(self.rate, self.min_rate, self.cooldown)
+        if new_rate is None: return  # same burst of 429s; already lowered
+        self._rate = self._persisted = new_rate
+        logging.warning("Graph API throttled; outbound rate lowered to %.2f/s", new_rate)
+
+    def on_success(self):
+        with self._lock:
+            rate = self.rate
+            if rate >= self.max_rate: return
+            # +0.1/s per success: back to full speed after a few hundred clean sends
+            self._rate = rate = min(self.max_rate, rate + 0.1)
+            persist = rate >= self.max_rate or rate - self._persisted >= PERSIST_STEP
+        if persist: self._set_rate(rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "rate": round(self.rate, 3), "max_rate": self.max_rate,
+                    "shared": isinstance(self.store, _SharedStore)}
+
+_LIMITER: Optional[RateLimiter] = None
+_LIMITER_PID: Optional[int] = None
+_LIMITER_LOCK = threading.Lock()
+
+def limiter() -> RateLimiter:
+    global _LIMITER, _LIMITER_PID
+    pid = os.getpid()
+    if _LIMITER is None or _LIMITER_PID != pid:
+        with _LIMITER_LOCK:
+            if _LIMITER is None or _LIMITER_PID != pid:
+                _LIMITER, _LIMITER_PID = RateLimiter(), pid
+    return _LIMITER
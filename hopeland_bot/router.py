@@ -0,0 +1,148 @@
+# hopeland_bot/router.py
+# Conversation router. An inbound message is classified into (intent, argument) with
+# dict lookups, then (state, intent) picks a transition from a table compiled once from
+# TRANSITIONS below. New commands or categories are data: a COMMANDS entry, a catalog
+# category, or a TRANSITIONS row, never another branch in routes.py.
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+from .data import CATALOG, find_listing
+from .whatsapp import enqueue
+from .search import normalize
+from .metrics import observe, inc
+
+# Exact commands, matched after search.normalize() ("Menu please" -> "menu").
+COMMANDS = {"hi": "greet", "hello": "greet", "hey": "greet", "start": "greet", "menu": "greet",
+            "agent": "agent"}
+# List row ids are "<prefix>_<arg>" (see data.py); prefix -> intent
+LIST_REPLIES = {"cat": "category", "listing": "listing"}
+
+# (from state, intent, action, next state). "*" matches any state and is used when no
+# exact row exists; "{ARG}" in the next state is the upper-cased intent argument.
+TRANSITIONS = (
+    ("*",   "greet",    "show_categories", "MENU"),
+    ("*",   "category", "show_listings",   "LIST_{ARG}"),
+    ("*",   "agent",    "handoff",         None),
+    ("*",   "search",   "show_matches",    "SEARCH"),
+    ("*",   "listing",  "show_listing",    None),
+    ("NEW", "text",     "show_categories", "MENU"),
+    ("*",   "text",     "reshow",          None),
+    ("*",   "other",    "reshow",          None),
+)
+
+class Turn:
+    __slots__ = ("wa_id", "sess", "arg", "contact_name")
+
+    def __init__(self, wa_id: str, sess, arg: Any, contact_name: str):
+        self.wa_id = wa_id; self.sess = sess; self.arg = arg; self.contact_name = contact_name
+
+ACTIONS: Dict[str, Callable[[Turn], None]] = {}
+
+def action(name: str):
+    def _register(fn):
+        ACTIONS[name] = fn
+        return fn
+    return _register
+
+@action("show_categories")
+def _show_categories(t: Turn):
+    enqueue(t.wa_id, "category_menu")
+
+@action("show_listings")
+def _show_listings(t: Turn):
+    enqueue(t.wa_id, "listings_menu", category_key=t.arg); t.sess["last_cat"] = t.arg
+
+@action("handoff")
+def _handoff(t: Turn):
+    t.sess["human"] = True; enqueue(t.wa_id, "text", body="Thanks. A leasing specialist will join shortly.")
+
+@action("show_matches")
+def _show_matches(t: Turn):
+    enqueue(t.wa_id, "search_results", listing_ids=t.arg)
+    # A later pick re-shows this category's menu only if every match belongs to it.
+    cats = {CATALOG.category_of(i) for i in t.arg}
+    t.sess["last_cat"] = cats.pop() if len(cats) == 1 else None
+
+@action("show_listing")
+def _show_listing(t: Turn):
+    listing = find_listing(t.arg)
+    if not listing:
+        enqueue(t.wa_id, "text", body="Sorry, that listing is unavailable. Please choose another option."); return
+    # 1) Untrimmed echo
+    enqueue(t.wa_id, "selection_echo", listing_id=t.arg)
+    # 2) Log
+    cat = CATALOG.category_of(t.arg) or t.sess.get("last_cat") or ""
+    enqueue(t.wa_id, "log_enquiry", wa_name=t.contact_name, category=cat.upper(),
+            unit_id=listing.get("id", ""), title=listing.get("title", ""), desc=listing.get("desc", ""))
+    # 3) Contact + photos
+    enqueue(t.wa_id, "listing_details", listing_id=t.arg)
+    # 4) Show list again
+    if t.sess.get("last_cat"): enqueue(t.wa_id, "listings_menu", category_key=t.sess["last_cat"])
+
+@action("reshow")
+def _reshow(t: Turn):
+    if t.sess.get("last_cat"): enqueue(t.wa_id, "listings_menu", category_key=t.sess["last_cat"])
+    else: enqueue(t.wa_id, "category_menu")
+
+Step = Tuple[Callable[[Turn], None], Optional[str], str]  # action, next state, metric label
+
+def compile_transitions(rows=TRANSITIONS) -> Dict[Tuple[str, str], Step]:
+    table: Dict[Tuple[str, str], Step] = {}
+    for state, intent, name, next_state in rows:
+        if name not in ACTIONS: raise ValueError(f"transition {state}/{intent}: unknown action {name}")
+        if (state, intent) in table: raise ValueError(f"duplicate transition {state}/{intent}")
+        table[(state, intent)] = (ACTIONS[name], next_state, f"{state}:{intent}")
+    return table
+
+_TABLE = compile_transitions()
+_KEYWORDS: Tuple[int, Dict[str, Tuple[str, Any]]] = (-1, {})  # (catalog version, normalized text -> intent)
+
+def _keywords() -> Dict[str, Tuple[str, Any]]:
+    # Commands, every category key and title, and every listing id ("R101" opens that
+    # unit rather than searching for it); rebuilt when the catalog version changes.
+    global _KEYWORDS
+    snap = CATALOG.snapshot()
+    if _KEYWORDS[0] != snap.version:
+        table = {" ".join(normalize(word)): (intent, None) for word, intent in COMMANDS.items()}
+        for key, cat in snap.categories.items():
+            for word in (key, cat["title"]):
+                table.setdefault(" ".join(normalize(word)), ("category", key))
+        for listing_id in snap.by_id:
+            table.setdefault(" ".join(normalize(listing_id)), ("listing", listing_id))
+        table.pop("", None)
+        _KEYWORDS = (snap.version, table)
+    return _KEYWORDS[1]
+
+def classify(msg: dict) -> Tuple[str, Any]:
+    mtype = msg.get("type")
+    if mtype == "text":
+        text = (msg.get("text", {}).get("body") or "").strip().lower()
+        if not text: return "other", None
+        hit = _keywords().get(" ".join(normalize(text)))
+        if hit: return hit
+        matches = CATALOG.search(text)
+        inc("search_queries_total", result="hit" if matches else "miss")
+        return ("search", matches) if matches else ("text", text)
+    if mtype == "interactive":
+        row_id = ((msg.get("interactive") or {}).get("list_reply") or {}).get("id") or ""
+        prefix, _, arg = row_id.partition("_")
+        intent = LIST_REPLIES.get(prefix)
+        if intent == "category" and not CATALOG.has_category(arg): intent = None
+        if intent: return intent, arg
+    return "other", None
+
+def route(wa_id: str, sess, msg: dict, contact_name: str = ""):
+    # Runs one transition for msg and updates sess in place; the caller saves it.
+    if sess.get("human"): return
+    intent, arg = classify(msg)
+    state = sess.get("state") or "NEW"
+    step = _TABLE.get((state, intent)) or _TABLE.get(("*", intent))
+    if step is None:
+        logging.warning("No transition for %s/%s", state, intent, extra={"wa_id": wa_id}); return
+    fn, next_state, label = step
+    t0 = time.perf_counter()
+    try:
+        fn(Turn(wa_id, sess, arg, contact_name))
+        if next_state: sess["state"] = next_state.format(ARG=str(arg).upper())
+    finally:
+        observe("router_transition_seconds", time.perf_counter() - t0, transition=label)
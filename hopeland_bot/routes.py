@@ -1,32 +1,48 @@
-import logging
-from flask import Blueprint, request, jsonify
-from .config import VERIFY_TOKEN
-from .state import get_session
-from .data import find_listing
-from .whatsapp import send_category_menu, send_listings_menu, send_listing_details, send_text, send_selection_echo
-from .sheets import log_enquiry
+import time, logging
+from typing import Optional
+from flask import Blueprint, Response, request, jsonify
+from .config import VERIFY_TOKEN, WHATSAPP_TOKEN, PHONE_NUMBER_ID
+from .state import get_session, save_session
+from .router import route
+from . import delivery
+from .dedupe import first_seen
 from .utils import admin_required
+from .logs import sample_payload
+from .metrics import timed, inc, render_prometheus, dependency_status
 
 bp = Blueprint("routes", __name__)
 
+def verify_challenge(args) -> Optional[str]:
+    if args.get("hub.mode") == "subscribe" and args.get("hub.verify_token") == VERIFY_TOKEN:
+        return args.get("hub.challenge")
+    return None
+
 @bp.get("/whatsapp/webhook")
 def verify():
     try:
-        mode = request.args.get("hub.mode"); token = request.args.get("hub.verify_token"); challenge = request.args.get("hub.challenge")
-        if mode == "subscribe" and token == VERIFY_TOKEN: return challenge, 200
+        challenge = verify_challenge(request.args)
+        if challenge is not None: return challenge, 200
         return "forbidden", 403
     except Exception as e:
         logging.exception("Verification error: %s", e); return "forbidden", 403
 
 @bp.post("/whatsapp/webhook")
 def inbound():
+    data = request.get_json(force=True, silent=True) or {}
+    return jsonify(status=handle_webhook(data)), 200
+
+@timed("webhook")
+def handle_webhook(data: dict) -> str:
+    # Framework-free so the asyncio runtime (asgi.py) runs the same code; returns the reply status.
     try:
-        data = request.get_json(force=True, silent=True) or {}
-        logging.info("Inbound: %s", data)
+        payload = sample_payload(data)
+        if payload is not None: logging.info("Inbound webhook sample", extra={"payload": payload})
+        statuses = []
         for entry in data.get("entry", []):
             for change in entry.get("changes", []):
                 value = change.get("value", {})
                 messages = value.get("messages", [])
+                statuses += value.get("statuses") or []
                 contact_name = ""
                 try:
                     contacts = value.get("contacts", [])
@@ -38,90 +54,173 @@ def inbound():
                     try:
                         wa_id = msg.get("from")
                         if not wa_id: continue
+                        msg_id = msg.get("id")
+                        if msg_id and not first_seen(msg_id):
+                            inc("webhook_duplicates_total")
+                            logging.info("Skipping redelivered message", extra={"msg_id": msg_id}); continue
+                        inc("webhook_messages_total", type=msg.get("type") or "unknown")
+                        logging.info("Inbound message", extra={"wa_id": wa_id, "msg_id": msg_id, "kind": msg.get("type")})
                         sess = get_session(wa_id)
-                        if sess.get("human"): continue
-
-                        mtype = msg.get("type"); text_lower = ""; list_reply_id = None
-                        if mtype == "text":
-                            text_lower = (msg.get("text", {}).get("body") or "").strip().lower()
-                        elif mtype == "interactive":
-                            inter = msg.get("interactive", {})
-                            if "list_reply" in inter: list_reply_id = inter["list_reply"]["id"]
-
-                        if text_lower in {"hi","hello","hey","start","menu"}:
-                            send_category_menu(wa_id); sess["state"]="MENU"; continue
-                        if text_lower in {"1bhk","1 bhk"}:
-                            send_listings_menu(wa_id,"1bhk"); sess["state"]="LIST_1BHK"; sess["last_cat"]="1bhk"; continue
-                        if text_lower in {"studio","studios"}:
-                            send_listings_menu(wa_id,"studio"); sess["state"]="LIST_STUDIO"; sess["last_cat"]="studio"; continue
-                        if text_lower == "agent":
-                            sess["human"]=True; send_text(wa_id,"Thanks. A leasing specialist will join shortly."); continue
-                        if text_lower and sess["state"]=="NEW":
-                            send_category_menu(wa_id); sess["state"]="MENU"; continue
-
-                        if list_reply_id:
-                            if list_reply_id == "cat_1bhk":
-                                send_listings_menu(wa_id,"1bhk"); sess["state"]="LIST_1BHK"; sess["last_cat"]="1bhk"; continue
-                            if list_reply_id == "cat_studio":
-                                send_listings_menu(wa_id,"studio"); sess["state"]="LIST_STUDIO"; sess["last_cat"]="studio"; continue
-                            if list_reply_id.startswith("listing_"):
-                                listing_id = list_reply_id.replace("listing_","",1)
-                                listing = find_listing(listing_id)
-                                if listing:
-                                    # 1) Untrimmed echo
-                                    send_selection_echo(wa_id, listing)
-                                    # 2) Log
-                                    cat = sess.get("last_cat") or ("1bhk" if "1BHK" in (listing.get("title","").upper()) else "studio")
-                                    try:
-                                        log_enquiry(wa_number=wa_id, wa_name=contact_name, category=cat.upper(),
-                                                    unit_id=listing.get("id",""), title=listing.get("title",""),
-                                                    desc=listing.get("desc",""))
-                                    except Exception: logging.exception("log_enquiry failed")
-                                    # 3) Contact + photos
-                                    send_listing_details(wa_id, listing)
-                                    # 4) Show list again
-                                    if sess.get("last_cat"): send_listings_menu(wa_id, sess["last_cat"])
-                                else:
-                                    send_text(wa_id,"Sorry, that listing is unavailable. Please choose another option.")
-                                continue
-
-                        if sess.get("last_cat"): send_listings_menu(wa_id, sess["last_cat"])
-                        else: send_category_menu(wa_id)
+                        try: route(wa_id, sess, msg, contact_name)
+                        finally: save_session(sess)
 
                     except Exception as inner:
                         logging.exception("Error handling single message: %s", inner)
                         continue
 
-        return jsonify(status="ok"), 200
+        if statuses:
+            try: delivery.ingest(statuses)
+            except Exception as e: logging.exception("Status callback ingest failed: %s", e)
+        return "ok"
     except Exception as e:
         logging.exception("Inbound webhook error: %s", e)
-        return jsonify(status="error"), 200
+        return "error"
 
 # Admin endpoints — now protected
 @bp.get("/admin/sheets/init")
 @admin_required
 def admin_sheets_init():
-    from .sheets import _ensure_sheet, spreadsheet_url
+    from .sheets import init_sheet, spreadsheet_url
     try:
-        _, _, ws = _ensure_sheet(); url = spreadsheet_url()
+        _, _, ws = init_sheet(); url = spreadsheet_url()
         return {"ok": bool(ws), "url": url}, 200
     except Exception as e:
         logging.exception("Admin sheets init failed: %s", e)
         return {"ok": False, "error": str(e)}, 200
 
+@bp.post("/admin/sheets/reconcile")
+@admin_required
+def admin_sheets_reconcile():
+    from .sheets import reconcile_mirror
+    try:
+        ts_from, ts_to = _range_args()
+        return {"ok": True, "rows": reconcile_mirror(ts_from, ts_to)}, 200
+    except Exception as e:
+        logging.exception("Admin sheets reconcile failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+@bp.post("/admin/sheets/rotate")
+@admin_required
+def admin_sheets_rotate():
+    from .sheets import rotate_if_due
+    try:
+        title = rotate_if_due(force=request.args.get("force") == "1")
+        return {"ok": True, "archived": title}, 200
+    except Exception as e:
+        logging.exception("Admin sheets rotate failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+@bp.get("/admin/sheets/partitions")
+@admin_required
+def admin_sheets_partitions():
+    from .enquiries import partitions
+    try:
+        return {"ok": True, "partitions": partitions()}, 200
+    except Exception as e:
+        logging.exception("Admin sheets partitions failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+@bp.get("/admin/enquiries")
+@admin_required
+def admin_enquiries():
+    # ?from=&to= (ISO-8601 UTC, default last 7 days) &source=mirror|sheet
+    from .sheets import query_rows
+    try:
+        ts_from, ts_to = _range_args()
+        if ts_from is None: ts_from = time.time() - 7*24*3600
+        rows = query_rows(ts_from, ts_to, source=request.args.get("source", "mirror"))
+        return {"ok": True, "count": len(rows), "rows": rows}, 200
+    except Exception as e:
+        logging.exception("Admin enquiries query failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+def _range_args():
+    from .enquiries import parse_ts
+    bounds = []
+    for name in ("from", "to"):
+        raw = request.args.get(name)
+        ts = parse_ts(raw) if raw else None
+        if raw and ts is None: raise ValueError(f"bad '{name}' timestamp: {raw}")
+        bounds.append(ts)
+    return bounds[0], bounds[1]
+
+@bp.get("/admin/delivery")
+@admin_required
+def admin_delivery():
+    # ?from=&to= (ISO-8601 UTC, default last 24 hours) &retryable=1 &wamid=
+    try:
+        if request.args.get("wamid"):
+            return {"ok": True, "message": delivery.lookup(request.args["wamid"])}, 200
+        ts_from, ts_to = _range_args()
+        if ts_from is None: ts_from = time.time() - 24*3600
+        return {"ok": True, **delivery.stats(ts_from, ts_to),
+                "failures": delivery.failures(ts_from, ts_to, retryable_only=request.args.get("retryable") == "1")}, 200
+    except Exception as e:
+        logging.exception("Admin delivery query failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+@bp.post("/admin/media/prewarm")
+@admin_required
+def admin_media_prewarm():
+    from .media import prewarm_media
+    try:
+        summary = prewarm_media(max_age=0) if request.args.get("force") == "1" else prewarm_media()
+        return {"ok": True, **summary}, 200
+    except Exception as e:
+        logging.exception("Admin media prewarm failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
+@bp.get("/admin/media/report")
+@admin_required
+def admin_media_report():
+    from .media import optimization_report
+    try:
+        return {"ok": True, **optimization_report()}, 200
+    except Exception as e:
+        logging.exception("Admin media report failed: %s", e)
+        return {"ok": False, "error": str(e)}, 200
+
 @bp.post("/admin/digest/send-now")
 @admin_required
 def admin_digest_now():
     try:
         from .digest import send_digest_once
-        send_digest_once()
-        return {"ok": True}, 200
+        return {"ok": bool(send_digest_once())}, 200
     except Exception as e:
         logging.exception("Admin digest send failed: %s", e)
         return {"ok": False, "error": str(e)}, 200
 
 
 
+@bp.get("/metrics")
+def metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+def _dep(name: str, configured: bool, deps: dict) -> dict:
+    d = deps.get(name, {})
+    ok = configured and d.get("last_error", 0) <= d.get("last_ok", 0)
+    return {"ok": ok, "configured": configured,
+            **{k: round(time.time() - v, 1) for k, v in (("last_ok_age_s", d.get("last_ok")), ("last_error_age_s", d.get("last_error"))) if v}}
+
+@bp.get("/health")
+def health():
+    # Local stores must be readable (503 otherwise); remote dependencies only degrade.
+    from . import outbox, enquiries
+    from .sheets import sheets_configured
+    from .emailer import _smtp_ok
+    checks, status = {}, "ok"
+    for name, probe in (("outbox", lambda: {"depth": outbox.depth()}),
+                        ("enquiry_spool", lambda: {"pending": enquiries.pending()})):
+        try: checks[name] = {"ok": True, **probe()}
+        except Exception as e:
+            checks[name] = {"ok": False, "error": str(e)}; status = "fail"
+    deps = dependency_status()
+    checks["whatsapp"] = _dep("whatsapp", bool(WHATSAPP_TOKEN and PHONE_NUMBER_ID), deps)
+    checks["sheets"] = _dep("sheets", sheets_configured(), deps)
+    checks["smtp"] = _dep("smtp", _smtp_ok(), deps)
+    if status == "ok" and not all(c["ok"] for c in checks.values()): status = "degraded"
+    return {"status": status, "checks": checks}, (503 if status == "fail" else 200)
+
 # swallow favicon requests without cluttering logs
 @bp.get("/favicon.ico")
 def favicon():
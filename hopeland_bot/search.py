@@ -0,0 +1,72 @@
+# hopeland_bot/search.py
+# Free-text listing search. Each catalog snapshot (data.py) builds one SearchIndex over
+# listing id, title, description and category; a lookup is a few dict probes plus a
+# bisect for prefix matches, so it runs inline in the webhook.
+import re
+import math
+import bisect
+import unicodedata
+from typing import Dict, Iterable, List, Tuple
+
+# Field weights: an id hit beats a title hit beats a description hit.
+FIELDS = (("id", 3.0), ("title", 2.0), ("category", 1.5), ("desc", 1.0))
+PREFIX_WEIGHT = 0.6   # "bath" -> bathroom / bathtub, scored below an exact token
+MIN_PREFIX = 3
+MIN_SCORE = 0.5       # drops matches on words nearly every listing has ("room")
+
+# Includes short chat replies ("no", "ok") so they are not read as searches ("no partition").
+STOPWORDS = frozenset("""a an and any are at do for from have i im in is it looking me my need of on
+or please show some that the there this to u want with you
+yes yeah yep no nope not ok okay k sure fine thanks thank thx ty bye""".split())
+SYNONYMS = {"tub": "bathtub", "washroom": "bathroom", "toilet": "bathroom", "large": "big", "huge": "big",
+            "1br": "1bhk", "onebhk": "1bhk", "bed": "room", "bedroom": "room"}
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_BHK = re.compile(r"\b(\d)\s*-?\s*(bhk|br)\b")
+
+def _stem(tok: str) -> str:
+    if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"): tok = tok[:-1]
+    return SYNONYMS.get(tok, tok)
+
+def normalize(text: str) -> List[str]:
+    # Lower-case ASCII tokens, "1 bhk" joined, stopwords dropped, plurals and synonyms folded.
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode().lower()
+    text = _BHK.sub(r"\1\2", text)
+    return [_stem(t) for t in _TOKEN.findall(text) if t not in STOPWORDS]
+
+class SearchIndex:
+    def __init__(self, docs: Iterable[Tuple[str, Dict[str, str]]]):
+        # docs: (listing id, {field: text}) in catalog order, which also breaks ties.
+        self.postings: Dict[str, Dict[str, float]] = {}
+        self.order: Dict[str, int] = {}
+        for doc_id, fields in docs:
+            self.order.setdefault(doc_id, len(self.order))
+            for field, weight in FIELDS:
+                for tok in normalize(fields.get(field, "")):
+                    post = self.postings.setdefault(tok, {})
+                    if weight > post.get(doc_id, 0.0): post[doc_id] = weight
+        n = len(self.order)
+        self.idf = {t: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5)) for t, p in self.postings.items()}
+        self.terms = sorted(self.postings)
+
+    def _expand(self, tok: str) -> List[Tuple[str, float]]:
+        out = [(tok, 1.0)] if tok in self.postings else []
+        if len(tok) >= MIN_PREFIX:
+            i = bisect.bisect_right(self.terms, tok)
+            while i < len(self.terms) and self.terms[i].startswith(tok):
+                out.append((self.terms[i], PREFIX_WEIGHT)); i += 1
+        return out
+
+    def search(self, text: str, limit: int = 5) -> List[Tuple[str, float]]:
+        scores: Dict[str, float] = {}
+        for tok in set(normalize(text)):
+            best: Dict[str, float] = {}  # one query word counts once per listing
+            for term, factor in self._expand(tok):
+                idf = self.idf[term] * factor
+                for doc_id, weight in self.postings[term].items():
+                    s = idf * weight
+                    if s > best.get(doc_id, 0.0): best[doc_id] = s
+            for doc_id, s in best.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + s
+        ranked = sorted((d for d, s in scores.items() if s >= MIN_SCORE), key=lambda d: (-scores[d], self.order[d]))
+        return [(d, round(scores[d], 3)) for d in ranked[:limit]]
@@ -1,10 +1,16 @@
-import os, json, logging
+import os, json, time, socket, logging, threading
 from datetime import datetime, timezone
 from zoneinfo import ZoneInfo
-from typing import List, Dict, Any, Optional
-import gspread
-from google.oauth2.service_account import Credentials
-from .config import SHEET_STATE_PATH
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Tuple
+from .config import SHEET_STATE_PATH, SHEET_ROTATE_LOCK_PATH
+from . import enquiries, alerts
+from .metrics import timed, mark, inc, register_collector
+from .utils import leader_lock
+
+# gspread / google-auth are imported on first use so workers that never touch Sheets
+# don't pay for them at boot.
+if TYPE_CHECKING:
+    from google.oauth2.service_account import Credentials
 
 SCOPE = ["https://www.googleapis.com/auth/drive","https://www.googleapis.com/auth/spreadsheets"]
 
@@ -14,46 +20,87 @@ SHEET_ID     = os.environ.get("SHEET_ID","").strip()
 SHEET_TITLE  = os.environ.get("SHEET_TITLE","HOPELAND Muither Leads").strip()
 OWNERS_EMAILS= [e.strip() for e in os.environ.get("OWNERS_EMAILS","").split(",") if e.strip()]
 LOCAL_TZ_NAME= os.environ.get("LOCAL_TZ","Asia/Qatar")
+SHEET_ORDER  = os.environ.get("SHEET_ORDER","append").strip().lower()  # "append" | "newest_first"
+FLUSH_BATCH  = int(os.environ.get("SHEET_FLUSH_BATCH","50"))
+FLUSH_SECONDS= float(os.environ.get("SHEET_FLUSH_SECONDS","15"))
+SHEET_ROTATION = os.environ.get("SHEET_ROTATION","monthly").strip().lower()  # "monthly" | "off"
 
 HEADERS = ["Timestamp UTC","Timestamp Local","WA Number","WA Name","Category","Unit ID","Title","Description","Reviewed"]
+INDEX_TITLE   = "Archive Index"
+INDEX_HEADERS = ["Worksheet","From UTC","To UTC","Rows","Archived UTC"]
+ROTATING_TITLE = "Leads (rotating)"  # the fresh worksheet while a rotation is in progress
 
-def _load_state_id() -> Optional[str]:
+_STATE: Tuple[Any, Dict[str, Any]] = (None, {})  # ((mtime_ns, inode), parsed state)
+
+def _load_state() -> Dict[str, Any]:
+    # Read on every flush and rotation check; re-parsed only when the file was replaced.
+    global _STATE
     try:
-        if os.path.isfile(SHEET_STATE_PATH):
+        st = os.stat(SHEET_STATE_PATH)
+    except OSError:
+        return {}
+    key = (st.st_mtime_ns, st.st_ino)
+    if _STATE[0] != key:
+        try:
             with open(SHEET_STATE_PATH,"r",encoding="utf-8") as f:
-                return (json.load(f) or {}).get("sheet_id")
-    except Exception as e:
-        logging.exception("Sheet state load failed: %s", e)
-    return None
+                _STATE = (key, json.load(f) or {})
+        except Exception as e:
+            logging.exception("Sheet state load failed: %s", e)
+            return {}
+    return dict(_STATE[1])
 
-def _save_state_id(sheet_id: str):
+def _save_state(**values):
     try:
+        state = {**_load_state(), **values}
         os.makedirs(os.path.dirname(SHEET_STATE_PATH), exist_ok=True)
-        with open(SHEET_STATE_PATH,"w",encoding="utf-8") as f:
-            json.dump({"sheet_id": sheet_id}, f)
+        tmp = SHEET_STATE_PATH + ".tmp"
+        with open(tmp,"w",encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, SHEET_STATE_PATH)
     except Exception as e:
         logging.exception("Sheet state save failed: %s", e)
 
+def _load_state_id() -> Optional[str]:
+    return _load_state().get("sheet_id")
+
+def _save_state_id(sheet_id: str):
+    _save_state(sheet_id=sheet_id)
+
+_CREDS: Optional["Credentials"] = None
+_HANDLE = None  # (gc, sh, ws) reused across enquiries until an error or a rotation invalidates it
+_HANDLE_PERIOD: Optional[str] = None  # live period the cached ws belongs to
+_HANDLE_LOCK = threading.RLock()
+
 def _client():
+    global _CREDS
     try:
         if not SERVICE_JSON or not os.path.isfile(SERVICE_JSON):
             raise FileNotFoundError("Service account JSON not found")
+        import gspread
+        from google.oauth2.service_account import Credentials
         creds = Credentials.from_service_account_file(SERVICE_JSON, scopes=SCOPE)
-        return gspread.authorize(creds)
+        gc = gspread.authorize(creds)
+        _CREDS = creds
+        return gc
     except Exception as e:
         logging.exception("Google client init failed: %s", e)
         return None
 
-def _ensure_sheet():
+def _refresh_token():
+    if _CREDS is not None and not _CREDS.valid:
+        from google.auth.transport.requests import Request
+        _CREDS.refresh(Request())
+
+def _open_sheet():
     gc = _client()
     if not gc: return None, None, None
     sid = SHEET_ID or _load_state_id()
-    sh = None
+    created = False
     try:
         if sid:
             sh = gc.open_by_key(sid)
         else:
-            sh = gc.create(SHEET_TITLE)
+            sh = gc.create(SHEET_TITLE); created = True
             _save_state_id(sh.id)
             logging.info("Created spreadsheet: https://docs.google.com/spreadsheets/d/%s", sh.id)
     except Exception as e:
@@ -61,27 +108,72 @@ def _ensure_sheet():
         return gc, None, None
     try:
         ws = sh.sheet1
-        if ws.row_values(1) != HEADERS:
-            ws.clear(); ws.insert_row(HEADERS, 1)
+        if created: ws.insert_row(HEADERS, 1)
     except Exception as e:
         logging.exception("Worksheet access failed: %s", e)
         return gc, sh, None
-    if OWNERS_EMAILS:
+    return gc, sh, ws
+
+def _ensure_sheet():
+    global _HANDLE, _HANDLE_PERIOD
+    with _HANDLE_LOCK:
+        period = _load_state().get("live_period") if SHEET_ROTATION == "monthly" else None
+        if _HANDLE is not None and period != _HANDLE_PERIOD:
+            _HANDLE = None  # another process rotated; our ws is an archive now
+        if _HANDLE is None:
+            handle = _open_sheet()
+            if not handle[2]: return handle
+            _HANDLE, _HANDLE_PERIOD = handle, period
         try:
-            for email in OWNERS_EMAILS:
-                try: sh.share(email, perm_type="user", role="writer", notify=True)
-                except Exception: pass
+            _refresh_token()
         except Exception as e:
-            logging.exception("Sharing failed: %s", e)
+            logging.exception("Google token refresh failed: %s", e)
+            _HANDLE = None
+            return None, None, None
+        return _HANDLE
+
+def invalidate_sheet():
+    global _HANDLE
+    with _HANDLE_LOCK:
+        _HANDLE = None
+
+def _share_with_owners(sh):
+    try:
+        existing = {(p.get("emailAddress") or "").lower() for p in sh.list_permissions()}
+    except Exception as e:
+        logging.exception("Listing sheet permissions failed: %s", e)
+        existing = set()
+    for email in OWNERS_EMAILS:
+        if email.lower() in existing: continue
+        try: sh.share(email, perm_type="user", role="writer", notify=True)
+        except Exception as e: logging.exception("Sharing with %s failed: %s", email, e)
+
+def init_sheet():
+    # Header check and owner sharing; run once at startup and from /admin/sheets/init.
+    invalidate_sheet()
+    gc, sh, ws = _ensure_sheet()
+    if not ws: return gc, sh, ws
+    try:
+        if ws.row_values(1) != HEADERS:
+            ws.clear(); ws.insert_row(HEADERS, 1)
+    except Exception as e:
+        logging.exception("Header check failed: %s", e)
+        invalidate_sheet()
+        return gc, sh, None
+    if OWNERS_EMAILS: _share_with_owners(sh)
     return gc, sh, ws
 
+def init_sheet_async():
+    if not sheets_configured(): return
+    threading.Thread(target=init_sheet, name="sheets-init", daemon=True).start()
+
 def spreadsheet_url() -> Optional[str]:
     sid = SHEET_ID or _load_state_id()
     return f"https://docs.google.com/spreadsheets/d/{sid}" if sid else None
 
+@timed("sheets", op="log_enquiry")
 def log_enquiry(wa_number, wa_name, category, unit_id, title, desc) -> bool:
-    gc, sh, ws = _ensure_sheet()
-    if not ws: return False
+    # Durable local write only; the flusher below pushes rows to the sheet in batches.
     try:
         now_utc = datetime.now(timezone.utc)
         tz = ZoneInfo(LOCAL_TZ_NAME)
@@ -91,31 +183,190 @@ def log_enquiry(wa_number, wa_name, category, unit_id, title, desc) -> bool:
             now_local.strftime("%Y-%m-%d %H:%M:%S"),
             wa_number, wa_name or "", category, unit_id, title, desc, "No"
         ]
-        ws.insert_rows([row], row=2)
+        enquiries.spool_row(row)
+        alerts.notify()
+        if enquiries.pending() >= FLUSH_BATCH: _FLUSH_WAKE.set()
         return True
     except Exception as e:
-        logging.exception("Insert to sheet failed: %s", e)
+        logging.exception("Spooling enquiry failed: %s", e)
         return False
 
+_FLUSH_WAKE = threading.Event()
+_FLUSHERS = set()  # pids with a running flusher
+
+@timed("sheets", op="flush")
+def flush_enquiries() -> int:
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    sent = 0
+    while True:
+        batch = enquiries.claim_batch(owner, FLUSH_BATCH, lease_seconds=120)
+        if not batch: return sent
+        ids = [i for i, _ in batch]; rows = [r for _, r in batch]
+        if _rotation_due():
+            with leader_lock(SHEET_ROTATE_LOCK_PATH) as leader:
+                if not leader:
+                    # another process is renaming the live worksheet; append once it is done
+                    enquiries.release(ids); return sent
+                _rotate()
+        _, _, ws = _ensure_sheet()
+        if not ws:
+            mark("sheets", False); enquiries.release(ids); return sent
+        try:
+            if SHEET_ORDER == "newest_first":
+                ws.insert_rows(list(reversed(rows)), row=2)
+            else:
+                ws.append_rows(rows, table_range="A1")
+        except Exception as e:
+            logging.exception("Flushing %d enquiries to sheet failed: %s", len(rows), e)
+            invalidate_sheet(); enquiries.release(ids); mark("sheets", False)
+            return sent
+        enquiries.ack(ids); sent += len(ids); mark("sheets", True)
+        logging.info("Flushed %d enquiries to sheet.", len(ids))
+
+def _flush_loop():
+    while True:
+        _FLUSH_WAKE.wait(FLUSH_SECONDS)
+        _FLUSH_WAKE.clear()
+        try: flush_enquiries()
+        except Exception as e: logging.exception("Enquiry flusher error: %s", e)
+
+def start_sheet_flusher():
+    pid = os.getpid()
+    if pid in _FLUSHERS: return
+    _FLUSHERS.add(pid)
+    threading.Thread(target=_flush_loop, name="sheets-flusher", daemon=True).start()
+
+@timed("sheets", op="get_rows_since")
 def get_rows_since(hours: int = 6):
-    _, _, ws = _ensure_sheet()
-    if not ws: return []
+    # Served from the local mirror; see reconcile_mirror() to backfill it from the sheet.
     try:
-        vals = ws.get_all_values()
-        if not vals or len(vals) < 2: return []
-        hdr = vals[0]
-        from datetime import datetime, timezone
         cutoff = datetime.now(timezone.utc).timestamp() - hours*3600
-        rows = []
-        for r in vals[1:]:
-            rec = dict(zip(hdr, r))
-            ts = rec.get("Timestamp UTC","")
-            try:
-                dt = datetime.fromisoformat(ts.replace("Z","+00:00"))
-                if dt.timestamp() >= cutoff: rows.append(rec)
-            except Exception:
-                rows.append(rec)
-        return rows
+        return [dict(zip(HEADERS, r)) for r in enquiries.rows_since(cutoff)]
     except Exception as e:
-        logging.exception("Read sheet failed: %s", e)
+        logging.exception("Read enquiry mirror failed: %s", e)
         return []
+
+# ---- Rotation: the live worksheet (sheet1) only holds the current month ----
+
+def _period(ts: Optional[float] = None) -> str:
+    return datetime.fromtimestamp(time.time() if ts is None else ts, timezone.utc).strftime("%Y-%m")
+
+def _period_start(period: str) -> float:
+    return datetime.strptime(period, "%Y-%m").replace(tzinfo=timezone.utc).timestamp()
+
+def _iso(ts: Optional[float]) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat(timespec="seconds") if ts is not None else ""
+
+def _index_ws(sh):
+    import gspread
+    try:
+        return sh.worksheet(INDEX_TITLE)
+    except gspread.WorksheetNotFound:
+        ws = sh.add_worksheet(title=INDEX_TITLE, rows=100, cols=len(INDEX_HEADERS))
+        ws.insert_row(INDEX_HEADERS, 1)
+        return ws
+
+def _rotation_due() -> bool:
+    return SHEET_ROTATION == "monthly" and _load_state().get("live_period") != _period()
+
+def rotate_if_due(force: bool = False) -> Optional[str]:
+    if SHEET_ROTATION != "monthly": return None
+    if not force and not _rotation_due(): return None
+    with leader_lock(SHEET_ROTATE_LOCK_PATH) as leader:
+        return _rotate(force) if leader else None
+
+@timed("sheets", dep="sheets", op="rotate")
+def _rotate(force: bool = False) -> Optional[str]:
+    # Once its month is over the live worksheet is renamed "Leads YYYY-MM", recorded in the
+    # archive index, and replaced by a fresh one with the same title and HEADERS only.
+    # The fresh sheet is built first and takes the live title last; a failing step undoes
+    # the earlier ones, so the next attempt starts from the same sheets. Callers hold the
+    # rotate lock.
+    current = _period()
+    live = _load_state().get("live_period")
+    if live is None:
+        _save_state(live_period=current)  # first run adopts the existing sheet as this month's
+        return None
+    if live == current and not force: return None
+    _, sh, ws = _ensure_sheet()
+    if not ws: return None
+    undo = []
+    try:
+        stamps = [t for t in (enquiries.parse_ts(v) for v in ws.col_values(1)[1:]) if t is not None]
+        existing = {w.title: w for w in sh.worksheets()}
+        if ROTATING_TITLE in existing: sh.del_worksheet(existing.pop(ROTATING_TITLE))  # left by a killed rotation
+        title, n = f"Leads {live}", 2
+        while title in existing: title, n = f"Leads {live} ({n})", n + 1
+        live_title = ws.title
+        fresh = sh.add_worksheet(title=ROTATING_TITLE, rows=1000, cols=len(HEADERS))
+        undo.append(lambda: sh.del_worksheet(fresh))
+        fresh.insert_row(HEADERS, 1)
+        ws.update_title(title)
+        undo.append(lambda: ws.update_title(live_title))
+        fresh.update_title(live_title)
+        fresh.update_index(0)
+        ts_from, ts_to = (min(stamps), max(stamps)) if stamps else (None, None)
+        enquiries.add_partition(title, ts_from, ts_to, len(stamps))  # replaced by a retry if a later step fails
+        _index_ws(sh).append_row([title, _iso(ts_from), _iso(ts_to), len(stamps), _iso(time.time())])
+    except Exception as e:
+        logging.exception("Sheet rotation failed: %s", e)
+        for step in reversed(undo):
+            try: step()
+            except Exception as e2: logging.exception("Undoing the sheet rotation failed: %s", e2)
+        invalidate_sheet()
+        return None
+    _save_state(live_period=current)
+    invalidate_sheet(); inc("sheet_rotations_total")
+    logging.info("Rotated live worksheet into %s (%d rows).", title, len(stamps))
+    return title
+
+def _read_partitions(ts_from: Optional[float], ts_to: Optional[float]) -> Optional[List[list]]:
+    # Rows (in HEADERS order) from the live worksheet plus only the archives overlapping the range.
+    import gspread
+    _, sh, ws = _ensure_sheet()
+    if not ws: return None
+    live = _load_state().get("live_period")
+    sheets = []
+    if ts_to is None or not live or ts_to >= _period_start(live): sheets.append(ws)
+    if ts_from is not None:
+        for p in enquiries.partitions(ts_from, ts_to):
+            try: sheets.append(sh.worksheet(p["title"]))
+            except gspread.WorksheetNotFound: logging.warning("Archived worksheet %s is missing.", p["title"])
+    rows: List[list] = []
+    try:
+        for w in sheets:
+            vals = w.get_all_values()
+            if len(vals) < 2: continue
+            hdr = vals[0]
+            rows.extend([dict(zip(hdr, r)).get(h, "") for h in HEADERS] for r in vals[1:])
+    except Exception as e:
+        logging.exception("Read sheet failed: %s", e)
+        invalidate_sheet()
+        return None
+    return rows
+
+@timed("sheets", dep="sheets", op="reconcile")
+def reconcile_mirror(ts_from: Optional[float] = None, ts_to: Optional[float] = None) -> int:
+    # Live worksheet by default; pass a range to also backfill the archives that cover it.
+    rows = _read_partitions(ts_from, ts_to)
+    if not rows: return 0
+    n = enquiries.upsert_rows(rows)
+    logging.info("Enquiry mirror reconciled from sheet (%d rows).", n)
+    return n
+
+@timed("sheets", op="query")
+def query_rows(ts_from: float, ts_to: Optional[float] = None, source: str = "mirror") -> List[Dict[str, Any]]:
+    # Newest first. source="sheet" reads the covering partitions instead of the local mirror.
+    if source != "sheet":
+        return [dict(zip(HEADERS, r)) for r in enquiries.rows_since(ts_from, ts_to)]
+    out = []
+    for r in _read_partitions(ts_from, ts_to) or []:
+        ts = enquiries.parse_ts(r[0])
+        if ts is not None and ts >= ts_from and (ts_to is None or ts < ts_to): out.append((ts, r))
+    out.sort(key=lambda x: x[0], reverse=True)
+    return [dict(zip(HEADERS, r)) for _, r in out]
+
+def sheets_configured() -> bool:
+    return bool(SERVICE_JSON and os.path.isfile(SERVICE_JSON))
+
+register_collector(lambda: [("enquiry_spool_pending", "gauge", {}, enquiries.pending())])
@@ -1,13 +1,140 @@
 # hopeland_bot/state.py
+import os
 import time
-from typing import Dict
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+from .config import SESSION_BACKEND, SESSION_TTL_SECONDS, SESSION_MAX, SESSIONS_DB_PATH, SESSION_SWEEP_SECONDS
+from .db import connect
+from .metrics import register_collector
 
-SESSIONS: Dict[str, Dict] = {}  # wa_id -> session dict
+class Session:
+    # Compact fixed-slot record; dict-style access kept for the routes code.
+    __slots__ = ("wa_id", "human", "state", "last_cat", "last_seen")
 
-def get_session(wa_id: str) -> Dict:
-    sess = SESSIONS.setdefault(
-        wa_id,
-        {"human": False, "state": "NEW", "last_cat": None, "last_seen": time.time()}
-    )
-    sess["last_seen"] = time.time()
+    def __init__(self, wa_id: str, human: bool = False, state: str = "NEW",
+                 last_cat: Optional[str] = None, last_seen: float = 0.0):
+        self.wa_id = wa_id; self.human = human; self.state = state
+        self.last_cat = last_cat; self.last_seen = last_seen
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__: raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in self.__slots__: raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+class MemorySessionBackend:
+    # Per-process LRU with TTL; fine for a single worker.
+    def __init__(self, max_entries: int = SESSION_MAX, ttl: float = SESSION_TTL_SECONDS):
+        self.max_entries = max_entries; self.ttl = ttl
+        self._items: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, wa_id: str) -> Optional[Session]:
+        with self._lock:
+            sess = self._items.get(wa_id)
+            if sess is None: return None
+            if time.time() - sess.last_seen > self.ttl:
+                del self._items[wa_id]; return None
+            self._items.move_to_end(wa_id)
+            return sess
+
+    def save(self, sess: Session):
+        with self._lock:
+            self._items[sess.wa_id] = sess
+            self._items.move_to_end(sess.wa_id)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def sweep(self) -> int:
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            stale = [k for k, s in self._items.items() if s.last_seen < cutoff]
+            for k in stale: del self._items[k]
+        return len(stale)
+
+    def __len__(self):
+        return len(self._items)
+
+class SqliteSessionBackend:
+    # Shared by every worker (and the digest container) through DATA_DIR.
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        wa_id     TEXT PRIMARY KEY,
+        human     INTEGER NOT NULL,
+        state     TEXT NOT NULL,
+        last_cat  TEXT,
+        last_seen REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS sessions_seen ON sessions(last_seen);
+    """
+
+    def __init__(self, path: str = SESSIONS_DB_PATH, ttl: float = SESSION_TTL_SECONDS, max_entries: int = SESSION_MAX):
+        self.path = path; self.ttl = ttl; self.max_entries = max_entries
+
+    def _conn(self):
+        return connect(self.path, self._SCHEMA)
+
+    def load(self, wa_id: str) -> Optional[Session]:
+        row = self._conn().execute(
+            "SELECT human, state, last_cat, last_seen FROM sessions WHERE wa_id=? AND last_seen >= ?",
+            (wa_id, time.time() - self.ttl)).fetchone()
+        if not row: return None
+        return Session(wa_id, bool(row[0]), row[1], row[2], row[3])
+
+    def save(self, sess: Session):
+        self._conn().execute(
+            "INSERT INTO sessions (wa_id, human, state, last_cat, last_seen) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(wa_id) DO UPDATE SET human=excluded.human, state=excluded.state, "
+            "last_cat=excluded.last_cat, last_seen=excluded.last_seen",
+            (sess.wa_id, int(bool(sess.human)), sess.state, sess.last_cat, sess.last_seen))
+
+    def sweep(self) -> int:
+        # Expired rows, then the least recently seen beyond max_entries (the LRU bound).
+        conn = self._conn()
+        n = conn.execute("DELETE FROM sessions WHERE last_seen < ?", (time.time() - self.ttl,)).rowcount
+        return n + conn.execute(
+            "DELETE FROM sessions WHERE wa_id IN (SELECT wa_id FROM sessions ORDER BY last_seen DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)).rowcount
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+BACKENDS = {"memory": MemorySessionBackend, "sqlite": SqliteSessionBackend}
+SESSIONS = BACKENDS.get(SESSION_BACKEND, SqliteSessionBackend)()
+
+def get_session(wa_id: str) -> Session:
+    sess = SESSIONS.load(wa_id)
+    if sess is None:
+        sess = Session(wa_id)
+    sess.last_seen = time.time()
+    if isinstance(SESSIONS, MemorySessionBackend):
+        SESSIONS.save(sess)
     return sess
+
+def save_session(sess: Session):
+    SESSIONS.save(sess)
+
+_SWEEPER_STARTED = set()  # pids
+
+def _sweep_loop():
+    while True:
+        time.sleep(SESSION_SWEEP_SECONDS)
+        try:
+            n = SESSIONS.sweep()
+            if n: logging.info("Session sweeper evicted %d idle sessions.", n)
+        except Exception as e:
+            logging.exception("Session sweep failed: %s", e)
+
+def start_session_sweeper():
+    if os.getpid() in _SWEEPER_STARTED: return
+    _SWEEPER_STARTED.add(os.getpid())
+    threading.Thread(target=_sweep_loop, name="session-sweeper", daemon=True).start()
+
+register_collector(lambda: [("sessions", "gauge", {"backend": SESSION_BACKEND}, len(SESSIONS))])
@@ -1,4 +1,8 @@
+import os
+import fcntl
+import inspect
 import logging
+from contextlib import contextmanager
 from functools import wraps
 from typing import Callable, Any
 from flask import request
@@ -9,6 +13,15 @@ def clip(s: str, n: int) -> str:
     return s if len(s) <= n else s[: max(0, n - 1)].rstrip() + "…"
 
 def safe(fn: Callable[..., Any]) -> Callable[..., Any]:
+    if inspect.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def _await(*args, **kwargs):
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as e:
+                logging.exception("Error in %s: %s", fn.__name__, e)
+                return None
+        return _await
     @wraps(fn)
     def _wrap(*args, **kwargs):
         try:
@@ -18,6 +31,18 @@ def safe(fn: Callable[..., Any]) -> Callable[..., Any]:
             return None
     return _wrap
 
+@contextmanager
+def leader_lock(path: str):
+    # Non-blocking flock on the shared volume; yields whether this process is the leader.
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False; return
+        try: yield True
+        finally: fcntl.flock(f, fcntl.LOCK_UN)
+
 def admin_required(fn):
     @wraps(fn)
     def _wrap(*args, **kwargs):
@@ -1,91 +1,269 @@
-import time, logging, requests
-from typing import Dict, List
-from .config import GRAPH_API_BASE, WHATSAPP_TOKEN, HUMAN_CONTACT
-from .utils import clip, safe
-from .data import LISTINGS
+import os, time, socket, logging, threading
+from typing import Callable, Dict, Generator, List, Optional, Tuple
+from .config import (HUMAN_CONTACT, OUTBOX_WORKERS, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS,
+                     OUTBOX_COALESCE_SECONDS, OUTBOX_COALESCE_KINDS)
+from .graph import graph_client, maybe_delivered
+from .metrics import timed, inc, register_collector
+from .utils import safe, clip
+from .logs import sample_payload
+from .data import CATALOG, find_listing
 from .media import build_image_payload
+from . import outbox, delivery
 
+def _json(r) -> dict:
+    try: return r.json()
+    except ValueError: return {}
+
+def _log_fields(payload: dict, status=None) -> dict:
+    return {"wa_id": payload.get("to"), "kind": payload.get("type"), "status": status,
+            "payload": sample_payload(payload, force=True)}
+
+@timed("graph_request", dep="whatsapp", op="message")
 def _wa_post(payload: dict) -> bool:
     try:
-        url = f"{GRAPH_API_BASE}/messages"
-        headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-        r = requests.post(url, json=payload, headers=headers, timeout=15)
+        r = graph_client().post("/messages", json=payload, timeout=15, recipient=payload.get("to"))
         if not r.ok:
-            logging.error("WA POST failed: %s | Payload=%s", r.text, payload); return False
+            logging.error("WA POST failed: %s", clip(r.text, 500), extra=_log_fields(payload, r.status_code)); return False
+        delivery.record_send(delivery.wamid_of(_json(r)), payload.get("to"), payload.get("type"))
         return True
     except Exception as e:
-        logging.exception("WA POST error: %s | Payload=%s", e, payload); return False
+        return _post_error(payload, e)
 
-@safe
-def send_text(to: str, body: str):
-    _wa_post({"messaging_product":"whatsapp","to":to,"type":"text","text":{"body":body}})
+def _post_error(payload: dict, e: Exception) -> bool:
+    # Only a request Graph never received counts as refused (fallback / outbox retry);
+    # one that may have gone out is treated as sent rather than risking a duplicate.
+    if maybe_delivered(e):
+        inc("wa_send_unconfirmed_total", kind=payload.get("type"))
+        logging.warning("WA POST unconfirmed, not resending: %s", e, extra=_log_fields(payload)); return True
+    logging.exception("WA POST error: %s", e, extra=_log_fields(payload)); return False
 
-@safe
-def send_category_menu(to: str):
-    intro = ("Welcome to *HOPELAND Real Estates*.\n"
-             "Muither, Qatar — quality units in a well-kept villa.\n\n"
-             "What are you looking for today?")
-    payload = {
-        "messaging_product":"whatsapp","to":to,"type":"interactive",
-        "interactive":{"type":"list","body":{"text":intro},
-            "action":{"button":"Browse","sections":[{
-                "title":"Select a category",
-                "rows":[
-                    {"id":"cat_1bhk","title":"1BHK","description":"Spacious 1-bedroom units"},
-                    {"id":"cat_studio","title":"Studio","description":"Affordable studio options"}
-                ]}]}}}
-    ok = _wa_post(payload)
-    if not ok: send_text(to, "Categories:\n• 1BHK\n• Studio\nType *1BHK* or *Studio* to continue.")
-
-def _send_listings_menu_text_fallback(to: str, category_key: str):
-    cat_title = "1BHK" if category_key == "1bhk" else "Studio"
-    items: List[Dict] = LISTINGS[category_key]
-    lines = [f"{cat_title} listings:"]
-    for it in items:
-        lines.append(f"• {it['id']} — {clip(it['title'], 32)}")
-    lines.append("Reply with the code (e.g., R101) to receive photos.")
-    send_text(to, "\n".join(lines))
+# Every outgoing message sequence is a plan: a generator that yields Graph message
+# payloads. A payload Graph refuses is thrown back into the plan as SendFailed; plans
+# with a fallback catch it, anything else fails the whole outbox item so it is retried.
+# The thread senders below and the asyncio senders in aio.py drive the same plans.
+Plan = Generator[dict, None, None]
 
-@safe
-def send_listings_menu(to: str, category_key: str):
-    assert category_key in LISTINGS
-    cat_title = "1BHK" if category_key == "1bhk" else "Studio"
-    rows = []
-    for item in LISTINGS[category_key]:
-        rows.append({
-            "id": f"listing_{item['id']}",
-            "title": clip(f"{item['id']} {cat_title}", 24),
-            "description": clip(f"{item['title']} — {item['desc']}", 72)
-        })
-    payload = {
-        "messaging_product":"whatsapp","to":to,"type":"interactive",
-        "interactive":{"type":"list","body":{"text":f"We have the following listings for *{cat_title}*. Select an option to see photos."},
-            "action":{"button":"View options","sections":[{
-                "title": clip(f"{cat_title} Muither Villa", 24), "rows": rows }]}}}
-    ok = _wa_post(payload)
-    if not ok: _send_listings_menu_text_fallback(to, category_key)
+class SendFailed(Exception):
+    sent = 0  # leading payloads of the plan Graph accepted before the failure
+
+def _text(to: str, body: str) -> dict:
+    return {"messaging_product":"whatsapp","to":to,"type":"text","text":{"body":body}}
+
+def plan_text(to: str, body: str) -> Plan:
+    yield _text(to, body)
+
+def plan_category_menu(to: str) -> Plan:
+    try: yield CATALOG.category_payload(to)
+    except SendFailed: yield _text(to, CATALOG.category_fallback())
+
+def plan_listings_menu(to: str, category_key: str) -> Plan:
+    assert CATALOG.has_category(category_key)
+    try: yield CATALOG.listings_payload(to, category_key)
+    except SendFailed: yield _text(to, CATALOG.listings_fallback(category_key))
+
+def plan_search_results(to: str, listing_ids: List[str]) -> Plan:
+    try: yield CATALOG.search_payload(to, listing_ids)
+    except SendFailed: yield _text(to, CATALOG.search_fallback(listing_ids))
 
 def build_contact_message(listing: Dict) -> str:
     return (f"Thanks for your interest in *{listing['title']}* (Unit *{listing['id']}*, Muither).\n"
             f"For the quickest details and booking, please *call* us on *{HUMAN_CONTACT}*.\n"
             f"Kindly mention *Unit {listing['id']}* so we can assist immediately.")
 
-@safe
-def send_selection_echo(to: str, listing: Dict):
+def plan_selection_echo(to: str, listing: Dict) -> Plan:
     title = listing.get("title",""); desc = listing.get("desc","")
-    body = f"You selected:\n*{title}*\n\n{desc}".strip()
-    send_text(to, body)
+    yield _text(to, f"You selected:\n*{title}*\n\n{desc}".strip())
 
-@safe
-def send_listing_details(to: str, listing: Dict):
-    send_text(to, build_contact_message(listing))
+def plan_listing_details(to: str, listing: Dict) -> Plan:
+    yield _text(to, build_contact_message(listing))
     imgs = listing.get("images") or []
     if imgs:
-        send_text(to, f"Here are a few photos of *Unit {listing['id']}*.")
+        yield _text(to, f"Here are a few photos of *Unit {listing['id']}*.")
         for idx, img in enumerate(imgs, start=1):
             image_field = build_image_payload(img)
             if not image_field: continue
-            _wa_post({"messaging_product":"whatsapp","to":to,"type":"image",
-                      "image":{**image_field,"caption":f"Unit {listing['id']} — photo {idx}"}})
-            time.sleep(0.2)
-    send_text(to, "To keep browsing, type *menu* to return to categories.")
+            # a missing photo is skipped rather than repeating the whole sequence
+            try: yield {"messaging_product":"whatsapp","to":to,"type":"image",
+                        "image":{**image_field,"caption":f"Unit {listing['id']} — photo {idx}"}}
+            except SendFailed: continue
+    yield _text(to, "To keep browsing, type *menu* to return to categories.")
+
+_END = object()
+
+def _step(plan: Plan, failed: Optional[dict] = None):
+    # Next payload of the plan, after reporting the previous one as failed if it was.
+    try: return plan.throw(SendFailed(f"Graph refused {failed.get('type')} message")) if failed else next(plan)
+    except StopIteration: return _END
+
+def _run(plan: Plan, skip: int = 0):
+    # The first `skip` payloads went out on an earlier attempt: they are not sent again
+    # and count as accepted. On failure SendFailed.sent says where the next attempt resumes.
+    failed, i, accepted = None, -1, skip
+    while True:
+        try: payload = _step(plan, failed)
+        except SendFailed as e:
+            e.sent = accepted; raise
+        if payload is _END: return
+        i += 1
+        if i < skip: failed = None
+        elif _wa_post(payload): failed, accepted = None, i + 1
+        else: failed = payload
+
+@safe
+def send_text(to: str, body: str):
+    _run(plan_text(to, body))
+
+@safe
+def send_category_menu(to: str):
+    _run(plan_category_menu(to))
+
+@safe
+def send_listings_menu(to: str, category_key: str):
+    _run(plan_listings_menu(to, category_key))
+
+@safe
+def send_search_results(to: str, listing_ids: List[str]):
+    _run(plan_search_results(to, listing_ids))
+
+@safe
+def send_selection_echo(to: str, listing: Dict):
+    _run(plan_selection_echo(to, listing))
+
+@safe
+def send_listing_details(to: str, listing: Dict):
+    _run(plan_listing_details(to, listing))
+
+# ---- Outbox intents: the webhook enqueues, the sender pool below delivers ----
+
+INTENTS: Dict[str, Callable[..., Plan]] = {}
+
+def intent(kind: str):
+    def _register(fn):
+        INTENTS[kind] = fn
+        return fn
+    return _register
+
+@intent("text")
+def _intent_text(to: str, body: str) -> Plan:
+    return plan_text(to, body)
+
+@intent("category_menu")
+def _intent_category_menu(to: str) -> Plan:
+    return plan_category_menu(to)
+
+@intent("listings_menu")
+def _intent_listings_menu(to: str, category_key: str) -> Plan:
+    return plan_listings_menu(to, category_key)
+
+@intent("search_results")
+def _intent_search_results(to: str, listing_ids: List[str]) -> Plan:
+    return plan_search_results(to, listing_ids)
+
+@intent("selection_echo")
+def _intent_selection_echo(to: str, listing_id: str) -> Plan:
+    listing = find_listing(listing_id)
+    if listing: yield from plan_selection_echo(to, listing)
+
+@intent("listing_details")
+def _intent_listing_details(to: str, listing_id: str) -> Plan:
+    listing = find_listing(listing_id)
+    if listing: yield from plan_listing_details(to, listing)
+
+@intent("log_enquiry")
+def _intent_log_enquiry(to: str, **fields) -> Plan:
+    from .sheets import log_enquiry
+    log_enquiry(wa_number=to, **fields)
+    yield from ()  # local write only, nothing to send
+
+SILENT_INTENTS = {"log_enquiry"}  # nothing reaches the customer, so they don't count as "last sent"
+
+_WAKE = threading.Event()
+_WAKERS: List[Callable[[], None]] = []  # other senders to nudge on enqueue (aio.py)
+_POOL: Dict[int, List[threading.Thread]] = {}  # pid -> sender threads
+_POOL_LOCK = threading.Lock()
+
+def enqueue(to: str, kind: str, **args):
+    if kind not in INTENTS:
+        raise ValueError(f"Unknown outbox intent: {kind}")
+    if OUTBOX_COALESCE_SECONDS > 0 and kind in OUTBOX_COALESCE_KINDS:
+        dropped = outbox.put_latest(to, kind, OUTBOX_COALESCE_SECONDS, **args)
+        if dropped: inc("outbox_coalesced_total", dropped, kind=kind, stage="queued")
+    else:
+        outbox.put(to, kind, **args)
+    _WAKE.set()
+    for wake in _WAKERS: wake()
+
+def _repeat_of_last(wa_id: str, kind: str, key: str) -> bool:
+    # The customer's latest message from us is this exact menu, sent moments ago.
+    if OUTBOX_COALESCE_SECONDS <= 0 or kind not in OUTBOX_COALESCE_KINDS: return False
+    last = outbox.last_sent(wa_id)
+    return bool(last) and last[0] == key and time.time() - last[1] < OUTBOX_COALESCE_SECONDS
+
+Item = Tuple[int, str, dict, int, str, int]  # id, kind, args, attempts, coalescing key, payloads already sent
+
+def _next(wa_id: str, owner: str) -> Optional[Item]:
+    # Next deliverable item for wa_id; unknown intents and repeated menus are settled here.
+    while True:
+        item = outbox.next_item(wa_id)
+        if not item: return None
+        item_id, kind, args, attempts, sent = item
+        if kind not in INTENTS:
+            logging.error("Dropping outbox item %s with unknown intent %s", item_id, kind)
+            outbox.done(item_id); continue
+        key = outbox.item_key(kind, args)
+        if _repeat_of_last(wa_id, kind, key):
+            inc("outbox_coalesced_total", kind=kind, stage="sent")
+            outbox.done(item_id, wa_id, owner, OUTBOX_LEASE_SECONDS); continue
+        return item_id, kind, args, attempts, key, sent
+
+def _settle(wa_id: str, owner: str, item: Item, error: Optional[BaseException]) -> bool:
+    # Record the outcome; False means stop draining this wa_id until the retry is due.
+    item_id, kind, _, attempts, key, sent = item
+    if error is None:
+        outbox.done(item_id, wa_id, owner, OUTBOX_LEASE_SECONDS, sent_key="" if kind in SILENT_INTENTS else key)
+        return True
+    if attempts + 1 >= OUTBOX_MAX_ATTEMPTS:
+        logging.error("Outbox item %s (%s) dropped after %d attempts: %s", item_id, kind, attempts + 1, error, exc_info=error)
+        outbox.done(item_id)
+        return True
+    logging.warning("Outbox item %s (%s) failed, will retry: %s", item_id, kind, error)
+    outbox.retry(item_id, delay=2 ** attempts, sent=max(sent, getattr(error, "sent", 0)))
+    return False
+
+def _drain(wa_id: str, owner: str):
+    try:
+        while True:
+            item = _next(wa_id, owner)
+            if not item: return
+            error = None
+            try: _run(INTENTS[item[1]](wa_id, **item[2]), skip=item[5])
+            except Exception as e: error = e
+            if not _settle(wa_id, owner, item, error): return
+    finally:
+        outbox.release(wa_id, owner)
+
+def _sender_loop():
+    owner = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    while True:
+        try:
+            _WAKE.clear()
+            wa_id = outbox.claim(owner, OUTBOX_LEASE_SECONDS)
+            if not wa_id:
+                _WAKE.wait(1.0); continue
+            _drain(wa_id, owner)
+        except Exception as e:
+            logging.exception("Sender loop error: %s", e)
+            time.sleep(1.0)
+
+def start_sender_pool(workers: int = OUTBOX_WORKERS):
+    with _POOL_LOCK:
+        pid = os.getpid()
+        if pid in _POOL: return
+        threads = []
+        for i in range(max(0, workers)):
+            t = threading.Thread(target=_sender_loop, name=f"wa-sender-{i}", daemon=True)
+            t.start(); threads.append(t)
+        _POOL[pid] = threads
+        logging.info("Outbox sender pool started (%d threads, %d queued).", len(threads), outbox.depth())
+
+register_collector(lambda: [("outbox_depth", "gauge", {}, outbox.depth())])
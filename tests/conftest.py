@@ -0,0 +1,73 @@
+# tests/conftest.py
+# hopeland_bot reads its configuration at import time, so the environment (a scratch
+# DATA_DIR and the local fakes from bench/fakes.py) is set up before anything imports it.
+import os, sys, asyncio, tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fakes import FakeGraphAPI, FakeGspreadClient, SmtpSink
+
+GRAPH, SMTP = FakeGraphAPI(), SmtpSink()
+WORKDIR = tempfile.mkdtemp(prefix="hopeland-tests-")
+os.environ.update({
+    "DATA_DIR": os.path.join(WORKDIR, "data"), "GRAPH_API_ROOT": GRAPH.root,
+    "WHATSAPP_TOKEN": "test", "WHATSAPP_PHONE_ID": "PHONE_ID", "ADMIN_API_KEY": "test",
+    "GOOGLE_SERVICE_ACCOUNT_JSON": "", "SHEET_ID": "fake-sheet",
+    "EMAIL_SMTP_HOST": "127.0.0.1", "EMAIL_SMTP_PORT": str(SMTP.port), "EMAIL_SMTP_STARTTLS": "0",
+    "EMAIL_USERNAME": "test", "EMAIL_PASSWORD": "test", "OWNERS_EMAILS": "owner@example.com",
+    "GRAPH_MAX_RETRIES": "0", "OUTBOX_WORKERS": "0", "AIO_OUTBOX_WORKERS": "0", "OUTBOX_COALESCE_SECONDS": "0",
+    "RATE_LIMIT_GLOBAL_PER_SEC": "100000", "RATE_LIMIT_GLOBAL_BURST": "100000",
+    "RATE_LIMIT_RECIPIENT_PER_SEC": "100000", "RATE_LIMIT_RECIPIENT_BURST": "100000",
+    "MEDIA_OPTIMIZE": "0", "LOG_FORMAT": "text",
+})
+os.chdir(WORKDIR)  # catalog image paths are relative to the working directory
+
+import pytest
+from hopeland_bot import outbox, whatsapp, sheets
+from hopeland_bot.data import CATALOG
+
+GSPREAD = FakeGspreadClient()
+sheets._client = lambda: GSPREAD
+sheets.sheets_configured = lambda: True
+for items in CATALOG.listings().values():
+    for item in items:
+        for img in item.get("images") or []:
+            os.makedirs(os.path.dirname(img) or ".", exist_ok=True)
+            with open(img, "wb") as f: f.write(os.urandom(4096))
+
+@pytest.fixture
+def graph():
+    GRAPH.reset()
+    yield GRAPH
+    GRAPH.reset()
+
+@pytest.fixture
+def smtp():
+    return SMTP
+
+@pytest.fixture
+def gspread():
+    return GSPREAD
+
+@pytest.fixture(autouse=True)
+def _empty_outbox():
+    conn = outbox._conn()
+    for table in ("outbox", "outbox_lease", "outbox_last"): conn.execute(f"DELETE FROM {table}")
+    yield
+
+@pytest.fixture(params=["sync", "async"])
+def drain(request):
+    # drain(wa_id) delivers everything queued for wa_id with the thread or asyncio sender.
+    if request.param == "sync":
+        return lambda wa_id: whatsapp._drain(wa_id, "test")
+    pytest.importorskip("httpx")
+    from hopeland_bot import aio, graph as graph_mod
+
+    def _drain(wa_id):
+        async def _go():
+            try: await aio._drain(wa_id, "test")
+            finally: await graph_mod.close_async_graph_client()
+        asyncio.run(_go())
+    return _drain
@@ -0,0 +1,51 @@
+import threading
+import itertools
+import pytest
+from hopeland_bot import dedupe
+
+_N = itertools.count(1)
+
+@pytest.fixture
+def msg_id():
+    return f"wamid.dedupe.{next(_N)}"
+
+class _Clock:
+    def __init__(self, monkeypatch):
+        self.now = 1_000_000.0
+        monkeypatch.setattr(dedupe.time, "time", lambda: self.now)
+
+def _race(msg_id, n=8):
+    # Each thread has its own SQLite connection (db.connect is per thread) and skips the LRU.
+    results, barrier = [], threading.Barrier(n)
+    def claim():
+        barrier.wait()
+        with dedupe._LOCK: dedupe._LOCAL.pop(msg_id, None)
+        results.append(dedupe.first_seen(msg_id))
+    threads = [threading.Thread(target=claim) for _ in range(n)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return results
+
+def test_duplicate_within_the_window(msg_id):
+    assert dedupe.first_seen(msg_id)
+    assert not dedupe.first_seen(msg_id)
+    with dedupe._LOCK: dedupe._LOCAL.clear()  # another worker: only SQLite knows it
+    assert not dedupe.first_seen(msg_id)
+
+def test_accepted_again_after_expiry(msg_id, monkeypatch):
+    clock = _Clock(monkeypatch)
+    assert dedupe.first_seen(msg_id)
+    clock.now += dedupe.DEDUPE_TTL_SECONDS - 1
+    assert not dedupe.first_seen(msg_id)
+    clock.now += dedupe.DEDUPE_TTL_SECONDS + 1
+    assert dedupe.first_seen(msg_id)
+    assert not dedupe.first_seen(msg_id)
+
+def test_racing_connections_claim_a_message_once(msg_id):
+    assert sorted(_race(msg_id)) == [False] * 7 + [True]
+
+def test_racing_connections_reclaim_an_expired_message_once(msg_id, monkeypatch):
+    clock = _Clock(monkeypatch)
+    assert dedupe.first_seen(msg_id)
+    clock.now += dedupe.DEDUPE_TTL_SECONDS + 1
+    assert sorted(_race(msg_id)) == [False] * 7 + [True]
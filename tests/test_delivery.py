@@ -0,0 +1,53 @@
+import time
+import itertools
+import pytest
+from hopeland_bot import delivery
+from hopeland_bot.graph import THROTTLE_CODES
+from hopeland_bot.ratelimit import RateLimiter
+
+_N = itertools.count(1)
+
+@pytest.fixture
+def wamid():
+    return f"wamid.delivery.{next(_N)}"
+
+@pytest.fixture
+def lim(monkeypatch):
+    lim = RateLimiter(rate=10.0, burst=10.0, min_rate=1.0, cooldown=60.0)
+    monkeypatch.setattr(delivery, "limiter", lambda: lim)
+    return lim
+
+def _status(wamid, status, at, code=None):
+    st = {"id": wamid, "status": status, "timestamp": str(int(at)), "recipient_id": "97450000004"}
+    if code is not None: st["errors"] = [{"code": code, "title": "test"}]
+    return st
+
+def test_status_never_moves_backwards(wamid):
+    now = time.time()
+    delivery.record_send(wamid, "97450000004", "text")
+    assert delivery.ingest([_status(wamid, "read", now + 2)]) == 1
+    delivery.ingest([_status(wamid, "delivered", now + 1)])  # late callback
+    assert delivery.lookup(wamid)["status"] == "read"
+    assert delivery.ingest([_status(wamid, "read", now + 3)]) == 0  # redelivered
+    assert delivery.lookup(wamid)["read_at"] == int(now + 2)
+
+def test_throttle_error_lowers_the_rate(wamid, lim):
+    delivery.record_send(wamid, "97450000004", "text")
+    delivery.ingest([_status(wamid, "failed", time.time(), code=131000)])
+    assert lim.rate == 10.0
+    delivery.ingest([_status(wamid, "failed", time.time(), code=sorted(THROTTLE_CODES)[-1])])  # already failed
+    assert lim.rate == 10.0
+    other = wamid + ".b"
+    delivery.record_send(other, "97450000004", "text")
+    delivery.ingest([_status(other, "failed", time.time(), code=sorted(THROTTLE_CODES)[-1])])
+    assert lim.rate == 5.0 and lim.stats()["throttled"] == 1
+    assert delivery.lookup(other)["error_code"] in THROTTLE_CODES
+
+def test_unknown_wamid_is_recorded_without_raising(wamid, lim):
+    now = time.time()
+    assert delivery.ingest([_status(wamid, "delivered", now),
+                            {"id": wamid, "status": "deleted"}, {"status": "read"}, "junk"]) == 1
+    row = delivery.lookup(wamid)
+    assert row["status"] == "delivered" and row["accepted_at"] is None and row["wa_id"] == "97450000004"
+    delivery.record_send(wamid, "97450000004", "text")  # the send is recorded after its callback
+    assert delivery.lookup(wamid)["status"] == "delivered"
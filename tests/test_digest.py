@@ -0,0 +1,54 @@
+import itertools
+from datetime import datetime, timezone
+import pytest
+from hopeland_bot import digest, emailer, enquiries
+
+_N = itertools.count(1)
+
+@pytest.fixture
+def mail(monkeypatch, smtp):
+    # Queue without the background sender; tests deliver with _send_one().
+    monkeypatch.setattr(emailer, "start_mail_sender", lambda: None)
+    emailer._conn().execute("DELETE FROM mail")
+    for name in (digest.PENDING_MAIL, digest.PENDING_UPTO):
+        enquiries.set_cursor(name, 0)
+    enquiries.set_cursor(digest.WATERMARK, enquiries.last_id())
+    smtp.drop_sessions = 0
+    yield smtp
+    smtp.drop_sessions = 0
+
+def _lead(unit="R101"):
+    ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    enquiries.upsert_rows([[ts, "", f"9198{next(_N):08d}", "Test", "1bhk", unit, "Unit", "", ""]])
+    return enquiries.last_id()
+
+def _deliver():
+    conn = emailer._Connection()
+    while emailer._send_one(conn, "test"): pass
+    conn.close()
+
+def test_watermark_moves_only_after_the_mail_is_sent(mail):
+    wm = enquiries.get_cursor(digest.WATERMARK)
+    last = _lead()
+    assert digest._send_pending()
+    assert enquiries.get_cursor(digest.WATERMARK) == wm  # queued, not sent yet
+    assert not digest._send_pending()  # still in the mail outbox
+    _deliver()
+    _lead()
+    assert digest._send_pending()
+    assert enquiries.get_cursor(digest.WATERMARK) == last
+
+def test_dropped_digest_rows_go_into_the_next_one(mail, monkeypatch):
+    monkeypatch.setattr(emailer, "MAIL_MAX_ATTEMPTS", 1)
+    wm = enquiries.get_cursor(digest.WATERMARK)
+    _lead("R104")
+    assert digest._send_pending()
+    mail.drop_sessions = 1
+    _deliver()
+    assert emailer.outcome(int(enquiries.get_cursor(digest.PENDING_MAIL))) is False
+    _lead("R105")
+    sent = []
+    monkeypatch.setattr(digest, "send_email", lambda subject, text, html: sent.append(text) or 1)
+    assert digest._send_pending()
+    assert enquiries.get_cursor(digest.WATERMARK) == wm
+    assert "R104" in sent[0] and "R105" in sent[0]
@@ -0,0 +1,73 @@
+import os, sys, time, socket, subprocess
+import pytest
+from hopeland_bot import emailer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture
+def mail(monkeypatch, smtp):
+    # Queue without the background sender; tests deliver with _send_one().
+    monkeypatch.setattr(emailer, "start_mail_sender", lambda: None)
+    emailer._conn().execute("DELETE FROM mail")
+    smtp.drop_sessions = 0
+    yield smtp
+    smtp.drop_sessions = 0
+
+def _send_all(conn):
+    while emailer._send_one(conn, "test"): pass
+
+def _queued():
+    return emailer._conn().execute("SELECT attempts, not_before FROM mail ORDER BY id").fetchall()
+
+def _due_now():
+    emailer._conn().execute("UPDATE mail SET not_before=0")
+
+def test_one_connection_for_a_batch(mail):
+    before_msgs, before_conns = len(mail.messages), mail.connections
+    for i in range(3): assert emailer.send_email(f"lead {i}", "text")
+    conn = emailer._Connection()
+    _send_all(conn)
+    conn.close()
+    assert len(mail.messages) - before_msgs == 3 and mail.connections - before_conns == 1
+    assert emailer.pending() == 0
+
+def test_refused_connection_backs_off_and_retries(mail, monkeypatch):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); closed = s.getsockname()[1]
+    monkeypatch.setattr(emailer, "SMTP_PORT", closed)
+    emailer.send_email("lead", "text")
+    conn = emailer._Connection()
+    _send_all(conn)
+    [(attempts, not_before)] = _queued()
+    assert attempts == 1 and time.time() <= not_before <= time.time() + emailer.MAIL_BACKOFF_BASE
+    _due_now(); _send_all(conn)
+    [(attempts, not_before)] = _queued()
+    assert attempts == 2 and not_before <= time.time() + emailer.MAIL_BACKOFF_BASE * 2
+    monkeypatch.setattr(emailer, "SMTP_PORT", mail.port)
+    before = len(mail.messages)
+    _due_now(); _send_all(conn); conn.close()
+    assert _queued() == [] and len(mail.messages) == before + 1
+
+def test_dropped_session_reconnects(mail):
+    conn = emailer._Connection()
+    emailer.send_email("first", "text"); _send_all(conn)
+    before_msgs, before_conns = len(mail.messages), mail.connections
+    mail.drop_sessions = 1  # the server hangs up on the next message
+    emailer.send_email("second", "text"); _send_all(conn)
+    assert [a for a, _ in _queued()] == [1] and conn.smtp is None
+    _due_now(); _send_all(conn); conn.close()
+    assert _queued() == [] and len(mail.messages) == before_msgs + 1 and mail.connections == before_conns + 1
+
+def test_queued_mail_is_sent_after_a_restart(mail):
+    emailer.send_email("left behind", "queued before the restart")
+    emailer._conn().execute("UPDATE mail SET lease_owner='dead:1', lease_until=?", (time.time() - 1,))
+    before = len(mail.messages)
+    # A fresh interpreter with the same DATA_DIR stands in for the restarted worker.
+    code = ("import time\nfrom hopeland_bot import emailer\nemailer.resume_mail_sender()\n"
+            "deadline = time.time() + 10\n"
+            "while emailer.pending() and time.time() < deadline: time.sleep(0.05)\n"
+            "print(emailer.pending())")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=os.environ.copy(),
+                         capture_output=True, text=True, timeout=30)
+    assert out.stdout.strip().splitlines()[-1] == "0", out.stderr
+    assert len(mail.messages) == before + 1 and b"left behind" in mail.messages[-1]
@@ -0,0 +1,70 @@
+import time, socket, asyncio
+import pytest
+import requests
+from hopeland_bot.graph import GraphClient, AsyncGraphClient
+
+def _closed_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0)); return s.getsockname()[1]
+
+def _client(cls, root, retries=2):
+    return cls(base_url=f"{root}/PHONE_ID", token="test", max_retries=retries, backoff_base=0)
+
+def _apost(client, **kwargs):
+    async def _go():
+        try: return await client.post("/messages", **kwargs)
+        finally: await client.aclose()
+    return asyncio.run(_go())
+
+def test_read_timeout_is_not_retried(graph):
+    graph.latency = 0.5
+    client = _client(GraphClient, graph.root)
+    with pytest.raises(requests.ReadTimeout):
+        client.post("/messages", json={"type": "text"}, timeout=0.1)
+    time.sleep(0.6)
+    assert graph.calls["messages"] == 1
+    assert client.stats()["attempts"] == 1 and client.stats()["failures"] == 1
+
+def test_refused_connection_is_retried():
+    client = _client(GraphClient, f"http://127.0.0.1:{_closed_port()}/v19.0")
+    with pytest.raises(requests.ConnectionError):
+        client.post("/messages", json={"type": "text"}, timeout=1)
+    assert client.stats()["attempts"] == 3
+
+def test_async_read_timeout_is_not_retried(graph):
+    httpx = pytest.importorskip("httpx")
+    graph.latency = 0.5
+    client = _client(AsyncGraphClient, graph.root)
+    with pytest.raises(httpx.ReadTimeout):
+        _apost(client, json={"type": "text"}, timeout=0.1)
+    time.sleep(0.6)
+    assert graph.calls["messages"] == 1 and client.stats()["attempts"] == 1
+
+def test_async_refused_connection_is_retried():
+    httpx = pytest.importorskip("httpx")
+    client = _client(AsyncGraphClient, f"http://127.0.0.1:{_closed_port()}/v19.0")
+    with pytest.raises(httpx.ConnectError):
+        _apost(client, json={"type": "text"}, timeout=1)
+    assert client.stats()["attempts"] == 3
+
+class _Raising:
+    def __init__(self, error): self.error = error
+    def post(self, *args, **kwargs): raise self.error
+
+def test_unconfirmed_send_is_not_replayed(monkeypatch):
+    from hopeland_bot import whatsapp, outbox
+    monkeypatch.setattr(whatsapp, "graph_client", lambda: _Raising(requests.ReadTimeout("read timed out")))
+    whatsapp.enqueue("97450000004", "text", body="hello")
+    whatsapp._drain("97450000004", "test")
+    assert outbox.depth() == 0  # counted as sent, not queued for a retry
+
+def test_send_that_never_left_is_refused(monkeypatch):
+    from hopeland_bot import whatsapp
+    monkeypatch.setattr(whatsapp, "graph_client", lambda: _Raising(requests.ConnectTimeout("connect timed out")))
+    assert whatsapp._wa_post({"to": "97450000004", "type": "text"}) is False
+
+def test_maybe_delivered_for_httpx_errors():
+    httpx = pytest.importorskip("httpx")
+    from hopeland_bot.graph import maybe_delivered
+    assert maybe_delivered(httpx.ReadTimeout("read")) and maybe_delivered(httpx.RemoteProtocolError("reset"))
+    assert not maybe_delivered(httpx.ConnectError("refused")) and not maybe_delivered(ValueError())
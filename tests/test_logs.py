@@ -0,0 +1,25 @@
+import json, logging
+from hopeland_bot import logs, delivery
+
+def _format(record):
+    return json.loads(logs.JsonFormatter().format(record))
+
+def _record(**extra):
+    record = logging.LogRecord("test", logging.INFO, __file__, 1, "Inbound message", None, None)
+    for k, v in extra.items(): setattr(record, k, v)
+    return record
+
+def test_wa_id_field_is_masked():
+    assert _format(_record(wa_id="97455550123", kind="text"))["wa_id"] == "***0123"
+
+def test_wa_id_field_is_kept_with_full_payloads(monkeypatch):
+    monkeypatch.setattr(logs, "LOG_PAYLOADS", "full")
+    assert _format(_record(wa_id="97455550123"))["wa_id"] == "97455550123"
+
+def test_failed_delivery_warning_does_not_leak_the_number(caplog):
+    delivery.record_send("wamid.logs1", "97455550123", "text")
+    with caplog.at_level(logging.WARNING):
+        delivery.ingest([{"id": "wamid.logs1", "status": "failed", "timestamp": "1700000000",
+                          "errors": [{"code": 131026}]}])
+    [record] = [r for r in caplog.records if r.getMessage().startswith("Message wamid.logs1")]
+    assert "97455550123" not in json.dumps(_format(record))
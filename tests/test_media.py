@@ -0,0 +1,45 @@
+import os
+import pytest
+from hopeland_bot import media
+
+@pytest.fixture
+def optimize(monkeypatch):
+    pytest.importorskip("PIL")
+    monkeypatch.setattr(media, "MEDIA_OPTIMIZE", True)
+    from PIL import Image
+    return Image
+
+def _save(Image, name, size, **kwargs):
+    path = os.path.abspath(name)
+    im = Image.effect_noise(size, 64).convert("RGB")
+    im.save(path, "JPEG", **kwargs)
+    return path, media._content_hash(path)
+
+def test_large_photo_is_replaced_by_a_smaller_copy(optimize):
+    path, sha = _save(optimize, "large.jpg", (3000, 2000), quality=98)
+    out, mime = media._prepare(path, sha)
+    assert out != path and mime == "image/jpeg"
+    assert os.path.getsize(out) < os.path.getsize(path)
+
+def test_small_photo_is_uploaded_as_it_is(optimize):
+    path, sha = _save(optimize, "small.jpg", (200, 150), quality=20)
+    assert media._prepare(path, sha) == (path, None)
+    assert media._prepare(path, sha) == (path, None)  # decided once, not re-encoded
+    src, out = media._conn().execute("SELECT src_bytes, out_bytes FROM media_variants WHERE sha=?", (sha,)).fetchone()
+    assert src == out == os.path.getsize(path)
+
+def test_report_endpoint_reports_errors(monkeypatch):
+    from hopeland_bot import create_app
+    def broken(): raise RuntimeError("db locked")
+    monkeypatch.setattr(media, "optimization_report", broken)
+    r = create_app().test_client().get("/admin/media/report", headers={"X-Admin-Key": "test"})
+    assert r.status_code == 200 and r.get_json() == {"ok": False, "error": "db locked"}
+
+def test_saved_bytes_gauge_is_cached(monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_OPTIMIZE", True)
+    monkeypatch.setattr(media, "_SAVED", (float("-inf"), 0))
+    first = media._saved_bytes()
+    monkeypatch.setattr(media, "_conn", lambda: pytest.fail("table re-read within the minute"))
+    monkeypatch.setattr(media, "_pil", lambda: pytest.fail("Pillow imported for the gauge"))
+    media._add_saved(100)
+    assert media._saved_bytes() == first + 100
@@ -0,0 +1,56 @@
+import time
+from hopeland_bot import outbox, whatsapp
+
+WA_ID = "97450000001"
+
+def _queued(wa_id):
+    return outbox._conn().execute(
+        "SELECT kind, attempts, not_before FROM outbox WHERE wa_id=?", (wa_id,)).fetchall()
+
+def test_delivered_item_is_removed(graph, drain):
+    whatsapp.enqueue(WA_ID, "text", body="hello")
+    drain(WA_ID)
+    assert [m["text"]["body"] for m in graph.sent] == ["hello"]
+    assert _queued(WA_ID) == []
+
+def test_failed_send_is_retried(graph, drain, monkeypatch):
+    retried = []
+    real_retry = outbox.retry
+    monkeypatch.setattr(outbox, "retry", lambda item_id, delay, sent=0: retried.append(delay) or real_retry(item_id, delay, sent))
+    graph.status = 500
+    whatsapp.enqueue(WA_ID, "text", body="hello")
+    drain(WA_ID)
+    assert retried == [1]
+    [(kind, attempts, not_before)] = _queued(WA_ID)
+    assert (kind, attempts) == ("text", 1) and not_before > time.time()
+
+def test_fallback_keeps_item_delivered(graph, drain):
+    graph.fail_types = {"interactive"}
+    whatsapp.enqueue(WA_ID, "category_menu")
+    drain(WA_ID)
+    assert [m["type"] for m in graph.sent] == ["interactive", "text"]
+    assert _queued(WA_ID) == []
+
+def test_failed_fallback_is_retried(graph, drain):
+    graph.fail_types = {"interactive", "text"}
+    whatsapp.enqueue(WA_ID, "category_menu")
+    drain(WA_ID)
+    assert [(k, a) for k, a, _ in _queued(WA_ID)] == [("category_menu", 1)]
+
+def _bodies(graph):
+    return [m["text"]["body"] for m in graph.sent if m["type"] == "text"]
+
+def test_retry_resumes_after_the_payloads_already_sent(graph, drain):
+    # listing_details: contact text, photo intro, photos, "type menu"; the intro fails once
+    graph.fail_if = lambda m: "photos of" in (m.get("text") or {}).get("body", "")
+    whatsapp.enqueue(WA_ID, "listing_details", listing_id="R101")
+    drain(WA_ID)
+    assert [(k, a) for k, a, _ in _queued(WA_ID)] == [("listing_details", 1)]
+    graph.fail_if = None
+    outbox._conn().execute("UPDATE outbox SET not_before=0")
+    drain(WA_ID)
+    bodies = _bodies(graph)
+    assert _queued(WA_ID) == []
+    assert sum("Thanks for your interest" in b for b in bodies) == 1
+    assert sum("photos of" in b for b in bodies) == 2  # the refused attempt and the retry
+    assert bodies[-1].startswith("To keep browsing")
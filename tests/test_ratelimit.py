@@ -0,0 +1,44 @@
+import pytest
+from hopeland_bot.ratelimit import RateLimiter, _SharedStore
+
+@pytest.fixture(params=["local", "shared"])
+def make(request, tmp_path):
+    def _make(rate=10.0, cooldown=60.0):
+        lim = RateLimiter(rate=rate, burst=rate, min_rate=1.0, cooldown=cooldown)
+        if request.param == "shared":
+            lim.store = _SharedStore(str(tmp_path / "ratelimit.db"))
+            lim._rate = lim._persisted = lim.store.get_rate() or rate
+        return lim
+    return _make
+
+def test_concurrent_throttles_lower_the_rate_once(make):
+    lim = make()
+    for _ in range(5): lim.on_throttled()
+    assert lim.rate == 5.0 and lim.stats()["throttled"] == 5
+
+def test_throttles_after_the_cooldown_lower_it_again(make):
+    lim = make(cooldown=0.0)
+    for _ in range(3): lim.on_throttled()
+    assert lim.rate == 1.25
+
+def test_recovery_is_persisted_in_steps(make, monkeypatch):
+    lim = make()
+    lim.on_throttled()
+    writes = []
+    real_set = lim.store.set_rate
+    monkeypatch.setattr(lim.store, "set_rate", lambda rate: writes.append(rate) or real_set(rate))
+    for _ in range(60): lim.on_success()
+    assert lim.rate == 10.0
+    assert len(writes) <= 6 and writes[-1] == 10.0
+
+def test_workers_share_one_decrease_per_window(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    workers = []
+    for _ in range(2):
+        lim = RateLimiter(rate=10.0, burst=10.0, min_rate=1.0, cooldown=60.0)
+        lim.store = _SharedStore(path); lim._rate = lim._persisted = 10.0
+        workers.append(lim)
+    a, b = workers
+    a.on_throttled(); b.on_throttled()
+    b._rate_checked = 0.0  # next read goes to the store
+    assert a.rate == 5.0 and b.rate == 5.0
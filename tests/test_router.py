@@ -0,0 +1,39 @@
+import json
+import pytest
+from hopeland_bot import outbox
+from hopeland_bot.router import classify, route
+from hopeland_bot.state import Session
+
+WA_ID = "97450000002"
+
+def _text(body):
+    return {"type": "text", "text": {"body": body}}
+
+def _queued(wa_id):
+    rows = outbox._conn().execute("SELECT kind, args FROM outbox WHERE wa_id=? ORDER BY id", (wa_id,))
+    return [(kind, json.loads(args)) for kind, args in rows]
+
+@pytest.mark.parametrize("body", ["R101", "r101", " R101 "])
+def test_listing_id_opens_the_listing(body):
+    assert classify(_text(body)) == ("listing", "R101")
+
+@pytest.mark.parametrize("body", ["no", "ok", "Yes", "thanks", "ok thanks"])
+def test_short_replies_are_not_searches(body):
+    assert classify(_text(body))[0] == "text"
+
+def test_free_text_searches():
+    intent, ids = classify(_text("bathtub"))
+    assert intent == "search" and set(ids) == {"R105", "R106"}
+
+def test_search_sets_last_category_only_when_matches_share_it():
+    sess = Session(WA_ID, last_cat="studio")
+    route(WA_ID, sess, _text("dressing room"))  # 1bhk units only
+    assert sess["last_cat"] == "1bhk"
+    route(WA_ID, sess, _text("bathtub"))  # one 1bhk, one studio
+    assert sess["last_cat"] is None
+
+def test_listing_logs_its_own_category():
+    sess = Session(WA_ID, last_cat="studio")
+    route(WA_ID, sess, _text("R101"))
+    [args] = [a for kind, a in _queued(WA_ID) if kind == "log_enquiry"]
+    assert args["category"] == "1BHK" and args["unit_id"] == "R101"
@@ -0,0 +1,67 @@
+# The webhook -> outbox -> Graph path end to end, once per RUNTIME: the Flask app with
+# the thread senders, and the ASGI app with the asyncio senders.
+import os, copy, json, glob, time, asyncio
+import pytest
+from hopeland_bot import outbox, whatsapp, sheets
+
+PAYLOADS = [json.load(open(p)) for p in sorted(glob.glob(os.path.join(os.path.dirname(__file__), "..", "bench", "payloads", "*.json")))]
+
+def _from(payload, wa_id, seq):
+    doc = copy.deepcopy(payload)
+    value = doc["entry"][0]["changes"][0]["value"]
+    for c in value["contacts"]: c["wa_id"] = wa_id
+    for m in value["messages"]: m["from"] = wa_id; m["id"] = f"wamid.test.{wa_id}.{seq}"
+    return doc
+
+def _sync_conversation(wa_id):
+    from hopeland_bot import create_app
+    client = create_app().test_client()
+    replies = [client.post("/whatsapp/webhook", json=_from(p, wa_id, i)).get_json() for i, p in enumerate(PAYLOADS)]
+    replies.append(client.post("/whatsapp/webhook", json=_from(PAYLOADS[0], wa_id, 0)).get_json())  # redelivery
+    while True:  # what each sender thread does, without the background pool
+        claimed = outbox.claim("test", 60)
+        if not claimed: break
+        whatsapp._drain(claimed, "test")
+    health = client.get("/health").status_code
+    challenge = client.get("/whatsapp/webhook?hub.mode=subscribe&hub.verify_token=hopeland-verify&hub.challenge=42").get_data(as_text=True)
+    return replies, health, challenge
+
+def _async_conversation(wa_id):
+    httpx = pytest.importorskip("httpx")
+    from hopeland_bot import aio
+    from hopeland_bot.asgi import app
+
+    async def _go():
+        aio.start_async_senders(workers=2)
+        try:
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                replies = [(await client.post("/whatsapp/webhook", json=_from(p, wa_id, i))).json() for i, p in enumerate(PAYLOADS)]
+                replies.append((await client.post("/whatsapp/webhook", json=_from(PAYLOADS[0], wa_id, 0))).json())
+                deadline = time.time() + 10
+                while outbox.depth() and time.time() < deadline: await asyncio.sleep(0.05)
+                health = (await client.get("/health")).status_code
+                challenge = (await client.get("/whatsapp/webhook", params={
+                    "hub.mode": "subscribe", "hub.verify_token": "hopeland-verify", "hub.challenge": "42"})).text
+            return replies, health, challenge
+        finally:
+            await aio.stop_async_senders()
+    return asyncio.run(_go())
+
+@pytest.mark.parametrize("runtime", ["sync", "async"])
+def test_conversation(runtime, graph, gspread):
+    wa_id = f"9745000{1 if runtime == 'sync' else 2}000"
+    replies, health, challenge = (_sync_conversation if runtime == "sync" else _async_conversation)(wa_id)
+    assert [r["status"] for r in replies] == ["ok"] * len(replies)
+    assert (health, challenge) == (200, "42")
+    assert outbox.depth() == 0
+    sent = [m for m in graph.sent if m["to"] == wa_id]
+    kinds = [m["type"] for m in sent]
+    # hi -> category menu; 1BHK -> its listings; R101 -> echo, contact, photos intro,
+    # photos, "type menu", then the 1BHK list again
+    assert kinds[:2] == ["interactive", "interactive"]
+    assert sent[2]["text"]["body"].startswith("You selected:")
+    assert "Unit *R101*" in sent[3]["text"]["body"]
+    assert "image" in kinds and kinds[-1] == "interactive"
+    sheets.flush_enquiries()
+    rows = [r for r in gspread.spreadsheet.sheet1.rows if wa_id in r]
+    assert len(rows) == 1 and rows[0][4:6] == ["1BHK", "R101"]
@@ -0,0 +1,59 @@
+import json
+from hopeland_bot import sheets, enquiries
+from hopeland_bot.config import SHEET_ROTATE_LOCK_PATH
+from hopeland_bot.utils import leader_lock
+
+def _log(unit_id):
+    assert sheets.log_enquiry("97450000003", "Test", "1BHK", unit_id, "title", "desc")
+
+def _titles(gspread):
+    return [w.title for w in gspread.spreadsheet.worksheets()]
+
+def test_flush_waits_for_a_rotation_in_progress(gspread):
+    sheets.flush_enquiries()
+    sheets._save_state(live_period="2000-01")
+    _log("R104")
+    with leader_lock(SHEET_ROTATE_LOCK_PATH) as leader:
+        assert leader  # stands in for another worker rotating right now
+        assert sheets.flush_enquiries() == 0
+        assert enquiries.pending() == 1 and "Leads 2000-01" not in _titles(gspread)
+    assert sheets.flush_enquiries() == 1
+    assert "Leads 2000-01" in _titles(gspread)
+    assert any("R104" in r for r in gspread.spreadsheet.sheet1.rows)
+    assert not any("R104" in r for r in gspread.spreadsheet.worksheet("Leads 2000-01").rows)
+
+def test_state_is_parsed_only_when_the_file_changes(monkeypatch):
+    sheets._save_state(probe=1)
+    sheets._load_state()
+    loads = []
+    real_load = json.load
+    monkeypatch.setattr(sheets.json, "load", lambda f: loads.append(1) or real_load(f))
+    for _ in range(3): assert sheets._load_state()["probe"] == 1
+    assert loads == []
+    sheets._save_state(probe=2)
+    assert sheets._load_state()["probe"] == 2 and loads == [1]
+
+def test_partitions_endpoint_reports_errors(monkeypatch):
+    from hopeland_bot import create_app
+    def broken(*args, **kwargs): raise RuntimeError("db locked")
+    monkeypatch.setattr(enquiries, "partitions", broken)
+    r = create_app().test_client().get("/admin/sheets/partitions", headers={"X-Admin-Key": "test"})
+    assert r.status_code == 200 and r.get_json() == {"ok": False, "error": "db locked"}
+
+def test_failed_rotation_is_undone_and_retried(gspread, monkeypatch):
+    sheets.flush_enquiries()
+    sheets._save_state(live_period="2000-02")
+    _log("R105")
+    live = gspread.spreadsheet.sheet1
+    def broken(sh): raise RuntimeError("quota exceeded")
+    monkeypatch.setattr(sheets, "_index_ws", broken)  # fails after update_title
+    assert sheets.rotate_if_due() is None
+    assert live.calls["update_title"] >= 1
+    assert gspread.spreadsheet.sheet1 is live and live.title == "Sheet1"
+    assert "Leads 2000-02" not in _titles(gspread) and sheets.ROTATING_TITLE not in _titles(gspread)
+    assert sheets._load_state()["live_period"] == "2000-02"
+    monkeypatch.undo()
+    assert sheets.rotate_if_due() == "Leads 2000-02"
+    assert gspread.spreadsheet.worksheet("Leads 2000-02") is live
+    assert gspread.spreadsheet.sheet1.title == "Sheet1" and gspread.spreadsheet.sheet1.rows == [sheets.HEADERS]
+    assert any(r[0] == "Leads 2000-02" for r in gspread.spreadsheet.worksheet(sheets.INDEX_TITLE).rows)
@@ -0,0 +1,40 @@
+import time, sqlite3, threading
+import pytest
+from hopeland_bot.state import Session, MemorySessionBackend, SqliteSessionBackend
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    def _make(max_entries=3, ttl=60.0):
+        if request.param == "memory": return MemorySessionBackend(max_entries=max_entries, ttl=ttl)
+        return SqliteSessionBackend(str(tmp_path / "sessions.db"), ttl=ttl, max_entries=max_entries)
+    return _make
+
+def _save(b, wa_id, age=0.0, **fields):
+    b.save(Session(wa_id, last_seen=time.time() - age, **fields))
+
+def test_expired_sessions_are_not_loaded_and_are_swept(backend):
+    b = backend(ttl=60.0)
+    _save(b, "old", age=120); _save(b, "new")
+    assert b.load("old") is None and b.load("new") is not None
+    b.sweep()
+    assert len(b) == 1
+
+def test_least_recently_seen_sessions_are_evicted_beyond_the_bound(backend):
+    b = backend(max_entries=3)
+    for i in range(5): _save(b, f"wa{i}", age=10 - i)  # wa4 is the most recent
+    b.sweep()
+    assert len(b) == 3
+    assert [b.load(f"wa{i}") is not None for i in range(5)] == [False, False, True, True, True]
+
+def test_sqlite_sessions_round_trip_between_workers(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    _save(SqliteSessionBackend(path), "97450000005", human=True, state="LIST_1BHK", last_cat="1bhk")
+    # a second, independent connection stands in for another worker
+    row = sqlite3.connect(path).execute("SELECT human, state, last_cat FROM sessions WHERE wa_id=?", ("97450000005",)).fetchone()
+    assert row == (1, "LIST_1BHK", "1bhk")
+    # db.connect() keeps one connection per thread, so a thread gets its own as well
+    loaded = []
+    t = threading.Thread(target=lambda: loaded.append(SqliteSessionBackend(path).load("97450000005")))
+    t.start(); t.join()
+    sess = loaded[0]
+    assert (sess.human, sess.state, sess.last_cat) == (True, "LIST_1BHK", "1bhk")